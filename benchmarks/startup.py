@@ -0,0 +1,87 @@
+"""
+Tempi di avvio di link_monitor.py.
+
+Avvia più volte il programma con --benchmark-startup (clipboard finta che
+contiene già un link) e riporta, in secondi dall'avvio del modulo:
+    monitor_armed    monitor della clipboard attivo
+    first_detection  primo link riconosciuto
+    window           finestra principale mostrata
+oltre al tempo totale del processo (interprete compreso).
+Serve un display (anche Xvfb) per la finestra.
+
+Esempio:
+    python benchmarks/startup.py --runs 5 --label v1.1 --output startup.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_TEXT = "https://www.youtube.com/watch?v=dQw4w9WgXcQ"
+
+
+def run_once(config, text, timeout):
+    cmd = [sys.executable, os.path.join(ROOT, "link_monitor.py"), "--config", config, "--benchmark-startup", text]
+    start = time.perf_counter()
+    proc = subprocess.run(cmd, cwd=ROOT, capture_output=True, text=True, timeout=timeout)
+    wall = time.perf_counter() - start
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else f"exit {proc.returncode}")
+    marks = json.loads(proc.stdout.strip().splitlines()[-1])
+    marks['process'] = round(wall, 4)
+    return marks
+
+
+def summarize(runs):
+    summary = {}
+    for name in sorted({name for run in runs for name in run}):
+        values = [run[name] for run in runs if name in run]
+        summary[name] = {
+            'median': round(statistics.median(values), 4),
+            'min': round(min(values), 4),
+            'max': round(max(values), 4),
+        }
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--config', default=os.path.join(ROOT, "config.ini"))
+    parser.add_argument('--text', default=DEFAULT_TEXT, help="contenuto iniziale della clipboard finta")
+    parser.add_argument('--label', default="", help="etichetta della release misurata")
+    parser.add_argument('--timeout', type=float, default=60)
+    parser.add_argument('--output', help="salva il risultato JSON in questo file")
+    args = parser.parse_args(argv)
+
+    runs = []
+    errors = []
+    for _ in range(args.runs):
+        try:
+            runs.append(run_once(args.config, args.text, args.timeout))
+        except (RuntimeError, ValueError, subprocess.TimeoutExpired) as e:
+            errors.append(str(e))
+
+    result = {
+        'benchmark': 'startup',
+        'label': args.label,
+        'python': sys.version.split()[0],
+        'platform': sys.platform,
+        'runs': runs,
+        'summary': summarize(runs),
+        'errors': errors,
+    }
+    text = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + "\n")
+    print(text)
+    return 0 if runs else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,510 @@
+"""
+Benchmark dei percorsi critici di riconoscimento ed esecuzione.
+
+    python benchmarks/suite.py                      # tutti i benchmark
+    python benchmarks/suite.py --quick              # dimensioni ridotte
+    python benchmarks/suite.py matching monitor     # solo alcuni
+    python benchmarks/suite.py --output HEAD.json --compare base.json
+
+Il risultato è un JSON con il commit, la versione di Python e, per ogni
+benchmark, le metriche misurate. Convenzione dei nomi delle metriche:
+    *_s, *_ms, *_us   tempi (più basso è meglio)
+    *_per_s           throughput (più alto è meglio)
+Con --compare le metriche peggiorate oltre --threshold vengono segnalate
+e il codice di uscita è 1.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from clipboard_backends import FakeClipboard
+from clipboard_monitor import AdaptivePollScheduler, ClipboardMonitor
+from config import LinkAction, load_config, substitute_label
+from engine import JobEngine
+from jobs import run_command_async
+from joblog import JobLog
+import regex_cost
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    def register(func):
+        BENCHMARKS[name] = func
+        return func
+    return register
+
+
+_ENGINE = JobEngine()
+
+
+def run_command(action, url, **kwargs):
+    """Esegue run_command_async nel motore dei job e ne attende il risultato."""
+    return _ENGINE.submit(run_command_async(action, url, **kwargs)).result()
+
+
+def timeit(func, repeat=5):
+    """Mediana (secondi) di `repeat` esecuzioni di func()."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+# --- dati sintetici ----------------------------------------------------------
+
+HOSTS = ["www.youtube.com", "youtu.be", "vimeo.com", "soundcloud.com", "github.com", "example.org",
+         "news.ycombinator.com", "en.wikipedia.org", "twitter.com", "reddit.com"]
+
+
+def url_corpus(count, seed=1):
+    """Url verosimili (con query, frammenti e parametri di playlist) e un po' di testo non url."""
+    rng = random.Random(seed)
+    corpus = []
+    for i in range(count):
+        host = rng.choice(HOSTS)
+        if host == "www.youtube.com":
+            url = f"https://{host}/watch?v={rng.getrandbits(40):011x}"
+            if rng.random() < 0.5:
+                url += f"&list=PL{rng.getrandbits(64):016x}&index={rng.randint(1, 50)}"
+        elif host == "youtu.be":
+            url = f"https://{host}/{rng.getrandbits(40):011x}?t={rng.randint(1, 600)}"
+        else:
+            path = "/".join(f"p{rng.randint(0, 999)}" for _ in range(rng.randint(1, 4)))
+            url = f"https://{host}/{path}?q={rng.randint(0, 10**6)}#s{i}"
+        if rng.random() < 0.1:
+            url = f"testo copiato numero {i} senza link"
+        corpus.append(url)
+    return corpus
+
+
+def generate_ini(path, actions, labels=20):
+    """INI con `actions` azioni su `labels` regex/programmi e qualche filtro."""
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write("[DICT_REGEX]\n")
+        for i in range(labels):
+            f.write(f"site{i} = https?://(www\\.)?site{i}\\.example/watch\\?v=[\\w-]+.*\n")
+        f.write("youtube_download = https?://.*youtube\\.com/watch.*\n\n[DICT_PROGRAMS]\n")
+        for i in range(labels):
+            f.write(f"program_{i} = /usr/bin/tool{i}\n")
+        f.write("\n[FILTERS]\nyt_pattern = (&list.*)\nyt_replace =\n\n[LINKS]\n")
+        for i in range(1, actions + 1):
+            f.write(f"regex{i} = site{i % labels}\n")
+            f.write(f"program{i} = program_{i % labels} -f {i} --paths \"/tmp/out dir\" {{url}}\n")
+            f.write(f"label{i} = Azione {i}\n")
+            if i % 3 == 0:
+                f.write(f"filter{i} = yt\n")
+            f.write("\n")
+
+
+# --- benchmark ------------------------------------------------------------------
+
+@benchmark('load_config')
+def bench_load_config(quick):
+    results = {}
+    tmp = tempfile.mkdtemp()
+    try:
+        for actions in ((100, 1000) if quick else (100, 1000, 5000)):
+            path = os.path.join(tmp, f"config_{actions}.ini")
+            generate_ini(path, actions)
+            results[f"actions_{actions}_s"] = timeit(lambda: load_config(path), repeat=3)
+            # Ricarica senza modifiche (percorso del ricaricamento a caldo)
+            previous = load_config(path)
+            results[f"actions_{actions}_reload_s"] = timeit(lambda: load_config(path, previous=previous), repeat=3)
+            # Le misure delle regex proseguono in background: non devono pesare sui benchmark successivi
+            regex_cost.wait_for_profiles()
+    finally:
+        shutil.rmtree(tmp)
+    return results
+
+
+@benchmark('substitute_label')
+def bench_substitute_label(quick):
+    results = {}
+    for count in ((10, 1000) if quick else (10, 100, 1000, 10000)):
+        # Nomi a larghezza fissa: nessuna label è prefisso di un'altra
+        labels = {f"program_{i:05d}": f"/usr/bin/tool{i}" for i in range(count)}
+        # Caso peggiore: la label cercata è l'ultima
+        value = f"program_{count - 1:05d} -x {{url}}"
+        calls = 2000
+        seconds = timeit(lambda: [substitute_label(value, labels) for _ in range(calls)], repeat=3)
+        results[f"labels_{count}_us"] = seconds / calls * 1e6
+    return results
+
+
+@benchmark('matching')
+def bench_matching(quick):
+    corpus = url_corpus(5000 if quick else 50000)
+    action = LinkAction(r"https?://.*youtube\.com/watch.*", "tool {url}", "yt", 'yt',
+                        {'yt': (re.compile(r"(&list.*)"), "")})
+    config_actions = load_config(os.path.join(ROOT, "config.ini"))
+    regex_cost.wait_for_profiles()
+
+    def pattern_only():
+        for url in corpus:
+            action.pattern.match(url)
+
+    def pattern_and_filter():
+        for url in corpus:
+            if action.pattern.match(url):
+                action.filter_url(url)
+
+    def action_set():
+        for url in corpus:
+            config_actions.matcher._match_uncached(url)
+
+    def action_set_extract():
+        config_actions.extract_links("\n".join(corpus))
+
+    n = len(corpus)
+    return {
+        'pattern_match_per_s': n / timeit(pattern_only),
+        'pattern_filter_per_s': n / timeit(pattern_and_filter),
+        'action_set_match_per_s': n / timeit(action_set),
+        'extract_links_per_s': n / timeit(action_set_extract, repeat=3),
+    }
+
+
+@benchmark('regex')
+def bench_regex(quick):
+    corpus = url_corpus(5000 if quick else 50000)
+    pattern = re.compile(r"https?://.*youtube\.com/watch.*")
+    guard = regex_cost.PatternGuard(pattern, regex_cost.RULE)
+
+    def raw():
+        for url in corpus:
+            pattern.match(url)
+
+    def guarded():
+        for url in corpus:
+            end = guard.window(url)
+            start = time.perf_counter()
+            pattern.match(url, 0, end)
+            guard.record(time.perf_counter() - start)
+
+    def profile(expression, kind=regex_cost.RULE):
+        start = time.perf_counter()
+        regex_cost.profile_pattern(re.compile(expression), kind)
+        return (time.perf_counter() - start) * 1000
+
+    n = len(corpus)
+    return {
+        'raw_match_per_s': n / timeit(raw),
+        'guarded_match_per_s': n / timeit(guarded),
+        'profile_linear_ms': profile(r"https?://.*youtube\.com/watch.*"),
+        'profile_filter_ms': profile(r"(&list.*)", regex_cost.FILTER),
+        'profile_nested_ms': profile(r"(a+)+$"),
+    }
+
+
+class _PolledFakeClipboard(FakeClipboard):
+    """Clipboard finta letta a polling (come pyperclip)."""
+    event_driven = False
+
+
+@benchmark('monitor')
+def bench_monitor(quick):
+    results = {}
+    changes = 200 if quick else 1000
+    for name, backend in (('event', FakeClipboard()), ('poll', _PolledFakeClipboard())):
+        seen = threading.Event()
+        monitor = ClipboardMonitor(lambda text: seen.set(), backend=backend,
+                                   scheduler=AdaptivePollScheduler(min_interval=0.001, max_interval=0.05))
+        monitor.daemon = True
+        monitor.start()
+        time.sleep(0.05)
+        latencies = []
+        for i in range(changes):
+            seen.clear()
+            start = time.perf_counter()
+            backend.set_text(f"https://www.youtube.com/watch?v={i:011d}")
+            if seen.wait(1):
+                latencies.append(time.perf_counter() - start)
+        # CPU usata dal monitor con la clipboard ferma
+        time.sleep(0.2)
+        cpu_start = time.process_time()
+        time.sleep(1.0)
+        idle_cpu = time.process_time() - cpu_start
+        monitor.stop()
+        monitor.join(2)
+        latencies.sort()
+        results[f"{name}_latency_median_ms"] = statistics.median(latencies) * 1000
+        results[f"{name}_latency_p95_ms"] = latencies[int(len(latencies) * 0.95) - 1] * 1000
+        results[f"{name}_idle_cpu_s"] = idle_cpu
+        results[f"{name}_missed"] = changes - len(latencies)
+    return results
+
+
+@benchmark('output')
+def bench_output(quick):
+    lines = 50000 if quick else 500000
+    code = ("import sys; w = sys.stdout.write; "
+            f"[w('[download]  %5.1f%% of ~ 10.00MiB at 2.00MiB/s ETA 00:05 riga %d\\n' % (i % 100, i)) "
+            f"for i in range({lines})]")
+    program = f'"{sys.executable}" -c "{code}"'
+    action = LinkAction(r".*", program, "output")
+    received = [0]
+
+    def on_output(line):
+        received[0] += 1
+
+    tmp = tempfile.mkdtemp()
+    try:
+        log = JobLog.create(tmp, 1)
+        start = time.perf_counter()
+        exit_code, _, _, _, _ = run_command(action, "https://example.org/", on_output=on_output, log=log)
+        seconds = time.perf_counter() - start
+        log.close()
+        log_bytes = os.path.getsize(log.path)
+    finally:
+        shutil.rmtree(tmp)
+    if exit_code != 0 or received[0] != lines:
+        raise RuntimeError(f"output incompleto: {received[0]}/{lines} righe, exit {exit_code}")
+    return {
+        'lines': lines,
+        'ingest_s': seconds,
+        'lines_per_s': lines / seconds,
+        'log_mb_per_s': log_bytes / seconds / 1e6,
+    }
+
+
+@benchmark('progress')
+def bench_progress(quick):
+    # Output in stile yt-dlp: aggiornamenti riscritti con '\r' e pochi messaggi veri
+    updates = 20000 if quick else 200000
+    code = ("import sys; w = sys.stdout.write; w('[youtube] abc: Downloading webpage\\n'); "
+            f"[w('\\r[download] %5.1f%% of ~ 10.00MiB at 2.00MiB/s ETA 00:05' % (i * 100.0 / {updates})) "
+            f"for i in range({updates})]; w('\\n[Merger] Merging formats\\n')")
+    results = {'updates': updates}
+    for parser in ('raw', 'yt-dlp'):
+        action = LinkAction(r".*", f'"{sys.executable}" -c "{code}"', "progress", output_parser=parser)
+        lines = [0]
+        progress = [0]
+
+        def on_output(line):
+            lines[0] += 1
+
+        def on_progress(item):
+            progress[0] += 1
+
+        start = time.perf_counter()
+        exit_code, _, _, output, _ = run_command(action, "https://example.org/", on_output=on_output,
+                                                 on_progress=on_progress)
+        seconds = time.perf_counter() - start
+        if exit_code != 0:
+            raise RuntimeError(f"exit {exit_code} con il parser {parser}")
+        name = parser.replace('-', '')
+        results[f"{name}_ingest_s"] = seconds
+        results[f"{name}_output_lines"] = lines[0]
+        results[f"{name}_stored_bytes"] = len(output)
+        results[f"{name}_progress_events"] = progress[0]
+    return results
+
+
+@benchmark('engine')
+def bench_engine(quick):
+    # Molti job contemporanei: motore asyncio (un thread) contro un thread per job
+    from jobs import Job, JobScheduler
+
+    count = 20 if quick else 100
+    code = "import sys, time; [print('riga', i, flush=True) or time.sleep(0.05) for i in range(10)]"
+    action = LinkAction(r".*", f'"{sys.executable}" -c "{code}"', "engine")
+    results = {'jobs': count}
+
+    def watch(done):
+        peak = threading.active_count()
+        while not done.wait(0.01):
+            peak = max(peak, threading.active_count())
+        return peak
+
+    base_threads = threading.active_count()
+    scheduler = JobScheduler(max_workers=count)
+    scheduler.engine.start()
+    done = threading.Event()
+    finished = []
+
+    def on_exit(job):
+        finished.append(job)
+        if len(finished) == count:
+            done.set()
+
+    start = time.perf_counter()
+    scheduler.submit_many([Job(action, f"https://example.org/{i}", on_exit=on_exit) for i in range(count)])
+    results['engine_peak_threads'] = watch(done) - base_threads
+    results['engine_wall_s'] = time.perf_counter() - start
+    scheduler.engine.stop()
+    if any(job.exit_code != 0 for job in finished):
+        raise RuntimeError("job del motore non riusciti")
+
+    done = threading.Event()
+    finished.clear()
+
+    def run(i):
+        # Un event loop per thread: il modello un thread per job
+        asyncio.run(run_command_async(action, f"https://example.org/{i}", on_output=lambda line: None))
+        finished.append(i)
+        if len(finished) == count:
+            done.set()
+
+    base_threads = threading.active_count()
+    start = time.perf_counter()
+    for i in range(count):
+        threading.Thread(target=run, args=(i,), daemon=True).start()
+    results['threads_peak_threads'] = watch(done) - base_threads
+    results['threads_wall_s'] = time.perf_counter() - start
+    return results
+
+
+@benchmark('history')
+def bench_history(quick):
+    from history_store import HistoryStore
+
+    results = {}
+    for count in ((10000,) if quick else (10000, 100000)):
+        tmp = tempfile.mkdtemp()
+        try:
+            store = HistoryStore(os.path.join(tmp, "history.db"), batch_size=1000)
+            corpus = url_corpus(count, seed=count)
+            now = time.time()
+            start = time.perf_counter()
+            for i, link in enumerate(corpus):
+                store.add({'link': link, 'start_time': now - count + i, 'duration': 1.0 + i % 7,
+                           'exit_code': 0 if i % 5 else 1, 'outcome': "OK" if i % 5 else "Errore 1",
+                           'action_label': f"Azione {i % 4}", 'output': f"riga di output {i}\n"})
+            store.flush()
+            results[f"records_{count}_insert_per_s"] = count / (time.perf_counter() - start)
+            results[f"records_{count}_first_page_ms"] = timeit(
+                lambda: (store.count(), store.query(0, 100)), repeat=5) * 1000
+            results[f"records_{count}_sorted_page_ms"] = timeit(
+                lambda: store.query(count // 2, 100, order_by='link', descending=False), repeat=5) * 1000
+            results[f"records_{count}_search_ms"] = timeit(
+                lambda: store.query(0, 100, filters={'text': "output 4242"}), repeat=5) * 1000
+            viewer_ms = _history_viewer_ms(store)
+            if viewer_ms is not None:
+                results[f"records_{count}_viewer_ms"] = viewer_ms
+            store.close()
+        finally:
+            shutil.rmtree(tmp)
+    return results
+
+
+def _history_viewer_ms(store):
+    """Tempo per mostrare la prima pagina nel HistoryViewer (serve un display)."""
+    try:
+        import tkinter as tk
+        root = tk.Tk()
+    except Exception:
+        return None
+    try:
+        root.withdraw()
+        from gui import HistoryViewer
+        start = time.perf_counter()
+        viewer = HistoryViewer(root, store)
+        while not viewer.tree.get_children() and time.perf_counter() - start < 10:
+            root.update()
+        return (time.perf_counter() - start) * 1000
+    finally:
+        root.destroy()
+
+
+# --- esecuzione e confronto ----------------------------------------------------
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current, baseline, threshold):
+    """Ritorna le righe del confronto e il numero di regressioni."""
+    rows = []
+    regressions = 0
+    for name, metrics in current['results'].items():
+        old_metrics = baseline.get('results', {}).get(name, {})
+        for metric, value in metrics.items():
+            old = old_metrics.get(metric)
+            if not isinstance(value, (int, float)) or not isinstance(old, (int, float)) or old == 0:
+                continue
+            if metric.endswith('_per_s'):
+                change = old / value - 1 if value else float('inf')
+            elif metric.endswith(('_s', '_ms', '_us')):
+                change = value / old - 1
+            else:
+                continue
+            flag = ""
+            if change > threshold:
+                flag = "  REGRESSIONE"
+                regressions += 1
+            rows.append(f"{name}.{metric}: {old:.4g} -> {value:.4g} (peggioramento {change:+.1%}){flag}")
+    return rows, regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('names', nargs='*', help=f"benchmark da eseguire ({', '.join(BENCHMARKS)})")
+    parser.add_argument('--quick', action='store_true', help="dimensioni ridotte")
+    parser.add_argument('--output', help="salva il risultato JSON in questo file")
+    parser.add_argument('--compare', metavar='BASELINE', help="confronta con un risultato precedente")
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help="peggioramento oltre il quale segnalare una regressione (default 0.10)")
+    args = parser.parse_args(argv)
+
+    names = args.names or list(BENCHMARKS)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"benchmark sconosciuti: {', '.join(unknown)}")
+
+    result = {
+        'commit': git_commit(),
+        'python': sys.version.split()[0],
+        'platform': sys.platform,
+        'quick': args.quick,
+        'results': {},
+        'errors': {},
+    }
+    for name in names:
+        print(f"{name}...", file=sys.stderr, flush=True)
+        try:
+            metrics = BENCHMARKS[name](args.quick)
+            result['results'][name] = {k: round(v, 6) if isinstance(v, float) else v for k, v in metrics.items()}
+        except Exception as e:
+            result['errors'][name] = f"{type(e).__name__}: {e}"
+
+    text = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + "\n")
+    print(text)
+
+    status = 1 if result['errors'] else 0
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        rows, regressions = compare(result, baseline, args.threshold)
+        print(f"\nConfronto con {args.compare} ({baseline.get('commit')}):", file=sys.stderr)
+        for row in rows:
+            print("  " + row, file=sys.stderr)
+        if regressions:
+            status = 1
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,242 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import shutil
+import subprocess
+import threading
+
+
+class ClipboardBackendError(RuntimeError):
+    pass
+
+
+class ClipboardBackend:
+    """
+    Sorgente della clipboard usata da ClipboardMonitor.
+
+    I backend "event driven" notificano i cambi tramite wait_for_change(),
+    gli altri vengono interrogati periodicamente con read().
+    """
+    name = 'base'
+    event_driven = False
+
+    def read(self):
+        raise NotImplementedError
+
+    def wait_for_change(self, timeout):
+        """
+        Attende al massimo `timeout` secondi una notifica di cambio.
+        Ritorna True se la clipboard (probabilmente) è cambiata.
+        """
+        return False
+
+    def close(self):
+        pass
+
+
+class PyperclipBackend(ClipboardBackend):
+    """Polling classico tramite pyperclip (fallback universale)."""
+    name = 'poll'
+
+    def __init__(self):
+        import pyperclip
+        self._paste = pyperclip.paste
+
+    def read(self):
+        return self._paste()
+
+
+class X11Backend(ClipboardBackend):
+    """
+    Backend X11 basato sulle notifiche XFixes di cambio proprietario della
+    selezione CLIPBOARD: nessuna lettura finché nessuno copia qualcosa.
+    Il contenuto viene letto solo dopo la notifica tramite `reader`
+    (di default pyperclip).
+    """
+    name = 'x11'
+    event_driven = True
+
+    _SET_SELECTION_OWNER_NOTIFY_MASK = 1 << 0
+    _SELECTION_NOTIFY = 0  # XFixesSelectionNotify, relativo a event_base
+
+    def __init__(self, display=None, reader=None):
+        x11_path = ctypes.util.find_library('X11')
+        xfixes_path = ctypes.util.find_library('Xfixes')
+        if not x11_path or not xfixes_path:
+            raise ClipboardBackendError("libX11/libXfixes non disponibili")
+        self._x11 = ctypes.CDLL(x11_path)
+        self._xfixes = ctypes.CDLL(xfixes_path)
+        self._setup_prototypes()
+
+        self._dpy = self._x11.XOpenDisplay(display.encode() if display else None)
+        if not self._dpy:
+            raise ClipboardBackendError("Impossibile aprire il display X11")
+
+        event_base = ctypes.c_int()
+        error_base = ctypes.c_int()
+        if not self._xfixes.XFixesQueryExtension(self._dpy, ctypes.byref(event_base), ctypes.byref(error_base)):
+            self._x11.XCloseDisplay(self._dpy)
+            self._dpy = None
+            raise ClipboardBackendError("Estensione XFixes non disponibile")
+        self._notify_type = event_base.value + self._SELECTION_NOTIFY
+
+        root = self._x11.XDefaultRootWindow(self._dpy)
+        clipboard = self._x11.XInternAtom(self._dpy, b"CLIPBOARD", False)
+        self._xfixes.XFixesSelectSelectionInput(self._dpy, root, clipboard,
+                                                self._SET_SELECTION_OWNER_NOTIFY_MASK)
+        self._x11.XFlush(self._dpy)
+        self._fd = self._x11.XConnectionNumber(self._dpy)
+        # XEvent è una union di 24 long
+        self._event = (ctypes.c_long * 24)()
+
+        if reader is None:
+            import pyperclip
+            reader = pyperclip.paste
+        self._reader = reader
+
+    def _setup_prototypes(self):
+        x11, xfixes = self._x11, self._xfixes
+        x11.XOpenDisplay.argtypes = [ctypes.c_char_p]
+        x11.XOpenDisplay.restype = ctypes.c_void_p
+        x11.XCloseDisplay.argtypes = [ctypes.c_void_p]
+        x11.XDefaultRootWindow.argtypes = [ctypes.c_void_p]
+        x11.XDefaultRootWindow.restype = ctypes.c_ulong
+        x11.XInternAtom.argtypes = [ctypes.c_void_p, ctypes.c_char_p, ctypes.c_int]
+        x11.XInternAtom.restype = ctypes.c_ulong
+        x11.XFlush.argtypes = [ctypes.c_void_p]
+        x11.XConnectionNumber.argtypes = [ctypes.c_void_p]
+        x11.XPending.argtypes = [ctypes.c_void_p]
+        x11.XNextEvent.argtypes = [ctypes.c_void_p, ctypes.c_void_p]
+        xfixes.XFixesQueryExtension.argtypes = [ctypes.c_void_p, ctypes.POINTER(ctypes.c_int),
+                                                ctypes.POINTER(ctypes.c_int)]
+        xfixes.XFixesSelectSelectionInput.argtypes = [ctypes.c_void_p, ctypes.c_ulong,
+                                                      ctypes.c_ulong, ctypes.c_ulong]
+
+    def _drain_events(self):
+        changed = False
+        while self._x11.XPending(self._dpy):
+            self._x11.XNextEvent(self._dpy, self._event)
+            event_type = ctypes.cast(self._event, ctypes.POINTER(ctypes.c_int))[0]
+            if event_type == self._notify_type:
+                changed = True
+        return changed
+
+    def read(self):
+        return self._reader()
+
+    def wait_for_change(self, timeout):
+        if self._drain_events():
+            return True
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if ready:
+            return self._drain_events()
+        return False
+
+    def close(self):
+        if self._dpy:
+            self._x11.XCloseDisplay(self._dpy)
+            self._dpy = None
+
+
+class WaylandBackend(ClipboardBackend):
+    """
+    Backend Wayland: `wl-paste --watch` esegue un comando ad ogni cambio
+    della clipboard, noi ci limitiamo a contare le righe che stampa e
+    leggiamo il contenuto con `wl-paste --no-newline` solo quando serve.
+    """
+    name = 'wayland'
+    event_driven = True
+
+    def __init__(self):
+        if not shutil.which('wl-paste'):
+            raise ClipboardBackendError("wl-paste non trovato (pacchetto wl-clipboard)")
+        self._changed = threading.Event()
+        self._watcher = subprocess.Popen(['wl-paste', '--watch', 'echo'],
+                                         stdout=subprocess.PIPE,
+                                         stderr=subprocess.DEVNULL)
+        self._reader_thread = threading.Thread(target=self._read_notifications, daemon=True)
+        self._reader_thread.start()
+
+    def _read_notifications(self):
+        for _ in self._watcher.stdout:
+            self._changed.set()
+        # Il watcher è terminato: sblocca l'attesa
+        self._changed.set()
+
+    def read(self):
+        result = subprocess.run(['wl-paste', '--no-newline'],
+                                stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL)
+        return result.stdout.decode('utf-8', errors='replace')
+
+    def wait_for_change(self, timeout):
+        if self._changed.wait(timeout):
+            self._changed.clear()
+            return True
+        return False
+
+    def close(self):
+        if self._watcher.poll() is None:
+            self._watcher.terminate()
+
+
+class FakeClipboard(ClipboardBackend):
+    """Clipboard in memoria, utile per i test e per la modalità senza GUI."""
+    name = 'fake'
+    event_driven = True
+
+    def __init__(self, text=''):
+        self._text = text
+        self._lock = threading.Lock()
+        self._changed = threading.Event()
+
+    def set_text(self, text):
+        with self._lock:
+            self._text = text
+        self._changed.set()
+
+    # stessa interfaccia di pyperclip
+    copy = set_text
+
+    def read(self):
+        with self._lock:
+            return self._text
+
+    def wait_for_change(self, timeout):
+        if self._changed.wait(timeout):
+            self._changed.clear()
+            return True
+        return False
+
+
+BACKENDS = {
+    'x11': X11Backend,
+    'wayland': WaylandBackend,
+    'poll': PyperclipBackend,
+    'fake': FakeClipboard,
+}
+
+
+def select_backend(name='auto'):
+    """
+    Crea il backend richiesto. Con 'auto' prova, nell'ordine, Wayland e X11
+    (event driven) e ripiega sul polling di pyperclip.
+    """
+    name = (name or 'auto').lower()
+    if name != 'auto':
+        if name not in BACKENDS:
+            raise ClipboardBackendError(f"Backend clipboard sconosciuto: {name}")
+        return BACKENDS[name]()
+
+    candidates = []
+    if os.environ.get('WAYLAND_DISPLAY'):
+        candidates.append(WaylandBackend)
+    if os.environ.get('DISPLAY'):
+        candidates.append(X11Backend)
+    for backend_cls in candidates:
+        try:
+            return backend_cls()
+        except (ClipboardBackendError, OSError, ImportError):
+            continue
+    return PyperclipBackend()
@@ -1,25 +1,162 @@
+import hashlib
 import threading
 import time
-import pyperclip
+import metrics
+from tracing import TRACER
+from clipboard_backends import ClipboardBackendError, select_backend
+
+
+class ContentPolicy:
+    """
+    Decide cosa del contenuto della clipboard arriva al matcher.
+
+    - Il cambio viene rilevato su (lunghezza, digest): il testo precedente
+      non viene conservato. Oltre `max_size` caratteri il digest è
+      calcolato solo su un campione di testa e coda.
+    - I contenuti oltre `max_size` vengono scartati (oversize='skip') o
+      troncati (oversize='truncate'), quelli che sembrano binari scartati.
+    - Al matcher arrivano al massimo `max_scan` caratteri.
+    """
+    def __init__(self, max_size=1000000, max_scan=65536, oversize='skip', sample_size=65536):
+        if oversize not in ('skip', 'truncate'):
+            raise ValueError(f"Politica oversize non valida: {oversize}")
+        self.max_size = max_size
+        self.max_scan = max_scan
+        self.oversize = oversize
+        self.sample_size = sample_size
+
+    def fingerprint(self, text):
+        length = len(text)
+        if length > self.max_size:
+            sample = text[:self.sample_size] + text[-self.sample_size:]
+        else:
+            sample = text
+        digest = hashlib.blake2b(sample.encode('utf-8', 'surrogatepass'), digest_size=16).digest()
+        return length, digest
+
+    @staticmethod
+    def looks_binary(text, sample_len=1024):
+        sample = text[:sample_len]
+        if '\x00' in sample:
+            return True
+        control = sum(1 for c in sample if c < ' ' and c not in '\t\r\n')
+        return control > len(sample) * 0.3
+
+    def prepare(self, text):
+        """Ritorna la finestra di testo da analizzare, o None per ignorare il contenuto."""
+        if len(text) > self.max_size and self.oversize == 'skip':
+            return None
+        if self.looks_binary(text):
+            return None
+        window = text[:self.max_scan]
+        if not window or window.isspace():
+            return None
+        return window
+
+
+class AdaptivePollScheduler:
+    """
+    Calcola l'intervallo di polling: dopo un cambio resta al minimo per
+    `burst_polls` letture (l'utente sta copiando), poi, finché la clipboard
+    non cambia, aumenta l'intervallo di un fattore `backoff` fino al massimo.
+    """
+    def __init__(self, min_interval=0.1, max_interval=2.0, backoff=1.5, burst_polls=10):
+        if min_interval <= 0 or max_interval < min_interval:
+            raise ValueError("Intervalli di polling non validi")
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = max(backoff, 1.0)
+        self.burst_polls = burst_polls
+        self.interval = min_interval
+        self._burst_left = 0
+
+    def on_change(self):
+        self.interval = self.min_interval
+        self._burst_left = self.burst_polls
+
+    def on_idle(self):
+        if self._burst_left > 0:
+            self._burst_left -= 1
+            return
+        self.interval = min(self.max_interval, self.interval * self.backoff)
+
+    def next_interval(self):
+        return self.interval
+
 
 class ClipboardMonitor(threading.Thread):
-    def __init__(self, callback, poll_interval=0.5):
-        super().__init__()
+    def __init__(self, callback, poll_interval=0.5, backend=None, scheduler=None, policy=None):
+        super().__init__(name='ClipboardMonitor')
         self.callback = callback
         self.poll_interval = poll_interval
+        # None o nome del backend = scelta al primo avvio del thread
+        self.backend = backend
+        self.scheduler = scheduler or AdaptivePollScheduler(min_interval=poll_interval / 5,
+                                                            max_interval=poll_interval * 4)
+        self.policy = policy or ContentPolicy()
         self._stop_event = threading.Event()
-        self.last_text = None
+        # (lunghezza, digest) dell'ultimo contenuto visto
+        self.last_fingerprint = None
+        # Impronta dell'ultimo contenuto per cui il callback è terminato
+        self.handled_fingerprint = None
+        # perf_counter() dell'inizio della lettura che ha rilevato l'ultimo cambio
+        self.last_change_time = None
 
-    def run(self):
-        while not self._stop_event.is_set():
+    def _check_clipboard(self):
+        """Legge la clipboard e ritorna True se il contenuto è cambiato."""
+        try:
+            start = time.perf_counter()
+            text = self.backend.read()
+            end = time.perf_counter()
+            metrics.CLIPBOARD_READ_SECONDS.observe(end - start, backend=self.backend.name)
+            if not text:
+                return False
+            fingerprint = self.policy.fingerprint(text)
+            if fingerprint == self.last_fingerprint:
+                return False
+            self.last_fingerprint = fingerprint
+            self.last_change_time = start
+            metrics.CLIPBOARD_CHANGES.inc()
+            # Nella traccia solo le letture che portano un nuovo contenuto
+            TRACER.complete('clipboard.read', start, end, backend=self.backend.name, chars=len(text))
+            window = self.policy.prepare(text)
+            del text
             try:
-                text = pyperclip.paste()
-                if text != self.last_text and text.strip():
-                    self.last_text = text
-                    self.callback(text)
-            except Exception as e:
-                pass
-            time.sleep(self.poll_interval)
+                if window is not None:
+                    self.callback(window)
+            finally:
+                self.handled_fingerprint = fingerprint
+            return True
+        except Exception as e:
+            pass
+        return False
+
+    def _open_backend(self):
+        if self.backend is None or isinstance(self.backend, str):
+            try:
+                self.backend = select_backend(self.backend)
+            except (ClipboardBackendError, OSError, ImportError):
+                # Backend richiesto non disponibile: ripiega sulla scelta automatica
+                self.backend = select_backend('auto')
+
+    def run(self):
+        self._open_backend()
+        try:
+            if self.backend.event_driven:
+                # Lettura iniziale, poi solo su notifica di cambio
+                self._check_clipboard()
+                while not self._stop_event.is_set():
+                    if self.backend.wait_for_change(self.poll_interval):
+                        self._check_clipboard()
+            else:
+                while not self._stop_event.is_set():
+                    if self._check_clipboard():
+                        self.scheduler.on_change()
+                    else:
+                        self.scheduler.on_idle()
+                    self._stop_event.wait(self.scheduler.next_interval())
+        finally:
+            self.backend.close()
 
     def stop(self):
         self._stop_event.set()
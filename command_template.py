@@ -0,0 +1,184 @@
+import os
+import re
+import shlex
+import subprocess
+from urllib.parse import urlsplit
+
+# Segnaposto ammessi in programN
+# {prev} (solo nelle fasi successive di una pipeline) = ultima riga di output della fase precedente
+PLACEHOLDERS = ('url', 'id', 'scheme', 'host', 'port', 'path', 'query', 'fragment', 'prev')
+
+# {{, }} e {nome}: le altre graffe sono testo
+_FIELD_RE = re.compile(r'\{\{|\}\}|\{(\w*)\}')
+
+
+class CommandTemplateError(ValueError):
+    pass
+
+
+def split_command(command):
+    """
+    Divide la riga di comando in argomenti: separati da spazi, con le
+    virgolette (doppie o singole) che raggruppano. La barra rovesciata non
+    è un carattere di escape, così i percorsi Windows restano invariati.
+    """
+    args = []
+    current = []
+    in_token = False
+    quote = None
+    for ch in command:
+        if quote:
+            if ch == quote:
+                quote = None
+            else:
+                current.append(ch)
+        elif ch in '"\'':
+            quote = ch
+            in_token = True
+        elif ch.isspace():
+            if in_token:
+                args.append("".join(current))
+                current = []
+                in_token = False
+        else:
+            current.append(ch)
+            in_token = True
+    if quote:
+        raise CommandTemplateError(f"Virgolette non chiuse in: {command}")
+    if in_token:
+        args.append("".join(current))
+    return args
+
+
+def compile_template(text):
+    """
+    Divide text in segmenti (testo, None) e (None, segnaposto). {{ e }}
+    diventano graffe letterali; le graffe che non racchiudono un segnaposto
+    di PLACEHOLDERS (es. {} di yt-dlp --exec o le f-string di python -c)
+    restano nel comando così come sono.
+    """
+    segments = []
+    literal = []
+    pos = 0
+    for match in _FIELD_RE.finditer(text):
+        literal.append(text[pos:match.start()])
+        pos = match.end()
+        token = match.group()
+        if token == '{{':
+            literal.append('{')
+        elif token == '}}':
+            literal.append('}')
+        elif match.group(1) in PLACEHOLDERS:
+            if "".join(literal):
+                segments.append(("".join(literal), None))
+            literal = []
+            segments.append((None, match.group(1)))
+        else:
+            literal.append(token)
+    literal.append(text[pos:])
+    if "".join(literal):
+        segments.append(("".join(literal), None))
+    return segments
+
+
+def _shell_segments(command):
+    """
+    Segmenti di compile_template con, per ogni segnaposto, le virgolette
+    della shell in cui si trova (None, '"' o "'"): (testo, segnaposto, virgolette).
+    """
+    segments = []
+    quote = None
+    escaped = False
+    for text, name in compile_template(command):
+        if name is not None:
+            segments.append((None, name, quote))
+            continue
+        segments.append((text, None, None))
+        for ch in text:
+            if escaped:
+                escaped = False
+            elif ch == '\\' and quote != "'" and os.name != 'nt':
+                escaped = True
+            elif quote is None and (ch == '"' or (ch == "'" and os.name != 'nt')):
+                quote = ch
+            elif ch == quote:
+                quote = None
+    return segments
+
+
+def shell_quote(value, context=None):
+    """
+    Valore sicuro per la riga della shell: fuori dalle virgolette viene
+    quotato (shlex.quote, su Windows list2cmdline), dentro viene solo
+    protetto il contenuto.
+    """
+    if os.name == 'nt':
+        quoted = subprocess.list2cmdline([value])
+        if context == '"' and quoted.startswith('"') and quoted.endswith('"') and len(quoted) > 1:
+            return quoted[1:-1]
+        return quoted
+    if context == '"':
+        return re.sub(r'([\\"$`])', r'\\\1', value)
+    if context == "'":
+        return value.replace("'", "'\\''")
+    return shlex.quote(value)
+
+
+def placeholder_values(url, job_id=None, prev=None):
+    """Valori dei segnaposto per un url (già filtrato)."""
+    parts = urlsplit(url)
+    try:
+        port = parts.port
+    except ValueError:
+        port = None
+    return {
+        'url': url,
+        'id': "" if job_id is None else str(job_id),
+        'scheme': parts.scheme,
+        'host': parts.hostname or "",
+        'port': "" if port is None else str(port),
+        'path': parts.path,
+        'query': parts.query,
+        'fragment': parts.fragment,
+        'prev': prev or "",
+    }
+
+
+class CommandTemplate:
+    """
+    programN compilato una volta al caricamento della configurazione:
+    la riga viene divisa in argv e i segnaposto individuati subito, così a
+    ogni esecuzione si sostituiscono solo gli argomenti che li contengono e
+    il processo viene avviato direttamente, senza shell.
+    """
+    def __init__(self, command):
+        self.command = command
+        # (testo, segmenti se contiene segnaposto altrimenti None) per ogni argomento
+        self.args = []
+        for arg in split_command(command):
+            segments = compile_template(arg)
+            if any(name is not None for _, name in segments):
+                self.args.append((arg, segments))
+            else:
+                self.args.append(("".join(text for text, _ in segments), None))
+        self._shell = None
+
+    @property
+    def executable(self):
+        return self.args[0][0] if self.args else None
+
+    def argv(self, url, job_id=None, prev=None):
+        if not self.args:
+            raise CommandTemplateError("Nessun programma configurato")
+        values = placeholder_values(url, job_id, prev)
+        return [arg if segments is None else "".join(text if name is None else values[name]
+                                                      for text, name in segments)
+                for arg, segments in self.args]
+
+    def shell_command(self, url, job_id=None, prev=None):
+        """Riga per la shell (run_in_shell): ogni valore viene quotato (shell_quote)."""
+        if self._shell is None:
+            self._shell = _shell_segments(self.command)
+        values = placeholder_values(url, job_id, prev)
+        return "".join(text if name is None else shell_quote(values[name], quote)
+                       for text, name, quote in self._shell)
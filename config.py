@@ -1,26 +1,311 @@
 import configparser
+import os
 import re
+import sys
+import threading
+import regex_cost
+from command_template import CommandTemplate
+from matcher import ActionSet
+from output_parsers import PARSERS
+from resources import ResourceLimits
+from result_cache import FORCE, POLICIES
+from tracing import TRACER
 
 class LinkAction:
-    def __init__(self, pattern, program, label, filter_name=None, filters=None, run_in_shell=False, autorun=False):
+    def __init__(self, pattern, program, label, filter_name=None, filters=None, run_in_shell=False, autorun=False,
+                 program_key=None, cache_policy='force', limits=None, output_parser='auto', pool=None, stages=None):
         self.pattern = re.compile(pattern)
         self.program = program
+        # argv precompilato (solleva CommandTemplateError se programN non è valido, es. virgolette non chiuse)
+        self.command = CommandTemplate(program)
+        # voce di [DICT_PROGRAMS] usata dal programma (per i limiti di esecuzione)
+        self.program_key = program_key
+        # skip | ask | force se l'azione è già stata eseguita sullo stesso url
+        self.cache_policy = cache_policy
+        # nice, ionice, rlimit e timeout del programma (ResourceLimits)
+        self.limits = limits or ResourceLimits()
+        # Parser dell'output (output_parsers.PARSERS, 'auto' = in base all'eseguibile)
+        if output_parser != 'auto' and output_parser not in PARSERS:
+            raise ValueError(f"Parser di output sconosciuto: {output_parser} "
+                             f"(disponibili: auto, {', '.join(PARSERS)})")
+        self.output_parser = output_parser
+        # Voce di [LIMITS] che limita i processi contemporanei (default: il programma)
+        self.pool = pool
+        # Fasi della pipeline: questa azione e quelle di programN_2, programN_3, ...
+        self.stages = [self] + list(stages or ())
         self.label = label
         self.filter_name = filter_name
         self.filters = filters or {}
+        # PatternGuard del filtro (budget di tempo), al primo uso
+        self._filter_guard = None
         self.run_in_shell = run_in_shell
         self.autorun = autorun
+        # Valori letti dall'INI (load_config), per riconoscere l'azione invariata a una ricarica
+        # anche se dalla GUI sono stati cambiati autorun o run_in_shell
+        self.definition = None
 
     def filter_url(self, url):
         if self.filter_name and self.filter_name in self.filters:
             pattern, replace = self.filters[self.filter_name]
-            return pattern.sub(replace, url)
+            guard = self._filter_guard
+            if guard is None:
+                guard = self._filter_guard = regex_cost.guard_for(pattern, regex_cost.FILTER)
+            with TRACER.span('filter_url', action=self.label):
+                return guard.sub(pattern, replace, url)
         return url
 
 
-def load_config(config_path='config.ini'):
+def read_config(config_path='config.ini'):
+    """
+    ConfigParser del file `config_path`. Se config_path è già un
+    ConfigParser viene ritornato così com'è: load_config e i load_*_settings
+    lo accettano al posto del percorso, così una ricarica legge il file una volta sola.
+    """
+    if isinstance(config_path, configparser.ConfigParser):
+        return config_path
     config = configparser.ConfigParser()
     config.read(config_path)
+    return config
+
+
+DEFAULT_MONITOR_SETTINGS = {
+    'backend': 'auto',
+    'poll_min_interval': 0.1,
+    'poll_max_interval': 2.0,
+    'poll_backoff': 1.5,
+    'poll_burst': 10,
+    'max_clipboard_chars': 1000000,
+    'max_scan_chars': 65536,
+    'oversize': 'skip',
+    'bulk_min_links': 2,
+}
+
+
+def load_monitor_settings(config_path='config.ini'):
+    """
+    Legge la sezione opzionale [MONITOR] (backend clipboard, parametri
+    del polling adattivo e limiti sulla dimensione del contenuto), con i
+    valori di default per le chiavi assenti.
+    """
+    config = read_config(config_path)
+
+    settings = dict(DEFAULT_MONITOR_SETTINGS)
+    if 'MONITOR' in config:
+        section = config['MONITOR']
+        settings['backend'] = section.get('backend', settings['backend'])
+        settings['poll_min_interval'] = section.getfloat('poll_min_interval', settings['poll_min_interval'])
+        settings['poll_max_interval'] = section.getfloat('poll_max_interval', settings['poll_max_interval'])
+        settings['poll_backoff'] = section.getfloat('poll_backoff', settings['poll_backoff'])
+        settings['poll_burst'] = section.getint('poll_burst', settings['poll_burst'])
+        settings['max_clipboard_chars'] = section.getint('max_clipboard_chars', settings['max_clipboard_chars'])
+        settings['max_scan_chars'] = section.getint('max_scan_chars', settings['max_scan_chars'])
+        settings['oversize'] = section.get('oversize', settings['oversize'])
+        settings['bulk_min_links'] = max(2, section.getint('bulk_min_links', settings['bulk_min_links']))
+    return settings
+
+
+def load_job_limits(config_path='config.ini'):
+    """
+    Legge la sezione opzionale [LIMITS]:
+        max_jobs = numero massimo di processi contemporanei
+        <voce di [DICT_PROGRAMS]> = processi contemporanei per quel programma
+        <pool> = processi contemporanei per le fasi con poolN (o poolN_K) = pool
+    Ritorna (max_jobs, {programma: limite}).
+    """
+    config = read_config(config_path)
+
+    max_jobs = 2
+    program_limits = {}
+    if 'LIMITS' in config:
+        section = config['LIMITS']
+        max_jobs = section.getint('max_jobs', max_jobs)
+        for key in section:
+            if key != 'max_jobs':
+                program_limits[key] = section.getint(key)
+    return max_jobs, program_limits
+
+
+def load_history_settings(config_path='config.ini'):
+    """
+    Legge la sezione opzionale [HISTORY]:
+        log_dir = cartella dei log dei job (vuoto = ~/.link_monitor/logs)
+        compress_logs = true per salvare i log compressi (gzip)
+        tail_lines = righe di output tenute in memoria per ogni job
+        db_path = file SQLite della cronologia (vuoto = ~/.link_monitor/history.db)
+    """
+    config = read_config(config_path)
+
+    settings = {'log_dir': '', 'compress_logs': False, 'tail_lines': 200, 'db_path': ''}
+    if 'HISTORY' in config:
+        section = config['HISTORY']
+        settings['log_dir'] = section.get('log_dir', settings['log_dir'])
+        settings['compress_logs'] = section.getboolean('compress_logs', settings['compress_logs'])
+        settings['tail_lines'] = section.getint('tail_lines', settings['tail_lines'])
+        settings['db_path'] = section.get('db_path', settings['db_path'])
+    if not settings['log_dir']:
+        from joblog import default_log_dir
+        settings['log_dir'] = default_log_dir()
+    if not settings['db_path']:
+        from history_store import default_db_path
+        settings['db_path'] = default_db_path()
+    settings['log_dir'] = os.path.expanduser(settings['log_dir'])
+    settings['db_path'] = os.path.expanduser(settings['db_path'])
+    return settings
+
+
+def load_cache_settings(config_path='config.ini'):
+    """
+    Legge la sezione opzionale [CACHE]:
+        default_policy = skip | ask | force (per le azioni senza cacheN)
+        ttl = secondi di validità di un'esecuzione riuscita (0 = sempre valida)
+        max_entries = voci massime tenute in memoria
+    """
+    config = read_config(config_path)
+
+    settings = {'default_policy': FORCE, 'ttl': 86400, 'max_entries': 10000}
+    if 'CACHE' in config:
+        section = config['CACHE']
+        policy = section.get('default_policy', settings['default_policy']).lower()
+        if policy in POLICIES:
+            settings['default_policy'] = policy
+        settings['ttl'] = section.getint('ttl', settings['ttl'])
+        settings['max_entries'] = section.getint('max_entries', settings['max_entries'])
+    return settings
+
+
+def load_metrics_settings(config_path='config.ini'):
+    """
+    Legge la sezione opzionale [METRICS]:
+        port = porta dell'endpoint Prometheus su 127.0.0.1 (0 = disattivato)
+    """
+    config = read_config(config_path)
+
+    settings = {'port': 0}
+    if 'METRICS' in config:
+        settings['port'] = config['METRICS'].getint('port', settings['port'])
+    return settings
+
+
+def load_tracing_settings(config_path='config.ini'):
+    """
+    Legge la sezione opzionale [TRACING]:
+        enabled = true per registrare la traccia di ogni sessione
+        trace_dir = cartella delle tracce (vuoto = ~/.link_monitor/traces)
+    """
+    config = read_config(config_path)
+
+    settings = {'enabled': False, 'trace_dir': ''}
+    if 'TRACING' in config:
+        section = config['TRACING']
+        settings['enabled'] = section.getboolean('enabled', settings['enabled'])
+        settings['trace_dir'] = section.get('trace_dir', settings['trace_dir'])
+    if not settings['trace_dir']:
+        from tracing import default_trace_dir
+        settings['trace_dir'] = default_trace_dir()
+    settings['trace_dir'] = os.path.expanduser(settings['trace_dir'])
+    return settings
+
+
+def load_regex_settings(config_path='config.ini'):
+    """
+    Legge la sezione opzionale [REGEX] (costo delle regex di [LINKS] e [FILTERS]):
+        budget_ms = tempo massimo di una singola valutazione
+        quarantine = secondi di sospensione di una regex oltre il budget (0 = fino alla modifica)
+        strikes = sforamenti del budget (nelle ultime 20 chiamate) prima della sospensione
+        profile = true per misurare ogni regex al caricamento sul corpus avversario
+        profile_chars = lunghezza massima dei testi usati per la misura
+    """
+    config = read_config(config_path)
+
+    settings = dict(regex_cost.DEFAULT_REGEX_SETTINGS)
+    if 'REGEX' in config:
+        section = config['REGEX']
+        settings['budget_ms'] = section.getfloat('budget_ms', settings['budget_ms'])
+        settings['quarantine'] = section.getint('quarantine', settings['quarantine'])
+        settings['strikes'] = section.getint('strikes', settings['strikes'])
+        settings['profile'] = section.getboolean('profile', settings['profile'])
+        settings['profile_chars'] = section.getint('profile_chars', settings['profile_chars'])
+    return settings
+
+
+def _apply_regex_settings(actions, filters, config):
+    """Budget di tempo e profilo di costo per le regex delle azioni e dei filtri."""
+    settings = load_regex_settings(config)
+    max_chars = load_monitor_settings(config)['max_scan_chars']
+    for action in actions:
+        regex_cost.apply_settings(action.pattern, regex_cost.RULE, settings, max_chars)
+    for pattern, _ in filters.values():
+        regex_cost.apply_settings(pattern, regex_cost.FILTER, settings, max_chars)
+
+
+def _load_filters(config, previous=None):
+    """Compila i filtri di [FILTERS], riusando quelli già compilati e invariati."""
+    previous = previous or {}
+    filters = {}
+    if 'FILTERS' in config:
+        for key in config['FILTERS']:
+            if key.endswith('_pattern'):
+                filter_name = key[:-8]  # togli '_pattern'
+                pattern = config['FILTERS'][key]
+                replace = config['FILTERS'].get(f'{filter_name}_replace', '')
+                old = previous.get(filter_name)
+                if old is not None and old[0].pattern == pattern and old[1] == replace:
+                    filters[filter_name] = old
+                else:
+                    filters[filter_name] = (re.compile(pattern), replace)
+    return filters
+
+
+def _stage_definition(stage):
+    return (stage.program, stage.label, stage.run_in_shell, stage.program_key, stage.limits.spec,
+            stage.output_parser, stage.pool)
+
+
+def _action_definition(action):
+    """Tutto ciò che determina il comportamento di un'azione (per riconoscere quelle invariate)."""
+    filter_spec = action.filters.get(action.filter_name) if action.filter_name else None
+    if filter_spec is not None:
+        filter_spec = (filter_spec[0].pattern, filter_spec[1])
+    return (action.pattern.pattern, action.filter_name, filter_spec, action.autorun, action.cache_policy,
+            _stage_definition(action), tuple(_stage_definition(stage) for stage in action.stages[1:]))
+
+
+def _load_stage(links, suffix, dict_programs_labels):
+    """
+    Chiavi di [LINKS] di una fase con suffisso N (o N_K per le fasi
+    successive): programma, label, run_in_shell, voce di [DICT_PROGRAMS],
+    limiti, parser e pool. Ritorna la tupla in ordine (vedi _stage_definition).
+    """
+    # Leggi programN e sostituisci eventuali label
+    prog_raw = links.get(f'program{suffix}', '')
+    program = substitute_label(prog_raw, dict_programs_labels)
+
+    # Leggi labelN (testo pulsante), fallback a nome programma o 'Azione'
+    label_raw = links.get(f'label{suffix}', '')
+    label = label_raw if label_raw else (program.split()[0] if program else 'Azione')
+
+    run_in_shell = links.getboolean(f'run_in_shell{suffix}', fallback=False)
+    program_key = find_label(prog_raw, dict_programs_labels)
+    limits_spec = tuple(links.get(f'{name}{suffix}') for name in ('nice', 'ionice', 'rlimit', 'timeout'))
+    output_parser = links.get(f'parser{suffix}', 'auto').strip().lower() or 'auto'
+    pool = links.get(f'pool{suffix}', '').strip().lower() or None
+    return program, label, run_in_shell, program_key, limits_spec, output_parser, pool
+
+
+def _stage_action(pattern, stage):
+    program, label, run_in_shell, program_key, limits_spec, output_parser, pool = stage
+    return LinkAction(pattern, program, label, run_in_shell=run_in_shell, program_key=program_key,
+                      limits=ResourceLimits(*limits_spec), output_parser=output_parser, pool=pool)
+
+
+def load_config(config_path='config.ini', previous=None):
+    """
+    Legge le azioni da config_path (percorso o ConfigParser, vedi read_config).
+    Con `previous` (ActionSet caricato in precedenza) le azioni e i filtri
+    invariati vengono riusati senza ricompilare le regex; se non cambia
+    nulla viene ritornato `previous` stesso.
+    """
+    config = read_config(config_path)
 
     # Carica le label da [DICT_REGEX]
     dict_regexs_labels = {}
@@ -33,37 +318,106 @@ def load_config(config_path='config.ini'):
         dict_programs_labels = dict(config['DICT_PROGRAMS'])
 
     # Carica i filtri da [FILTERS]
-    filters = {}
-    if 'FILTERS' in config:
-        for key in config['FILTERS']:
-            if key.endswith('_pattern'):
-                filter_name = key[:-8]  # togli '_pattern'
-                pattern = config['FILTERS'][key]
-                replace = config['FILTERS'].get(f'{filter_name}_replace', '')
-                filters[filter_name] = (re.compile(pattern), replace)
+    previous_filters = previous[0].filters if previous else None
+    filters = _load_filters(config, previous_filters)
+
+    default_cache_policy = load_cache_settings(config)['default_policy']
+
+    reusable = {}
+    for action in previous or ():
+        reusable.setdefault(action.definition or _action_definition(action), action)
 
     actions = []
-    for key in config['LINKS']:
+    links = config['LINKS']
+    for key in links:
         if key.startswith('regex'):
             num = key.replace('regex', '')
-            pattern_raw = config['LINKS'][key]
+            pattern_raw = links[key]
             pattern = substitute_label(pattern_raw, dict_regexs_labels)
 
-            # Leggi programN e sostituisci eventuali label
-            prog_raw = config['LINKS'].get(f'program{num}', '')
-            program = substitute_label(prog_raw, dict_programs_labels)
+            first_stage = _load_stage(links, num, dict_programs_labels)
+            # Fasi successive della pipeline: programN_2, programN_3, ...
+            next_stages = []
+            while f'program{num}_{len(next_stages) + 2}' in links:
+                next_stages.append(_load_stage(links, f'{num}_{len(next_stages) + 2}', dict_programs_labels))
+
+            filter_name = links.get(f'filter{num}', None)
+            autorun = links.getboolean(f'autorun{num}', fallback=False)
+            cache_policy = links.get(f'cache{num}', default_cache_policy).lower()
+            if cache_policy not in POLICIES:
+                cache_policy = default_cache_policy
 
-            # Leggi labelN (testo pulsante), fallback a nome programma o 'Azione'
-            label_raw = config['LINKS'].get(f'label{num}', '')
-            label = label_raw if label_raw else (program.split()[0] if program else 'Azione')
+            filter_spec = filters.get(filter_name) if filter_name else None
+            if filter_spec is not None:
+                filter_spec = (filter_spec[0].pattern, filter_spec[1])
+            definition = (pattern, filter_name, filter_spec, autorun, cache_policy, first_stage, tuple(next_stages))
+            action = reusable.pop(definition, None)
+            if action is None:
+                try:
+                    stages = [_stage_action(pattern, stage) for stage in next_stages]
+                    program, label, run_in_shell, program_key, limits_spec, output_parser, pool = first_stage
+                    action = LinkAction(pattern, program, label, filter_name, filters, run_in_shell, autorun,
+                                        program_key, cache_policy, ResourceLimits(*limits_spec), output_parser,
+                                        pool, stages)
+                    action.definition = definition
+                except (ValueError, re.error) as e:
+                    # Solo questa azione viene scartata, le altre restano valide
+                    print(f"[link_monitor] Azione {key} ignorata: {e}", file=sys.stderr)
+                    continue
+            actions.append(action)
 
-            filter_name = config['LINKS'].get(f'filter{num}', None)
-            run_in_shell = config['LINKS'].getboolean(f'run_in_shell{num}', fallback=False)
-            autorun = config['LINKS'].getboolean(f'autorun{num}', fallback=False)
+    _apply_regex_settings(actions, filters, config)
 
-            actions.append(LinkAction(pattern, program, label, filter_name, filters, run_in_shell, autorun))
+    if previous is not None and len(actions) == len(previous) and all(
+            a is b for a, b in zip(actions, previous)):
+        return previous
+    return ActionSet(actions)
+
+
+# Sezioni da cui dipendono le azioni: se cambia una di queste si ricarica load_config
+# (da [MONITOR] max_scan_chars, la lunghezza massima analizzata dalle regex)
+ACTION_SECTIONS = ('LINKS', 'DICT_REGEX', 'DICT_PROGRAMS', 'FILTERS', 'CACHE', 'REGEX', 'MONITOR')
+
+
+class ConfigReloader:
+    """
+    Ricarica il file di configurazione quando cambia, confrontando il
+    contenuto delle singole sezioni: le azioni vengono ricalcolate solo se
+    cambia una delle ACTION_SECTIONS, e anche allora si ricompilano solo
+    le regex delle azioni modificate.
+    """
+    def __init__(self, config_path, actions=None):
+        self.config_path = config_path
+        self._lock = threading.Lock()
+        config = read_config(config_path)
+        self._hashes = self._section_hashes(config)
+        self.actions = actions if actions is not None else load_config(config)
+
+    @staticmethod
+    def _section_hashes(config):
+        return {name: hash(tuple(config.items(name, raw=True))) for name in config.sections()}
+
+    def reload(self, config_path=None):
+        """
+        Rilegge il file (o `config_path`, se si cambia file) e ritorna
+        l'insieme delle sezioni cambiate; la nuova ActionSet è in self.actions.
+        In caso di errore (es. regex non valida) solleva l'eccezione e lascia
+        la configurazione precedente.
+        """
+        with self._lock:
+            if config_path is not None and config_path != self.config_path:
+                self.config_path = config_path
+                self._hashes = {}
+            # Il file viene letto una volta: lo stesso ConfigParser va a load_config
+            config = read_config(self.config_path)
+            hashes = self._section_hashes(config)
+            changed = {name for name in set(hashes) | set(self._hashes)
+                       if hashes.get(name) != self._hashes.get(name)}
+            if changed & set(ACTION_SECTIONS):
+                self.actions = load_config(config, previous=self.actions)
+            self._hashes = hashes
+            return changed
 
-    return actions
 
 def substitute_label(value, labels):
     """
@@ -78,3 +432,10 @@ def substitute_label(value, labels):
         if value.startswith(label_key):
             return value.replace(label_key, label_val, 1)
     return value
+
+def find_label(value, labels):
+    """Ritorna la label con cui inizia value, oppure None."""
+    for label_key in labels:
+        if value.startswith(label_key):
+            return label_key
+    return None
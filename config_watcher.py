@@ -0,0 +1,132 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import threading
+
+# Costanti inotify (linux/inotify.h)
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+
+_EVENT_HEADER = struct.Struct('iIII')
+
+
+class _Inotify:
+    """Accesso minimo a inotify tramite ctypes (solo Linux)."""
+    def __init__(self, directory):
+        libc_path = ctypes.util.find_library('c')
+        if not libc_path:
+            raise OSError("libc non trovata")
+        libc = ctypes.CDLL(libc_path, use_errno=True)
+        if not hasattr(libc, 'inotify_init1'):
+            raise OSError("inotify non disponibile")
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 fallita")
+        # Si osserva la cartella: molti editor sostituiscono il file invece di riscriverlo
+        mask = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE
+        wd = libc.inotify_add_watch(self.fd, os.fsencode(directory), mask)
+        if wd < 0:
+            os.close(self.fd)
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch fallita su {directory}")
+
+    def read_names(self):
+        try:
+            data = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return []
+        names = []
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            _, _, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            names.append(os.fsdecode(data[offset:offset + length].rstrip(b'\0')))
+            offset += length
+        return names
+
+    def close(self):
+        os.close(self.fd)
+
+
+class ConfigWatcher(threading.Thread):
+    """
+    Osserva il file di configurazione e chiama `on_change(path)` quando
+    cambia: con inotify dove disponibile, altrimenti controllando mtime e
+    dimensione ogni `poll_interval` secondi. Gli eventi ravvicinati
+    (salvataggi in più passi) vengono raggruppati per `debounce` secondi.
+    """
+    def __init__(self, path, on_change, poll_interval=1.0, debounce=0.1):
+        super().__init__(daemon=True)
+        self.path = os.path.abspath(path)
+        self.on_change = on_change
+        self.poll_interval = poll_interval
+        self.debounce = debounce
+        self._stop_event = threading.Event()
+        self._path_changed = threading.Event()
+        self._signature = self._file_signature()
+
+    def _file_signature(self):
+        try:
+            st = os.stat(self.path)
+            return st.st_mtime_ns, st.st_size
+        except OSError:
+            return None
+
+    def set_path(self, path):
+        """Passa a osservare un altro file (es. scelto dal menu) e lo ricarica subito."""
+        self.path = os.path.abspath(path)
+        self._signature = self._file_signature()
+        self._path_changed.set()
+        self.on_change(self.path)
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _check(self):
+        signature = self._file_signature()
+        if signature is not None and signature != self._signature:
+            self._signature = signature
+            try:
+                self.on_change(self.path)
+            except Exception as e:
+                print(f"Errore ricaricando {self.path}: {e}", file=sys.stderr)
+
+    def run(self):
+        while not self._stop_event.is_set():
+            self._path_changed.clear()
+            try:
+                inotify = _Inotify(os.path.dirname(self.path))
+            except (OSError, AttributeError):
+                inotify = None
+            try:
+                if inotify is not None:
+                    self._run_inotify(inotify)
+                else:
+                    self._run_polling()
+            finally:
+                if inotify is not None:
+                    inotify.close()
+
+    def _run_inotify(self, inotify):
+        name = os.path.basename(self.path)
+        while not self._stop_event.is_set() and not self._path_changed.is_set():
+            ready, _, _ = select.select([inotify.fd], [], [], 0.5)
+            if not ready or name not in inotify.read_names():
+                continue
+            # Attende la fine del salvataggio, poi scarta gli eventi accumulati
+            self._stop_event.wait(self.debounce)
+            inotify.read_names()
+            self._check()
+
+    def _run_polling(self):
+        while not self._stop_event.is_set() and not self._path_changed.is_set():
+            self._check()
+            self._stop_event.wait(self.poll_interval)
@@ -0,0 +1,153 @@
+import asyncio
+import os
+import subprocess
+import threading
+from resources import reap_with_usage
+
+READ_CHUNK = 65536
+
+
+def _pidfd_supported():
+    if not hasattr(os, 'pidfd_open') or not hasattr(os, 'wait4'):
+        return False
+    try:
+        fd = os.pidfd_open(os.getpid())
+    except OSError:
+        return False
+    os.close(fd)
+    return True
+
+
+# Linux >= 5.3: l'uscita dei processi si attende con un pidfd nell'event loop
+PIDFD_SUPPORTED = _pidfd_supported()
+
+
+class JobEngine:
+    """
+    Un solo thread ('job-engine') con un event loop asyncio in cui girano
+    tutti i processi dei job: letture delle pipe non bloccanti, attesa
+    dell'uscita e timer. Il numero di thread non cresce con i job in corso.
+    Il thread parte alla prima submit(); i callback dei job vengono chiamati
+    da qui e non devono bloccare.
+    """
+    def __init__(self):
+        self.loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+        # Future dei job in corso: il loop tiene i task solo con riferimenti
+        # deboli (e StreamReaderProtocol il suo StreamReader), senza questi
+        # un job in attesa dell'output può essere raccolto dal garbage collector
+        self._running = set()
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self.loop = asyncio.new_event_loop()
+            ready = threading.Event()
+            self._thread = threading.Thread(target=self._main, args=(ready,), name='job-engine', daemon=True)
+            self._thread.start()
+        ready.wait()
+
+    def _main(self, ready):
+        asyncio.set_event_loop(self.loop)
+        self.loop.call_soon(ready.set)
+        self.loop.run_forever()
+
+    def submit(self, coro):
+        """Esegue la coroutine nel loop; ritorna un concurrent.futures.Future."""
+        self.start()
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        with self._lock:
+            self._running.add(future)
+        future.add_done_callback(self._finished)
+        return future
+
+    def _finished(self, future):
+        with self._lock:
+            self._running.discard(future)
+
+    def call_soon(self, func, *args):
+        """Chiama func(*args) dal thread del loop (da qualunque thread)."""
+        self.start()
+        self.loop.call_soon_threadsafe(func, *args)
+
+    def stop(self):
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            thread.join(5)
+
+
+def signal_process(proc, name):
+    """proc.terminate() / proc.kill() ignorando i processi già terminati."""
+    try:
+        getattr(proc, name)()
+    except ProcessLookupError:
+        pass
+
+
+async def run_process(cmd, shell, on_spawn, on_data, preexec_fn=None):
+    """
+    Avvia il comando con stdout e stderr sulla stessa pipe, chiama
+    on_spawn(proc) e on_data(bytes) per ogni blocco letto (b'' alla fine).
+    Ritorna le risorse usate (vedi resources.wait_with_usage) o None;
+    l'exit code è in proc.returncode. `preexec_fn` viene eseguita nel
+    figlio prima di exec (vedi resources.ResourceLimits.preexec).
+
+    Con i pidfd il processo è un Popen: la pipe viene letta dal loop
+    (connect_read_pipe), l'uscita attesa sul pidfd e il processo raccolto
+    con wait4, così restano disponibili le risorse usate. Altrove si usa
+    asyncio.create_subprocess_exec (senza risorse).
+    """
+    if not PIDFD_SUPPORTED:
+        if shell:
+            proc = await asyncio.create_subprocess_shell(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                                         preexec_fn=preexec_fn)
+        else:
+            proc = await asyncio.create_subprocess_exec(*cmd, stdout=subprocess.PIPE,
+                                                        stderr=subprocess.STDOUT, preexec_fn=preexec_fn)
+        on_spawn(proc)
+        while True:
+            data = await proc.stdout.read(READ_CHUNK)
+            on_data(data)
+            if not data:
+                break
+        await proc.wait()
+        return None
+
+    loop = asyncio.get_running_loop()
+    proc = subprocess.Popen(cmd, shell=shell, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                            preexec_fn=preexec_fn)
+    # Come in wait_with_usage: finché il lock è tenuto poll() (anche quello
+    # di terminate) non raccoglie il processo al posto di wait4
+    lock = proc._waitpid_lock
+    lock.acquire()
+    pidfd = None
+    try:
+        pidfd = os.pidfd_open(proc.pid)
+        exited = loop.create_future()
+        loop.add_reader(pidfd, lambda: exited.done() or exited.set_result(None))
+        on_spawn(proc)
+        reader = asyncio.StreamReader()
+        transport, _ = await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), proc.stdout)
+        try:
+            while True:
+                data = await reader.read(READ_CHUNK)
+                on_data(data)
+                if not data:
+                    break
+        finally:
+            transport.close()
+        await exited
+        return reap_with_usage(proc)
+    finally:
+        if pidfd is not None:
+            loop.remove_reader(pidfd)
+            os.close(pidfd)
+        if proc.returncode is None:
+            # Errore prima dell'uscita: il processo viene terminato e raccolto
+            proc.kill()
+            reap_with_usage(proc)
+        lock.release()
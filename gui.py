@@ -1,24 +1,42 @@
-import tkinter as tk
-from tkinter import ttk, messagebox, filedialog, scrolledtext
-import subprocess
+import queue
+import sys
 import threading
-import webbrowser
-import datetime
+import tkinter as tk
+from tkinter import ttk, messagebox
+from jobs import Job, JobScheduler, CANCELLED, FAILED, PRIORITY_BATCH, PRIORITY_NORMAL
+from output_pump import OutputPump
+from ui_channel import UiChannel
+from joblog import LogReader, LOG_PAGE_SIZE
+from resources import format_usage
+from result_cache import ASK
+from tracing import TRACER
+import os
+import regex_cost
 
 class ActionTab(ttk.Frame):
-    def __init__(self, parent, link, actions, close_callback, save_history_callback=None, autoclose=False):
+    def __init__(self, parent, link, actions, close_callback, save_history_callback=None, autoclose=False,
+                 scheduler=None, result_cache=None):
         super().__init__(parent)
         self.link = link
         self.save_history_callback = save_history_callback
         self.actions = actions
         self.close_callback = close_callback
+        self.scheduler = scheduler or JobScheduler()
+        self.result_cache = result_cache
+        self.jobs = []
+        # Gli eventi dei job arrivano dal thread del motore: passano dal canale della finestra
+        self.ui = self.winfo_toplevel().ui
         self.status = tk.StringVar(value="Attesa scelta utente")
         self.status_color = "#FFFFFF"
         self.autoclose = autoclose  # flag per autochiusura
 
-        # Titolo e chiusura
-        close_btn = tk.Button(self, text="X", command=self.close, fg="red")
-        close_btn.pack(anchor='ne')
+        # Titolo, annullamento e chiusura
+        top_frame = tk.Frame(self)
+        top_frame.pack(fill='x')
+        close_btn = tk.Button(top_frame, text="X", command=self.close, fg="red")
+        close_btn.pack(side='right')
+        self.cancel_btn = tk.Button(top_frame, text="Annulla", command=self.cancel_jobs, state='disabled')
+        self.cancel_btn.pack(side='right', padx=5)
 
         tk.Label(self, text=f"Link: {link}", wraplength=400).pack(pady=5)
 
@@ -54,6 +72,17 @@ class ActionTab(ttk.Frame):
         self.output_text.tag_config('warning', foreground='orange')
         self.output_text.tag_config('note', foreground='blue')
         self.output_text.tag_config('error', foreground='red')
+        # L'output dei processi arriva dal thread del motore dei job
+        self.output_pump = OutputPump(self.output_text, classify=self._output_tag)
+
+        # Avanzamento (percentuale, velocità, ETA) aggiornato sul posto, senza righe nell'output
+        self.progress_frame = tk.Frame(self)
+        self.progress_bar = ttk.Progressbar(self.progress_frame, maximum=100)
+        self.progress_bar.pack(side='left', fill='x', expand=True, padx=5)
+        self.progress_text = tk.StringVar()
+        tk.Label(self.progress_frame, textvariable=self.progress_text, width=40, anchor='w').pack(side='left')
+        self._progress = None
+        self._progress_posted = False
 
         # Stato
         self.status_label = tk.Label(self, textvariable=self.status, bg=self.status_color, justify='left')
@@ -61,12 +90,35 @@ class ActionTab(ttk.Frame):
         self.status_label.bind('<Configure>', self._update_wraplength)
 
 
+    def set_progress(self, progress):
+        # Chiamata dal thread del motore dei job: conserva solo l'ultimo stato e
+        # aggiorna la barra al massimo ogni 100 ms
+        self._progress = progress
+        if not self._progress_posted:
+            self._progress_posted = True
+            self.ui.post(self.after, 100, self._show_progress)
+
+    def _show_progress(self):
+        self._progress_posted = False
+        progress = self._progress
+        if progress is None:
+            self.progress_frame.pack_forget()
+            return
+        if not self.progress_frame.winfo_ismapped():
+            self.progress_frame.pack(fill='x', before=self.status_label)
+        if progress.percent is not None:
+            self.progress_bar.configure(mode='determinate', value=progress.percent)
+        else:
+            self.progress_bar.configure(mode='indeterminate')
+            self.progress_bar.step(5)
+        self.progress_text.set(progress.summary())
+
     def set_status(self, text, color):
-        # Aggiorna testo e colore sfondo in modo thread-safe tramite .after
+        # Aggiorna testo e colore sfondo in modo thread-safe tramite il canale della GUI
         def update():
             self.status.set(text)
             self.status_label.configure(bg=color)
-        self.status_label.after(0, update)
+        self.ui.post(update)
 
     def _update_wraplength(self, event):
         # Imposta wraplength pari alla larghezza attuale del widget meno un margine
@@ -75,58 +127,94 @@ class ActionTab(ttk.Frame):
             new_wraplength = 20  # limite minimo per evitare problemi
         self.status_label.config(wraplength=new_wraplength)
 
-    def run_action(self, action):
-        def worker():
-            self.set_status("In corso...", "#FFFFFF")
-            self.output_text.delete('1.0', tk.END)
-            filtered_url = action.filter_url(self.link)
-            cmd = action.program.replace("{url}", filtered_url)
-
-            # Aggiorniamo run_in_shell e autorun dai checkbox
-            for a, var_shell, var_autorun in self.autorun_vars:
-                if a == action:
-                    a.run_in_shell = var_shell.get()
-                    a.autorun = var_autorun.get()
-
-            try:
-                start_time = datetime.datetime.now()
-                # subprocess con stdout e stderr pipe
-                proc = subprocess.Popen(cmd, shell=action.run_in_shell,
-                                        stdout=subprocess.PIPE,
-                                        stderr=subprocess.STDOUT,
-                                        universal_newlines=True)
-                output_lines = []
-                for line in proc.stdout:
-                    self._insert_output(line)
-                    output_lines.append(line)
-                proc.wait()
-                exit_code = proc.returncode
-                end_time = datetime.datetime.now()
-                if exit_code == 0:
-                    self.set_status("Completato!", "#A9F5A9")
-                    if self.autoclose:
-                        # Chiudi la tab dopo breve delay per permettere lettura stato
-                        self.after(10000, self.close)
-                else:
-                    self.set_status(f"Terminato con codice {exit_code}", "#F5A9A9")
-
-                # chiama la callback per salvare la cronologia
-                if self.save_history_callback:
-                    self.after(0, lambda: self.save_history_callback(
-                        link=filtered_url,
-                        start_time=start_time,
-                        duration=(end_time - start_time).total_seconds(),
-                        exit_code=exit_code,
-                        outcome="OK" if exit_code == 0 else f"Errore {exit_code}",
-                        action=action,
-                        output="".join(output_lines)  # testo output
-                    ))
-            except Exception as e:
-                self.set_status(f"Errore: {e}", "#F5A9A9")
-
-        threading.Thread(target=worker, daemon=True).start()
-
-    def _insert_output(self, text):
+    def run_action(self, action, priority=PRIORITY_NORMAL):
+        filtered_url = action.filter_url(self.link)
+
+        # Aggiorniamo run_in_shell e autorun dai checkbox
+        for a, var_shell, var_autorun in self.autorun_vars:
+            if a == action:
+                a.run_in_shell = var_shell.get()
+                a.autorun = var_autorun.get()
+
+        if not self._confirm_rerun(action, filtered_url):
+            return None
+
+        self.output_pump.clear()
+        job = Job(action, filtered_url, priority=priority,
+                  on_queue_position=lambda j, pos: self.set_status(f"In coda (posizione {pos})", "#FFF5CC"),
+                  on_start=lambda j: self.set_status(f"In corso ({j.stage_text})..." if j.stage_text else "In corso...",
+                                                     "#FFFFFF"),
+                  on_output=lambda j, line: self.output_pump.put(line),
+                  on_progress=lambda j, progress: self.set_progress(progress),
+                  on_exit=self._on_job_exit)
+        # Se la stessa azione è già attiva sullo stesso url si riceve il job esistente
+        job = self.scheduler.submit(job)
+        self.jobs.append(job)
+        self.cancel_btn.configure(state='normal')
+        return job
+
+    def _confirm_rerun(self, action, url):
+        """Applica la politica di cache dell'azione: False se l'esecuzione va saltata."""
+        hit = self.result_cache.previous(action, url) if self.result_cache is not None else None
+        if hit is None:
+            return True
+        when = hit['start_time'].strftime('%Y-%m-%d %H:%M:%S')
+        if action.cache_policy == ASK and messagebox.askyesno(
+                "Già eseguito", f"'{action.label}' è già stata eseguita con successo su questo link il {when}.\n"
+                                f"Eseguirla di nuovo?", parent=self):
+            return True
+        self.set_status(f"Già eseguito il {when}: saltato", "#A9D0F5")
+        return False
+
+    def _on_job_exit(self, job):
+        # Chiamata dal thread del motore dei job
+        self.ui.post(self._job_finished, job)
+        self.set_progress(None)
+        if job.state == CANCELLED:
+            self.set_status("Annullato", "#F5A9A9")
+            return
+        if job.state == FAILED:
+            self.set_status(f"Errore: {job.error}", "#F5A9A9")
+            return
+
+        exit_code = job.exit_code
+        if exit_code == 0:
+            self.set_status("Completato!", "#A9F5A9")
+            if self.autoclose:
+                # Chiudi la tab dopo breve delay per permettere lettura stato
+                self.ui.post(self.after, 10000, self.close)
+        elif job.timed_out:
+            self.set_status(f"Interrotto: superato il timeout ({job.stage_action.limits.timeout:g}s)", "#F5A9A9")
+        else:
+            self.set_status(f"Terminato con codice {exit_code}", "#F5A9A9")
+
+        # chiama la callback per salvare la cronologia
+        if self.save_history_callback:
+            self.ui.post(lambda: self.save_history_callback(
+                link=job.url,
+                start_time=job.start_time,
+                duration=job.duration,
+                exit_code=exit_code,
+                outcome=job.outcome,
+                action=job.action,
+                output=job.output,  # coda dell'output, il resto è nel log
+                log_path=job.log_path,
+                job_id=job.id,
+                resources=job.resources
+            ))
+
+    def _job_finished(self, job):
+        if job in self.jobs:
+            self.jobs.remove(job)
+        if not self.jobs:
+            self.cancel_btn.configure(state='disabled')
+
+    def cancel_jobs(self):
+        for job in list(self.jobs):
+            self.scheduler.cancel(job)
+
+    @staticmethod
+    def _output_tag(text):
         lower = text.lower()
         tag = None
         if 'error' in lower:
@@ -135,29 +223,204 @@ class ActionTab(ttk.Frame):
             tag = 'warning'
         elif 'note' in lower:
             tag = 'note'
+        return tag
+
+    def close(self):
+        self.output_pump.stop()
+        self.close_callback(self)
+
+class BatchTab(ttk.Frame):
+    """
+    Tab per una clipboard con molti link: si sceglie un'azione e la si
+    accoda per tutti i link estratti (già filtrati e senza duplicati).
+    """
+    def __init__(self, parent, links_by_action, close_callback, save_history_callback=None, scheduler=None,
+                 result_cache=None):
+        super().__init__(parent)
+        self.links_by_action = links_by_action
+        self.batch_actions = list(links_by_action.keys())
+        self.close_callback = close_callback
+        self.save_history_callback = save_history_callback
+        self.scheduler = scheduler or JobScheduler()
+        self.result_cache = result_cache
+        self.jobs = []
+        self.ui = self.winfo_toplevel().ui
+        self._row_percent = {}
+        self.status = tk.StringVar(value="Scegli l'azione da eseguire per tutti i link")
+        self.running = False
+
+        close_btn = tk.Button(self, text="X", command=self.close, fg="red")
+        close_btn.pack(anchor='ne')
+
+        total = len({url for urls in links_by_action.values() for url in urls})
+        tk.Label(self, text=f"Link rilevati: {total}").pack(pady=5)
+
+        top = tk.Frame(self)
+        top.pack(fill='x', padx=5, pady=5)
+        self.action_combo = ttk.Combobox(top, state='readonly', width=50,
+                                         values=[f"{a.label} ({len(links_by_action[a])} link)"
+                                                 for a in self.batch_actions])
+        self.action_combo.pack(side='left', padx=5)
+        self.action_combo.bind("<<ComboboxSelected>>", lambda e: self._populate())
+        self.run_btn = tk.Button(top, text="Accoda tutti", command=self.run_batch)
+        self.run_btn.pack(side='left', padx=5)
+        self.cancel_btn = tk.Button(top, text="Annulla tutti", command=self.cancel_jobs, state='disabled')
+        self.cancel_btn.pack(side='left', padx=5)
+
+        columns = ("Link", "Stato")
+        self.tree = ttk.Treeview(self, columns=columns, show='headings')
+        self.tree.column("Link", width=400)
+        self.tree.column("Stato", width=120, anchor='center')
+        for col in columns:
+            self.tree.heading(col, text=col)
+        self.tree.pack(expand=True, fill='both', pady=5)
+        self.tree.tag_configure('success', background='#d0f0c0')
+        self.tree.tag_configure('error', background='#f7c6c7')
+
+        tk.Label(self, textvariable=self.status, justify='left').pack(fill='x', pady=5)
 
-        self.output_text.insert(tk.END, text, tag)
-        self.output_text.see(tk.END)
+        if self.batch_actions:
+            self.action_combo.current(0)
+            self._populate()
+
+    def selected_action(self):
+        idx = self.action_combo.current()
+        return self.batch_actions[idx] if idx >= 0 else None
+
+    def _populate(self):
+        if self.running:
+            return
+        self.tree.delete(*self.tree.get_children())
+        action = self.selected_action()
+        if action is None:
+            return
+        for i, url in enumerate(self.links_by_action[action]):
+            self.tree.insert('', 'end', iid=str(i), values=(url, "In attesa"))
+
+    def _set_row(self, idx, state, tag=None):
+        def update():
+            if self.tree.exists(str(idx)):
+                self.tree.set(str(idx), "Stato", state)
+                if tag:
+                    self.tree.item(str(idx), tags=(tag,))
+        self.ui.post(update)
+
+    def _set_row_progress(self, idx, progress):
+        # La riga viene aggiornata solo quando cambia la percentuale intera
+        if progress.percent is None:
+            return
+        percent = int(progress.percent)
+        if self._row_percent.get(idx) != percent:
+            self._row_percent[idx] = percent
+            self._set_row(idx, f"In corso {percent}%")
+
+    def run_batch(self):
+        action = self.selected_action()
+        if action is None or self.running:
+            return
+        self.running = True
+        self.run_btn.configure(state='disabled')
+        self.action_combo.configure(state='disabled')
+        self.cancel_btn.configure(state='normal')
+        self.results = {'ok': 0, 'errors': 0}
+
+        skipped = self._already_done(action)
+        jobs = []
+        for idx, url in enumerate(self.links_by_action[action]):
+            if idx in skipped:
+                self._set_row(idx, "Già eseguito", 'success')
+                continue
+            jobs.append(Job(action, url, priority=PRIORITY_BATCH,
+                            on_queue_position=lambda j, pos, i=idx: self._set_row(i, f"In coda ({pos})"),
+                            on_start=lambda j, i=idx: self._set_row(i, f"In corso ({j.stage_text})..."
+                                                                     if j.stage_text else "In corso..."),
+                            on_progress=lambda j, progress, i=idx: self._set_row_progress(i, progress),
+                            on_exit=lambda j, i=idx: self.ui.post(self._job_finished, i, j)))
+        if not jobs:
+            self.cancel_btn.configure(state='disabled')
+            self.status.set(f"Tutti i {len(skipped)} link sono già stati eseguiti")
+            return
+        self.status.set(f"{action.label}: {len(jobs)} link in coda, {len(skipped)} già eseguiti")
+        self.jobs = self.scheduler.submit_many(jobs)
+
+    def _already_done(self, action):
+        """Indici dei link da saltare secondo la politica di cache dell'azione."""
+        if self.result_cache is None:
+            return set()
+        done = {idx for idx, url in enumerate(self.links_by_action[action])
+                if self.result_cache.previous(action, url) is not None}
+        if done and action.cache_policy == ASK and messagebox.askyesno(
+                "Già eseguiti", f"{len(done)} link sono già stati elaborati con '{action.label}'.\n"
+                                f"Eseguirli di nuovo?", parent=self):
+            return set()
+        return done
+
+    def _job_finished(self, idx, job):
+        if job.state == CANCELLED:
+            self.results['errors'] += 1
+            self._set_row(idx, "Annullato", 'error')
+        elif job.state == FAILED:
+            self.results['errors'] += 1
+            self._set_row(idx, "Errore", 'error')
+        else:
+            ok = job.exit_code == 0
+            self.results['ok' if ok else 'errors'] += 1
+            self._set_row(idx, job.outcome, 'success' if ok else 'error')
+            if self.save_history_callback:
+                self.save_history_callback(
+                    link=job.url,
+                    start_time=job.start_time,
+                    duration=job.duration,
+                    exit_code=job.exit_code,
+                    outcome=job.outcome,
+                    action=job.action,
+                    output=job.output,
+                    log_path=job.log_path,
+                    job_id=job.id,
+                    resources=job.resources)
+
+        done = self.results['ok'] + self.results['errors']
+        if done == len(self.jobs):
+            self.cancel_btn.configure(state='disabled')
+            self.status.set(f"Completato: {self.results['ok']} OK, {self.results['errors']} errori")
+        else:
+            self.status.set(f"{job.action.label}: {done}/{len(self.jobs)}")
+
+    def cancel_jobs(self):
+        for job in self.jobs:
+            self.scheduler.cancel(job)
 
     def close(self):
         self.close_callback(self)
 
+
 class ClipboardGUI(tk.Tk):
-    def __init__(self, actions):
+    def __init__(self, actions, scheduler=None, history_store=None, result_cache=None, config_watcher=None):
         super().__init__()
         self.title("Clipboard Link Handler")
         self.geometry("640x480")
+        # Canale thread-safe per gli eventi dei job e del monitor (usato anche dalle tab)
+        self.ui = UiChannel(self)
         self.actions = actions
+        # Tutte le esecuzioni passano dallo stesso scheduler
+        self.scheduler = scheduler or JobScheduler()
         self.tabs = []
-        self.history = []
+        # Cronologia persistente (SQLite)
+        if history_store is None:
+            from history_store import HistoryStore
+            history_store = HistoryStore()
+        self.history_store = history_store
+        self.result_cache = result_cache or self.scheduler.result_cache
+        # Se presente, ricarica il file di configurazione quando cambia
+        self.config_watcher = config_watcher
+        # Job già salvati nella cronologia (più tab possono condividere lo stesso job)
+        self._saved_jobs = set()
 
         # Notebook e aggiunta tab storico
         self.notebook = ttk.Notebook(self)
         self.notebook.pack(expand=1, fill='both')
 
-        # self.history_tab = self.build_history_tab()
-        # self.notebook.add(self.history_tab, text="Storico")
-        self.history_viewer = HistoryViewer(self.notebook, self.history)
+        self.history_viewer = HistoryViewer(self.notebook, self.history_store)
         self.notebook.add(self.history_viewer, text="Storico")
 
         # Frame superiore con combobox e checkbox
@@ -177,14 +440,7 @@ class ClipboardGUI(tk.Tk):
         self.autoclose_check.pack(side='left', padx=10)
 
         # Imposta valore iniziale autorun
-        found_autorun = False
-        for a in self.actions:
-            if a.autorun:
-                self.autorun_var.set(a.label)
-                found_autorun = True
-                break
-        if not found_autorun:
-            self.autorun_var.set("Nessuna")
+        self._sync_autorun_combo()
 
         # Valore iniziale per autoclose
         self.autoclose_var.set(False)
@@ -202,23 +458,15 @@ class ClipboardGUI(tk.Tk):
             "Gian Michele Pasinelli": "https://www.paypal.me/gianmichelepasinelli"
         }
         self.author = None
-
-    def build_history_tab(self):
-        frame = tk.Frame(self)
-        columns = ("Link", "Data/Ora", "Durata", "Esito")
-
-        self.tree = ttk.Treeview(frame, columns=columns, show='headings')
-        for col in columns:
-            self.tree.heading(col, text=col)
-            self.tree.column(col, anchor='w')
-
-        self.tree.pack(expand=True, fill='both')
-
-        # On double-click: riapri tab chiuso associato
-        self.tree.bind("<Double-1>", self.reopen_tab_from_history)
-        return frame
-
-    def save_to_history(self, link, start_time, duration, exit_code, outcome, action, output):
+        # Finestre secondarie, create alla prima apertura e poi riusate
+        self._windows = {}
+
+    def save_to_history(self, link, start_time, duration, exit_code, outcome, action, output, log_path=None,
+                        job_id=None, resources=None):
+        if job_id is not None:
+            if job_id in self._saved_jobs:
+                return
+            self._saved_jobs.add(job_id)
         record = {
             "link": link,
             "start_time": start_time,
@@ -226,53 +474,43 @@ class ClipboardGUI(tk.Tk):
             "exit_code": exit_code,
             "outcome": outcome,
             "action": action,
-            "output": output
+            "action_label": getattr(action, 'label', action),
+            "output": output,
+            "log_path": log_path,
+            "resources": resources
         }
-        self.history.append(record)
+        # Salvataggio asincrono, la vista riceve il record con il suo id
+        record['id'] = self.history_store.add(record)
 
         # Aggiungi record e aggiorna vista
         if hasattr(self, 'history_viewer'):
             self.history_viewer.add_record(record)
 
-        # # Inserisci nella treeview
-        # readable_time = start_time.strftime("%Y-%m-%d %H:%M:%S")
-        # duration_str = f"{duration:.1f}s"
-        # status = "OK" if exit_code == 0 else f"Errore {exit_code}"
-        # self.tree.insert('', 'end', values=(link, readable_time, duration_str, status))
-
-    def reopen_tab_from_history(self, event):
-        item = self.tree.selection()[0]
-        idx = self.tree.index(item)
-        record = self.history[idx]
-
-        # Ricrea un tab di ActionTab con output già pronto
-        self.open_history_tab(record)
-
-    def open_history_tab(self, record):
-        tab = tk.Frame(self.notebook)
-        # Mostra dettagli e output già salvato
-        tk.Label(tab, text=f"Link: {record['link']}").pack(anchor='w')
-        tk.Label(tab, text=f"Avviato: {record['start_time'].strftime('%Y-%m-%d %H:%M:%S')}").pack(anchor='w')
-        tk.Label(tab, text=f"Durata: {record['duration']:.1f}s").pack(anchor='w')
-        tk.Label(tab, text=f"Esito: {record['outcome']}").pack(anchor='w')
-
-        output = tk.Text(tab, height=10, wrap='word')
-        output.pack(expand=True, fill='both')
-        output.insert('1.0', record['output'])
-        output.config(state='disabled')
-
-        # Frame per i bottoni
-        btn_frame = tk.Frame(tab)
-        btn_frame.pack(anchor='w', pady=4)
-
-        copy_btn = tk.Button(btn_frame, text="Copia link", command=lambda: self.clipboard_append(record['link']))
-        copy_btn.pack(side='left', padx=5)
-
-        close_btn = tk.Button(btn_frame, text="Chiudi", command=lambda: self.close_tab(tab))
-        close_btn.pack(side='left', padx=5)
+    def save_job_to_history(self, job):
+        """Salva un job terminato avviato senza tab (es. dall'API locale)."""
+        if job.state in (CANCELLED, FAILED):
+            return
+        self.save_to_history(link=job.url, start_time=job.start_time, duration=job.duration,
+                             exit_code=job.exit_code, outcome=job.outcome, action=job.action, output=job.output,
+                             log_path=job.log_path, job_id=job.id, resources=job.resources)
 
-        self.notebook.add(tab, text="Storico Dettaglio")
-        self.notebook.select(tab)
+    def _sync_autorun_combo(self):
+        self.labels = ["Nessuna"] + [a.label for a in self.actions]
+        self.autorun_combo.configure(values=self.labels)
+        autorun = next((a.label for a in self.actions if a.autorun), "Nessuna")
+        self.autorun_var.set(autorun)
+
+    def set_actions(self, actions):
+        """
+        Sostituisce le azioni (nuova configurazione) con un unico
+        assegnamento: il monitor legge self.actions a ogni evento, quindi
+        dal successivo usa già le nuove regole. Da chiamare nel thread di Tk.
+        """
+        if actions is self.actions:
+            return
+        self.actions = actions
+        self.on_autoclose_changed()
+        self._sync_autorun_combo()
 
     def on_autorun_selected(self, event):
         selected_label = self.autorun_var.get()
@@ -314,6 +552,7 @@ class ClipboardGUI(tk.Tk):
         filemenu = tk.Menu(menubar, tearoff=0)
         filemenu.add_command(label="Apri Configurazione", command=self.select_config)
         filemenu.add_command(label="Mostra Configurazione", command=self.show_config_summary)
+        filemenu.add_command(label="Statistiche", command=self.show_stats)
         filemenu.add_separator()
         filemenu.add_command(label="Esci", command=self.quit)
         menubar.add_cascade(label="File", menu=filemenu)
@@ -332,8 +571,17 @@ class ClipboardGUI(tk.Tk):
 
         self.config(menu=menubar)
 
+    def _raise_window(self, name):
+        """Se la finestra `name` è già aperta la porta in primo piano e ritorna True."""
+        win = self._windows.get(name)
+        if win is not None and win.winfo_exists():
+            win.deiconify()
+            win.lift()
+            return True
+        return False
+
     def show_config_summary(self):
-        # import tkinter.scrolledtext as scrolledtext
+        from tkinter import scrolledtext
 
         win = tk.Toplevel(self)
         win.title("Riepilogo configurazione")
@@ -389,7 +637,14 @@ class ClipboardGUI(tk.Tk):
             program_line = f"      Programma: {action.program}\n"
             filter_line = f"      Filtro: {getattr(action, 'filter_name', '')}\n"
             st.insert(tk.END, program_line, 'label')
+            for k, stage in enumerate(getattr(action, 'stages', [])[1:], 2):
+                pool = f" [pool {stage.pool}]" if stage.pool else ""
+                st.insert(tk.END, f"      Fase {k} ({stage.label}){pool}: {stage.program}\n", 'label')
             st.insert(tk.END, filter_line, 'label')
+            self._insert_regex_cost(st, action.pattern, regex_cost.RULE)
+            filter_spec = action.filters.get(action.filter_name) if action.filter_name else None
+            if filter_spec is not None:
+                self._insert_regex_cost(st, filter_spec[0], regex_cost.FILTER)
 
         st.configure(state='disabled')
 
@@ -398,18 +653,132 @@ class ClipboardGUI(tk.Tk):
         # st.config(xscrollcommand=lambda *args: st.xview(*args))
         st['wrap'] = 'none'
 
+    def _insert_regex_cost(self, st, pattern, kind):
+        # Costo misurato al caricamento ([REGEX]) e stato del budget
+        guard = regex_cost.guard_for(pattern, kind)
+        profile = guard.profile
+        if profile is not None:
+            cost = profile.summary()
+        else:
+            cost = "misura in corso" if guard.profiling else "non misurato (profile = false)"
+        st.insert(tk.END, f"      Costo {kind}: {cost}\n", 'label')
+        for risk in profile.risks if profile is not None else regex_cost.risky_constructs(pattern):
+            st.insert(tk.END, f"        ! {risk}\n", 'bool_false')
+        if guard.quarantined:
+            st.insert(tk.END, f"        SOSPESA: oltre il budget di {guard.budget * 1000:g} ms "
+                              f"({guard.violations} volte)\n", 'bool_false')
+
+    def show_stats(self):
+        # Metriche di esecuzione (metrics.REGISTRY), aggiornate ogni secondo
+        if self._raise_window('stats'):
+            return
+        from metrics import REGISTRY
+        win = tk.Toplevel(self)
+        self._windows['stats'] = win
+        win.title("Statistiche")
+        win.geometry("900x400")
+
+        columns = ('metric', 'labels', 'count', 'value', 'mean', 'p50', 'p95')
+        headings = ('Metrica', 'Etichette', 'Conteggio', 'Valore / Totale', 'Media', 'p50', 'p95')
+        tree = ttk.Treeview(win, columns=columns, show='headings')
+        for column, heading in zip(columns, headings):
+            tree.heading(column, text=heading)
+            tree.column(column, width=240 if column == 'metric' else 90, anchor='w' if column in ('metric', 'labels') else 'e')
+        tree.column('labels', width=200)
+        scrollbar = ttk.Scrollbar(win, orient='vertical', command=tree.yview)
+        tree.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side='right', fill='y')
+        tree.pack(expand=True, fill='both', padx=10, pady=10)
+
+        def fmt(value, seconds):
+            if value is None:
+                return ""
+            if seconds:
+                return f"{value * 1000:.2f} ms" if value < 10 else f"{value:.1f} s"
+            return f"{value:g}"
+
+        def refresh():
+            if not win.winfo_exists():
+                return
+            rows = REGISTRY.snapshot()
+            tree.delete(*tree.get_children())
+            for row in rows:
+                seconds = row['name'].endswith('_seconds')
+                labels = ", ".join(f"{k}={v}" for k, v in row['labels'].items())
+                tree.insert('', 'end', values=(
+                    row['name'].replace('link_monitor_', ''), labels,
+                    "" if row['count'] is None else row['count'],
+                    fmt(row['value'], seconds), fmt(row['mean'], seconds),
+                    fmt(row['p50'], seconds), fmt(row['p95'], seconds)))
+            win.after(1000, refresh)
+
+        refresh()
+
     def select_config(self):
+        from tkinter import filedialog
         path = filedialog.askopenfilename(filetypes=[("Config files", "*.ini"), ("All files", "*.*")])
         if path:
-            from config import load_config
-            self.actions = load_config(path)
+            if self.config_watcher is not None:
+                self.config_watcher.set_path(path)
+            else:
+                from config import load_config
+                self.set_actions(load_config(path))
             messagebox.showinfo("Config caricato", f"Configurazione caricata da:\n{path}")
 
     def show_help(self):
+        if self._raise_window('help'):
+            return
+        from tkinter import scrolledtext
         help_text = (
             "Guida all'uso del programma e configurazione del file INI:\n\n"
             "Il file di configurazione è suddiviso in più sezioni per una maggiore modularità:\n\n"
 
+            "[MONITOR] (opzionale)\n"
+            "- backend = auto | x11 | wayland | poll: sorgente della clipboard.\n"
+            "- poll_min_interval / poll_max_interval = limiti (secondi) del polling adattivo.\n"
+            "- poll_backoff = fattore di rallentamento quando la clipboard non cambia.\n"
+            "- poll_burst = letture al minimo intervallo dopo ogni cambio.\n"
+            "- max_clipboard_chars = oltre questa dimensione il contenuto viene ignorato (oversize = skip)\n"
+            "  o troncato (oversize = truncate).\n"
+            "- max_scan_chars = caratteri massimi analizzati dalle regex.\n\n"
+
+            "[LIMITS] (opzionale)\n"
+            "- max_jobs = numero massimo di programmi in esecuzione contemporanea.\n"
+            "- <nome programma di [DICT_PROGRAMS]> = esecuzioni contemporanee per quel programma.\n"
+            "- <pool> = esecuzioni contemporanee delle fasi con poolN (o poolN_K) = pool.\n"
+            "- Le esecuzioni oltre il limite restano in coda (la posizione è mostrata nella tab).\n\n"
+
+            "[HISTORY] (opzionale)\n"
+            "- db_path = file SQLite in cui viene salvata la cronologia (default ~/.link_monitor/history.db).\n"
+            "- log_dir = cartella dei log completi di ogni esecuzione (default ~/.link_monitor/logs).\n"
+            "- compress_logs = true per comprimere i log (gzip).\n"
+            "- tail_lines = righe finali di output conservate nella cronologia.\n\n"
+
+            "[METRICS] (opzionale)\n"
+            "- port = porta su cui esportare le metriche in formato Prometheus\n"
+            "  (http://127.0.0.1:<port>/metrics); 0 = disattivato.\n"
+            "- Le stesse metriche (tempi di lettura della clipboard e delle regex, latenza dalla copia\n"
+            "  alle azioni, avvio dei processi, prima riga di output, durata ed exit code dei job,\n"
+            "  job in coda e in esecuzione) sono visibili da File → Statistiche.\n\n"
+
+            "[TRACING] (opzionale)\n"
+            "- enabled = true per registrare la traccia di ogni sessione (oppure avviare con --trace).\n"
+            "- trace_dir = cartella delle tracce (default ~/.link_monitor/traces).\n"
+            "- La traccia (formato Chrome, da aprire con chrome://tracing o ui.perfetto.dev) mostra per\n"
+            "  ogni copia la lettura della clipboard, il match, l'attesa di Tk, la costruzione della tab,\n"
+            "  i filtri, l'avvio del processo, la prima riga di output e l'uscita.\n\n"
+
+            "[REGEX] (opzionale)\n"
+            "- budget_ms = tempo massimo di una valutazione di una regex di [LINKS] o [FILTERS].\n"
+            "- quarantine = secondi per cui una regex oltre il budget viene sospesa (0 = finché non\n"
+            "  viene modificata); le regole sospese non fanno match e i filtri sospesi lasciano il link invariato.\n"
+            "- strikes = quante valutazioni oltre il budget (nelle ultime 20) servono per la sospensione.\n"
+            "- profile = true per misurare ogni regex al caricamento su testi costruiti per il caso\n"
+            "  peggiore: le regex che lo superano analizzano solo i primi caratteri del testo\n"
+            "  (o ignorano i testi più lunghi, se usano $ o lookahead).\n"
+            "- profile_chars = lunghezza massima dei testi usati per la misura.\n"
+            "- Il costo e i costrutti a rischio (es. (a+)+, .*x.*y) sono in File → Mostra Configurazione.\n\n"
+
             "[DICT_REGEX]\n"
             "- Qui si definiscono le espressioni regolari con un nome identificativo.\n"
             "- Ad esempio:\n"
@@ -438,29 +807,68 @@ class ClipboardGUI(tk.Tk):
             "  * labelN = testo del pulsante mostrato nella GUI\n"
             "  * filterN = nome filtro da applicare (opzionale)\n\n"
 
+            "  * cacheN = skip | ask | force: cosa fare se l'azione è già stata eseguita con successo\n"
+            "    sullo stesso link (default da [CACHE] default_policy, con validità ttl secondi)\n"
+            "  * niceN = priorità CPU del programma (-20..19, es. 10)\n"
+            "  * ioniceN = priorità disco: idle | best-effort[:0-7] | realtime[:0-7] (solo Linux)\n"
+            "  * rlimitN = limiti del processo, es. as=2G, cpu=600, nofile=1024 (solo Linux)\n"
+            "  * timeoutN = secondi massimi di esecuzione; poi il programma viene terminato\n"
+            "  * parserN = auto | plain | raw | yt-dlp | ffmpeg: come leggere l'output. Le righe di\n"
+            "    avanzamento (riscritte con \\r) aggiornano la barra della scheda e nella cronologia\n"
+            "    resta solo l'ultimo stato; raw conserva ogni riga (default auto, in base al programma)\n"
+            "  * poolN = voce di [LIMITS] che limita le esecuzioni contemporanee (default: il programma)\n\n"
+
+            "Pipeline (più fasi per azione):\n"
+            "  * programN_2, programN_3, ... = fasi eseguite in ordine dopo programN, ognuna solo se la\n"
+            "    precedente termina con successo. {prev} = ultima riga di output della fase precedente\n"
+            "    (es. il percorso del file prodotto)\n"
+            "  * labelN_K, poolN_K, run_in_shellN_K, niceN_K, ioniceN_K, rlimitN_K, timeoutN_K, parserN_K\n"
+            "    = come sopra, per la fase K\n"
+            "  * Ogni fase torna in coda con i limiti del proprio pool: con più link le fasi si\n"
+            "    sovrappongono (un link converte mentre il successivo scarica).\n\n"
+
             "Esempio di configurazione di un'azione:\n"
             "  regex1 = youtube_download\n"
             "  program1 = program_yt -f 249 -x --paths \"C:\\Users\\Pasinelli\\Desktop\\Archivio\\Script\\yt-dl\\Download\" --audio-format mp3 --audio-quality 6 -k {url}\n"
             "  label1 = Scarica come musica mp3 249\n"
             "  filter1 = yt\n\n"
 
+            "Esempio di pipeline (scarica, poi converte il file scaricato):\n"
+            "  program2 = program_yt --print after_move:filepath {url}\n"
+            "  pool2 = download\n"
+            "  program2_2 = ffmpeg -i {prev} {prev}.opus\n"
+            "  pool2_2 = transcode\n"
+            "  con [LIMITS] download = 2 e transcode = 1\n\n"
+
             "Note importanti:\n"
             "- Il placeholder {url} viene sostituito automaticamente con il link filtrato.\n"
+            "  Sono disponibili anche {host}, {scheme}, {port}, {path}, {query}, {fragment}, {id}\n"
+            "  (numero del job) e {prev} (pipeline); {{ e }} diventano { e }. Le altre graffe\n"
+            "  (es. {} di yt-dlp --exec) restano invariate.\n"
+            "- Il programma viene avviato direttamente, senza shell: gli argomenti con spazi vanno tra\n"
+            "  virgolette. Con run_in_shellN = true il comando passa invece dalla shell e i valori\n"
+            "  dei segnaposto vengono quotati per la shell.\n"
+            "- Un'azione con un programma non valido (es. virgolette non chiuse) viene ignorata.\n"
             "- Puoi definire più azioni con diverse opzioni di download o programmi.\n"
             "- I filtri modificano il link prima di passarlo al programma (es. rimuovendo parametri non necessari).\n"
-            "- Puoi caricare diversi file di configurazione dal menu File → Apri Configurazione.\n\n"
+            "- Puoi caricare diversi file di configurazione dal menu File → Apri Configurazione.\n"
+            "- Le modifiche al file di configurazione vengono applicate subito, senza riavviare\n"
+            "  (tranne il backend della clipboard).\n\n"
 
             "Funzionalità del programma:\n"
             "- Monitora la clipboard e rileva link compatibili con le regex configurate.\n"
+            "- Se la clipboard contiene più link (almeno bulk_min_links in [MONITOR]) apre una tab Batch\n"
+            "  da cui accodare un'azione per tutti i link, senza duplicati.\n"
             "- Mostra i pulsanti corrispondenti per eseguire i programmi configurati.\n"
             "- Permette di impostare un'esecuzione automatica per un'azione specifica.\n"
-            "- Mostra l'output del programma con evidenziazione di warning, note ed errori.\n\n"
+            "- Mostra l'output del programma con evidenziazione di warning, note ed errori.\n"
+            "- Per ogni esecuzione registra in cronologia CPU (utente/sistema), memoria massima e byte\n"
+            "  letti/scritti su disco, visibili selezionando il record.\n\n"
 
             "Per ulteriori informazioni, contatta l'autore o consulta la documentazione ufficiale."
         )
-        # import tkinter.scrolledtext as scrolledtext
-
         help_win = tk.Toplevel(self)
+        self._windows['help'] = help_win
         help_win.title("Guida all'uso")
         help_win.geometry("600x450")
 
@@ -471,7 +879,11 @@ class ClipboardGUI(tk.Tk):
 
     def show_authors(self):
         # Finestra semplice con autori e link donazione cliccabili
+        if self._raise_window('authors'):
+            return
+        import webbrowser
         win = tk.Toplevel(self)
+        self._windows['authors'] = win
         win.title("Autori e Donazioni")
         tk.Label(win, text="Seleziona un autore per aprire la pagina di donazione:", pady=10).pack()
 
@@ -484,7 +896,12 @@ class ClipboardGUI(tk.Tk):
         messagebox.showinfo("Info", "Clipboard Link Handler\nVersione 1.0\nCreato da Gian Michele Pasinelli\ncaludia@tiscali.it")
 
     def show_actions_for_link(self, link):
-        matches = [a for a in self.actions if a.pattern.match(link)]
+        with TRACER.span('show_actions_for_link'):
+            self._show_actions_for_link(link)
+
+    def _show_actions_for_link(self, link):
+        # Il risultato è già in cache se il link arriva dal monitor
+        matches = self.actions.match(link)
         if not matches:
             return
 
@@ -495,7 +912,9 @@ class ClipboardGUI(tk.Tk):
                 messagebox.showwarning("Attenzione", "Più azioni con autorun trovate, verrà eseguita la prima.")
             action = autorun_matches[0]
             # Apri tab con solo l'azione autorun e lanciala subito
-            tab = ActionTab(self.notebook, link, matches, self.close_tab, save_history_callback=self.save_to_history, autoclose=action.autoclose)
+            tab = ActionTab(self.notebook, link, matches, self.close_tab, save_history_callback=self.save_to_history,
+                            autoclose=action.autoclose, scheduler=self.scheduler,
+                            result_cache=self.result_cache)
             self.notebook.add(tab, text=link[:20] + " (Auto)")
             self.tabs.append(tab)
             self.notebook.select(tab)
@@ -503,16 +922,31 @@ class ClipboardGUI(tk.Tk):
             return
 
         # Altrimenti mostra tutte le azioni
-        tab = ActionTab(self.notebook, link, matches, self.close_tab, save_history_callback=self.save_to_history, autoclose=self.autoclose_var.get())
+        tab = ActionTab(self.notebook, link, matches, self.close_tab, save_history_callback=self.save_to_history,
+                        autoclose=self.autoclose_var.get(), scheduler=self.scheduler,
+                        result_cache=self.result_cache)
         self.notebook.add(tab, text=link[:20] + "...")
         self.tabs.append(tab)
         self.notebook.select(tab)
 
+    def show_batch_for_links(self, links_by_action):
+        if not links_by_action:
+            return
+        total = len({url for urls in links_by_action.values() for url in urls})
+        with TRACER.span('show_batch_for_links', links=total):
+            self._show_batch_tab(links_by_action, total)
+
+    def _show_batch_tab(self, links_by_action, total):
+        tab = BatchTab(self.notebook, links_by_action, self.close_tab, save_history_callback=self.save_to_history,
+                       scheduler=self.scheduler, result_cache=self.result_cache)
+        self.notebook.add(tab, text=f"Batch ({total} link)")
+        self.tabs.append(tab)
+        self.notebook.select(tab)
+
     def close_tab(self, tab):
         # Primo, controlla che il tab non sia quello storico
         if tab == self.history_viewer:
             # Ignora chiusura dello storico
-            print("Tentativo di chiudere lo storico ignorato")
             return
 
         # Altrimenti chiudi il tab normalmente
@@ -524,10 +958,132 @@ class ClipboardGUI(tk.Tk):
         # self.tabs.remove(tab)
 
 
+class LazyLogView:
+    """
+    Mostra in un Text l'output di un record di cronologia: se esiste il log
+    su disco lo carica una pagina alla volta (pulsante "Carica altro"),
+    altrimenti mostra l'output conservato nel record.
+    """
+    def __init__(self, text_widget, more_button, page_size=LOG_PAGE_SIZE):
+        self.text = text_widget
+        self.more_button = more_button
+        self.page_size = page_size
+        self.reader = None
+        self.offset = 0
+        # Testo da evidenziare (es. la ricerca attiva nella cronologia)
+        self.highlight = None
+        self.text.tag_config('match', background='yellow')
+        self.more_button.configure(command=self.load_more)
+
+    def show(self, record):
+        self.text.config(state='normal')
+        self.text.delete('1.0', tk.END)
+        self.text.config(state='disabled')
+        if self.reader is not None:
+            self.reader.close()
+        log_path = record.get('log_path')
+        if log_path and os.path.isfile(log_path):
+            self.reader = LogReader(log_path)
+            self.offset = 0
+            self.load_more()
+        else:
+            self.reader = None
+            self._append(record.get('output') or "")
+            self.more_button.configure(state='disabled')
+
+    def load_more(self):
+        if self.reader is None:
+            return
+        try:
+            text, self.offset = self.reader.read_page(self.offset, self.page_size)
+            has_more = bool(text) and self.offset < self.reader.size()
+        except OSError as e:
+            text, has_more = f"\n[Impossibile leggere il log: {e}]\n", False
+        self._append(text)
+        self.more_button.configure(state='normal' if has_more else 'disabled')
+
+    def _append(self, text):
+        start = self.text.index('end-1c')
+        self.text.config(state='normal')
+        self.text.insert(tk.END, text)
+        self.text.config(state='disabled')
+        self._highlight(start)
+
+    def _highlight(self, start):
+        if not self.highlight:
+            return
+        count = tk.IntVar()
+        index = start
+        while True:
+            index = self.text.search(self.highlight, index, stopindex=tk.END, nocase=True, count=count)
+            if not index or not count.get():
+                break
+            end = f"{index}+{count.get()}c"
+            self.text.tag_add('match', index, end)
+            index = end
+        # Mostra la prima occorrenza
+        first = self.text.tag_nextrange('match', '1.0')
+        if first and start == '1.0':
+            self.text.see(first[0])
+
+
 class HistoryViewer(tk.Frame):
-    def __init__(self, parent, history_records=None):
+    """
+    Vista della cronologia virtualizzata: la Treeview contiene solo una
+    finestra di al massimo `max_pages` pagine, le altre vengono chieste
+    allo store durante lo scorrimento. Ordinamento e filtri sono eseguiti
+    da SQLite; gli iid delle righe sono gli id stabili dei record.
+    """
+    # colonna visualizzata -> colonna dello store
+    COLUMNS = {
+        "Data/Ora": 'start_time',
+        "Link": 'link',
+        "Azione": 'action_label',
+        "Durata": 'duration',
+        "Esito": 'exit_code',
+    }
+    FILTERS = {
+        "Testo": 'text',
+        "Link": 'link',
+        "Azione": 'action_label',
+        "Esito": 'outcome',
+    }
+
+    def __init__(self, parent, history_store, page_size=100, max_pages=3):
         super().__init__(parent)
-        self.history = history_records if history_records is not None else []
+        self.history_store = history_store
+        self.page_size = page_size
+        self.max_rows = page_size * max_pages
+        self.order_by = 'start_time'
+        self.descending = True
+        self.filters = {}
+        self.total = 0
+        # Posizione (nei risultati della query) della prima riga caricata
+        self.window_start = 0
+        self._loading = False
+        self._filter_after_id = None
+        # Le letture dallo store (prima pagina e pagine vicine) avvengono in un thread dedicato
+        self._generation = 0
+        self._select_first = True
+        self._reload_requests = queue.Queue()
+        # I risultati arrivano a Tk dal canale thread-safe della finestra principale
+        self.ui = self.winfo_toplevel().ui
+        threading.Thread(target=self._reload_loop, daemon=True).start()
+
+        # Barra filtri
+        filter_frame = tk.Frame(self)
+        filter_frame.pack(fill='x', padx=5, pady=2)
+        tk.Label(filter_frame, text="Cerca:").pack(side='left')
+        self.filter_column = ttk.Combobox(filter_frame, values=list(self.FILTERS), state='readonly', width=10)
+        self.filter_column.current(0)
+        self.filter_column.pack(side='left', padx=5)
+        self.filter_var = tk.StringVar()
+        filter_entry = ttk.Entry(filter_frame, textvariable=self.filter_var, width=30)
+        filter_entry.pack(side='left', padx=5)
+        self.filter_var.trace_add('write', lambda *args: self._schedule_filter())
+        self.filter_column.bind("<<ComboboxSelected>>", lambda e: self._schedule_filter())
+        self.count_label = tk.Label(filter_frame, text="")
+        self.count_label.pack(side='right')
 
         # Divide in due pannelli con PanedWindow or Frame
         paned = ttk.Panedwindow(self, orient='horizontal')
@@ -537,78 +1093,264 @@ class HistoryViewer(tk.Frame):
         left_frame = ttk.Frame(paned, width=400, relief='sunken')
         paned.add(left_frame, weight=1)
 
-        columns = ("Data/Ora", "Link", "Durata")
+        columns = tuple(self.COLUMNS)
         self.tree = ttk.Treeview(left_frame, columns=columns, show='headings', selectmode='browse')
         self.tree.pack(fill='both', expand=True, side='left')
 
         # Configura colonne (larghezza indicativa)
         self.tree.column("Data/Ora", width=140)
         self.tree.column("Link", width=200)
+        self.tree.column("Azione", width=120)
         self.tree.column("Durata", width=70, anchor='center')
+        self.tree.column("Esito", width=70, anchor='center')
 
         for col in columns:
-            self.tree.heading(col, text=col)
+            self.tree.heading(col, text=col, command=lambda c=col: self.sort_by(c))
 
-        # Scrollbar verticale per Treeview
-        vsb = ttk.Scrollbar(left_frame, orient="vertical", command=self.tree.yview)
-        vsb.pack(side='right', fill='y')
-        self.tree.configure(yscrollcommand=vsb.set)
+        # Scrollbar verticale per Treeview: carica le pagine vicine ai bordi
+        self.vsb = ttk.Scrollbar(left_frame, orient="vertical", command=self.tree.yview)
+        self.vsb.pack(side='right', fill='y')
+        self.tree.configure(yscrollcommand=self._on_tree_scroll)
 
         # Definisci tag per colore riga
         self.tree.tag_configure('success', background='#d0f0c0')  # verde chiaro
         self.tree.tag_configure('error', background='#f7c6c7')    # rosso chiaro
 
-        # Inserisci dati
-        for i, rec in enumerate(self.history):
-            tag = 'success' if rec['exit_code'] == 0 else 'error'
-            self.tree.insert('', 'end', iid=str(i), values=(
-                rec['start_time'].strftime("%Y-%m-%d %H:%M:%S"),
-                rec['link'] if len(rec['link']) < 40 else rec['link'][:37] + "...",
-                f"{rec['duration']:.1f}s",
-                "OK" if rec['exit_code'] == 0 else "ERRORE"
-            ), tags=(tag,))
-
         # Destra: Text per output
         right_frame = ttk.Frame(paned, relief='sunken')
         paned.add(right_frame, weight=2)
 
+        # Risorse usate dal job selezionato
+        self.usage_label = tk.Label(right_frame, text="", anchor='w', justify='left')
+        self.usage_label.pack(side='top', fill='x')
         self.output_text = tk.Text(right_frame, wrap='word', state='disabled')
         self.output_text.pack(fill='both', expand=True)
         # Scrollbar verticale per output
         out_vsb = ttk.Scrollbar(right_frame, orient='vertical', command=self.output_text.yview)
         out_vsb.pack(side='right', fill='y')
         self.output_text.configure(yscrollcommand=out_vsb.set)
+        self.more_btn = ttk.Button(right_frame, text="Carica altro")
+        self.more_btn.pack(side='bottom', fill='x')
+        self.log_view = LazyLogView(self.output_text, self.more_btn)
 
         # Bind selezione Treeview
         self.tree.bind("<<TreeviewSelect>>", self.on_tree_select)
 
-        # Selezione iniziale (prima voce se esiste)
-        if self.history:
-            self.tree.selection_set("0")
-            self.show_output(0)
-
-    def add_record(self, record):
-        idx = len(self.history)
-        self.history.append(record)
-
-        tag = 'success' if record['exit_code'] == 0 else 'error'
+        # All'avvio solo la prima pagina (i record più recenti), letta in background
+        self.count_label.configure(text="Caricamento...")
+        self.reload()
+
+    # --- caricamento a finestra -------------------------------------------
+
+    def reload(self):
+        """
+        Ricarica dalla prima pagina. Conteggio e query vengono eseguiti nel
+        thread di caricamento, la Treeview si aggiorna quando arrivano.
+        """
+        self._generation += 1
+        self._reload_requests.put(('reload', self._generation, None, 0, self.order_by, self.descending,
+                                   dict(self.filters)))
+
+    def _request_page(self, direction, offset):
+        # Pagina vicina ('next' o 'prev') della finestra: letta dal thread di caricamento
+        self._loading = True
+        self._reload_requests.put(('page', self._generation, direction, offset, self.order_by, self.descending,
+                                   dict(self.filters)))
+
+    def _reload_loop(self):
+        while True:
+            requests = [self._reload_requests.get()]
+            while not self._reload_requests.empty():
+                requests.append(self._reload_requests.get_nowait())
+            # Una ricarica rende superate le richieste precedenti: resta l'ultima
+            reloads = [i for i, request in enumerate(requests) if request[0] == 'reload']
+            if reloads:
+                requests = requests[reloads[-1]:]
+            for request in requests:
+                self._serve(request)
+
+    def _serve(self, request):
+        kind, generation, direction, offset, order_by, descending, filters = request
+        try:
+            total = self.history_store.count(filters) if kind == 'reload' else None
+            records = self.history_store.query(offset, self.page_size, order_by, descending, filters)
+        except Exception as e:
+            print(f"Errore lettura cronologia: {e}", file=sys.stderr)
+            self.ui.post(self._show_error, generation, f"Errore lettura cronologia: {e}")
+            return
+        if kind == 'reload':
+            self.ui.post(self._show_first_page, generation, total, records)
+        else:
+            self.ui.post(self._show_page, generation, direction, offset, records)
+
+    def _show_error(self, generation, message):
+        if generation == self._generation and self.winfo_exists():
+            self._loading = False
+            self.count_label.configure(text=message)
+
+    def _show_first_page(self, generation, total, records):
+        if generation != self._generation or not self.winfo_exists():
+            return
+        # Le pagine chieste prima della ricarica vengono scartate (vedi _show_page)
+        self._loading = False
+        self.tree.delete(*self.tree.get_children())
+        self.window_start = 0
+        self.total = total
+        self._append_rows(records)
+        self._update_count()
+        if self._select_first:
+            # Selezione iniziale (prima voce se esiste)
+            self._select_first = False
+            children = self.tree.get_children()
+            if children:
+                self.tree.selection_set(children[0])
+                self.show_output(int(children[0]))
+
+    @property
+    def window_end(self):
+        return self.window_start + len(self.tree.get_children())
+
+    def _row_values(self, record):
         display_link = record['link'] if len(record['link']) < 40 else record['link'][:37] + "..."
-        self.tree.insert('', 'end', iid=str(idx), values=(
+        return (
             record['start_time'].strftime("%Y-%m-%d %H:%M:%S"),
             display_link,
-            f"{record['duration']:.1f}s"
-        ), tags=(tag,))
+            record.get('action_label') or "",
+            f"{record['duration']:.1f}s" if record['duration'] is not None else "",
+            "OK" if record['exit_code'] == 0 else "ERRORE"
+        )
+
+    def _insert_row(self, record, index):
+        tag = 'success' if record['exit_code'] == 0 else 'error'
+        iid = str(record['id'])
+        if not self.tree.exists(iid):
+            self.tree.insert('', index, iid=iid, values=self._row_values(record), tags=(tag,))
+
+    def _append_rows(self, records):
+        for record in records:
+            self._insert_row(record, 'end')
+
+    def _on_tree_scroll(self, first, last):
+        self.vsb.set(first, last)
+        if self._loading:
+            return
+        if float(last) > 0.9 and self.window_end < self.total:
+            self._request_page('next', self.window_end)
+        elif float(first) < 0.1 and self.window_start > 0:
+            self._request_page('prev', max(0, self.window_start - self.page_size))
+
+    def _show_page(self, generation, direction, offset, records):
+        if generation != self._generation or not self.winfo_exists():
+            return
+        if direction == 'next':
+            self._show_next(offset, records)
+        else:
+            self._show_prev(offset, records)
+
+    def _show_next(self, offset, records):
+        try:
+            # Se nel frattempo è arrivato un record in testa la pagina si
+            # sovrappone di una riga alla finestra: _insert_row la salta
+            first_fraction = self.tree.yview()[0]
+            rows_before = len(self.tree.get_children())
+            first_visible = first_fraction * rows_before
+            self._append_rows(records)
+            # Scarta le righe in testa oltre la dimensione massima della finestra
+            children = self.tree.get_children()
+            excess = len(children) - self.max_rows
+            if excess > 0:
+                self.tree.delete(*children[:excess])
+                self.window_start += excess
+                first_visible -= excess
+            rows_after = len(self.tree.get_children())
+            if rows_after:
+                self.tree.yview_moveto(max(first_visible, 0) / rows_after)
+            self._update_count()
+        finally:
+            self._loading = False
+
+    def _show_prev(self, offset, records):
+        try:
+            if offset >= self.window_start:
+                return
+            first_fraction = self.tree.yview()[0]
+            first_visible = first_fraction * len(self.tree.get_children())
+            records = records[:self.window_start - offset]
+            for index, record in enumerate(records):
+                self._insert_row(record, index)
+            self.window_start = offset
+            first_visible += len(records)
+            # Scarta le righe in coda oltre la dimensione massima della finestra
+            children = self.tree.get_children()
+            excess = len(children) - self.max_rows
+            if excess > 0:
+                self.tree.delete(*children[-excess:])
+            rows_after = len(self.tree.get_children())
+            if rows_after:
+                self.tree.yview_moveto(first_visible / rows_after)
+            self._update_count()
+        finally:
+            self._loading = False
+
+    def _update_count(self):
+        if self.total:
+            self.count_label.configure(text=f"{self.window_start + 1}-{self.window_end} di {self.total}")
+        else:
+            self.count_label.configure(text="Nessun record")
+
+    # --- ordinamento e filtri ---------------------------------------------
+
+    def sort_by(self, column):
+        order_by = self.COLUMNS[column]
+        if order_by == self.order_by:
+            self.descending = not self.descending
+        else:
+            self.order_by = order_by
+            self.descending = order_by in ('start_time', 'duration')
+        for col in self.COLUMNS:
+            arrow = ""
+            if self.COLUMNS[col] == self.order_by:
+                arrow = " \u25bc" if self.descending else " \u25b2"
+            self.tree.heading(col, text=col + arrow)
+        self.reload()
+
+    def _schedule_filter(self):
+        # Applica il filtro quando l'utente smette di digitare
+        if self._filter_after_id is not None:
+            self.after_cancel(self._filter_after_id)
+        self._filter_after_id = self.after(300, self._apply_filter)
+
+    def _apply_filter(self):
+        self._filter_after_id = None
+        value = self.filter_var.get().strip()
+        self.filters = {self.FILTERS[self.filter_column.get()]: value} if value else {}
+        self.reload()
+
+    # --- record ---------------------------------------------------------------
+
+    def add_record(self, record):
+        if self.filters:
+            # Con un filtro attivo il nuovo record comparirà al prossimo caricamento
+            return
+        self.total += 1
+        # Nuovo record visibile solo se la finestra mostra l'inizio o la fine dell'ordinamento per data
+        if self.order_by == 'start_time':
+            if self.descending and self.window_start == 0:
+                self._insert_row(record, 0)
+            elif not self.descending and self.window_end == self.total - 1:
+                self._insert_row(record, 'end')
+        self._update_count()
 
     def on_tree_select(self, event):
         selected = self.tree.selection()
         if not selected:
             return
-        idx = int(selected[0])
-        self.show_output(idx)
-
-    def show_output(self, idx):
-        self.output_text.config(state='normal')
-        self.output_text.delete('1.0', tk.END)
-        self.output_text.insert(tk.END, self.history[idx]['output'])
-        self.output_text.config(state='disabled')
-
+        self.show_output(int(selected[0]))
+
+    def show_output(self, record_id):
+        # Il log completo viene letto dal disco solo alla selezione
+        record = self.history_store.get(record_id)
+        if record is not None:
+            self.usage_label.configure(text=format_usage(record))
+            self.log_view.highlight = self.filters.get('text')
+            self.log_view.show(record)
@@ -0,0 +1,320 @@
+import datetime
+import itertools
+import os
+import queue
+import sqlite3
+import sys
+import threading
+from joblog import read_log_text
+from resources import USAGE_FIELDS
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS history (
+    id INTEGER PRIMARY KEY,
+    start_time REAL NOT NULL,
+    link TEXT NOT NULL,
+    action_label TEXT,
+    exit_code INTEGER,
+    duration REAL,
+    outcome TEXT,
+    output TEXT,
+    log_path TEXT,
+    cpu_user REAL,
+    cpu_sys REAL,
+    max_rss INTEGER,
+    read_bytes INTEGER,
+    write_bytes INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_history_start_time ON history(start_time);
+CREATE INDEX IF NOT EXISTS idx_history_link ON history(link);
+CREATE INDEX IF NOT EXISTS idx_history_action_label ON history(action_label);
+CREATE INDEX IF NOT EXISTS idx_history_exit_code ON history(exit_code);
+"""
+
+COLUMNS = ("id", "start_time", "link", "action_label", "exit_code", "duration", "outcome", "output",
+           "log_path") + USAGE_FIELDS
+SORTABLE_COLUMNS = ("start_time", "link", "action_label", "exit_code", "duration") + USAGE_FIELDS
+# Colonne aggiunte dopo la prima versione dello schema, create sui database esistenti
+ADDED_COLUMNS = {"cpu_user": "REAL", "cpu_sys": "REAL", "max_rss": "INTEGER", "read_bytes": "INTEGER",
+                 "write_bytes": "INTEGER"}
+TEXT_FILTER_COLUMNS = ("link", "action_label", "outcome")
+
+# Indice full-text (solo indice, senza copia del testo) su link, azione e output
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS history_fts USING fts5(link, action_label, output, content='');
+"""
+
+_STOP = object()
+
+
+def default_db_path():
+    return os.path.join(os.path.expanduser("~"), ".link_monitor", "history.db")
+
+
+class HistoryStore:
+    """
+    Cronologia persistente delle esecuzioni su SQLite (journal WAL).
+
+    Le scritture sono asincrone: add() assegna subito l'id al record e lo
+    accoda, un thread dedicato le salva a blocchi in un'unica transazione.
+    Le letture usano una connessione per thread.
+    Link, azione e output completo (letto dal log) vengono indicizzati in
+    una tabella FTS5, aggiornata insieme alle scritture.
+    """
+    def __init__(self, path=None, batch_size=200, flush_interval=0.5, max_index_chars=2 * 1024 * 1024):
+        self.path = path or default_db_path()
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._local = threading.local()
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        self._queue = queue.Queue()
+
+        self.max_index_chars = max_index_chars
+
+        conn = self._connection()
+        conn.executescript(SCHEMA)
+        existing = {row[1] for row in conn.execute("PRAGMA table_info(history)")}
+        for column, column_type in ADDED_COLUMNS.items():
+            if column not in existing:
+                conn.execute(f"ALTER TABLE history ADD COLUMN {column} {column_type}")
+        try:
+            conn.executescript(FTS_SCHEMA)
+            self.fts = True
+        except sqlite3.OperationalError:
+            # SQLite senza FTS5: la ricerca ripiega su LIKE
+            self.fts = False
+        conn.commit()
+        max_id = conn.execute("SELECT MAX(id) FROM history").fetchone()[0] or 0
+        self._ids = itertools.count(max_id + 1)
+
+        self._writer = threading.Thread(target=self._writer_loop, daemon=True)
+        self._writer.start()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    # --- scrittura -------------------------------------------------------
+
+    def add(self, record):
+        """Accoda il record (dict) per il salvataggio e ritorna il suo id."""
+        record = dict(record)
+        with self._pending_lock:
+            record['id'] = next(self._ids)
+            self._pending[record['id']] = record
+        self._queue.put(record)
+        return record['id']
+
+    def _writer_loop(self):
+        conn = self._connection()
+        if self.fts:
+            self._backfill_index(conn)
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            batch = [item]
+            stop = False
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get(timeout=self.flush_interval)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stop = True
+                    break
+                batch.append(item)
+            self._write_batch(conn, batch)
+            if stop:
+                break
+        conn.close()
+
+    def _backfill_index(self, conn):
+        # Indicizza i record salvati prima dell'introduzione dell'indice
+        try:
+            with conn:
+                conn.execute(
+                    "INSERT INTO history_fts(rowid, link, action_label, output) "
+                    "SELECT id, link, action_label, output FROM history "
+                    "WHERE id > (SELECT COALESCE(MAX(rowid), 0) FROM history_fts)")
+        except sqlite3.Error as e:
+            print(f"Errore indicizzazione cronologia: {e}", file=sys.stderr)
+
+    def _index_text(self, record):
+        log_path = record.get('log_path')
+        if log_path and os.path.isfile(log_path):
+            try:
+                return read_log_text(log_path, self.max_index_chars)
+            except OSError:
+                pass
+        return record.get('output') or ""
+
+    def _insert(self, conn, records):
+        rows = [self._to_row(record) for record in records]
+        with conn:
+            conn.executemany(
+                f"INSERT OR REPLACE INTO history ({', '.join(COLUMNS)}) "
+                f"VALUES ({', '.join('?' for _ in COLUMNS)})", rows)
+            if self.fts:
+                conn.executemany(
+                    "INSERT INTO history_fts(rowid, link, action_label, output) VALUES (?, ?, ?, ?)",
+                    [(row[0], row[2], row[3], self._index_text(record)) for row, record in zip(rows, records)])
+
+    def _write_batch(self, conn, batch):
+        try:
+            try:
+                self._insert(conn, batch)
+            except sqlite3.Error:
+                # Un record non valido annulla la transazione: si riprova uno alla volta
+                # così va perso solo quello
+                for record in batch:
+                    try:
+                        self._insert(conn, [record])
+                    except sqlite3.Error as e:
+                        print(f"Errore salvataggio cronologia (record {record['id']}): {e}", file=sys.stderr)
+        finally:
+            with self._pending_lock:
+                for record in batch:
+                    self._pending.pop(record['id'], None)
+            for _ in batch:
+                self._queue.task_done()
+
+    @staticmethod
+    def _to_row(record):
+        start_time = record['start_time']
+        if isinstance(start_time, datetime.datetime):
+            start_time = start_time.timestamp()
+        action = record.get('action')
+        label = record.get('action_label') or getattr(action, 'label', action)
+        # Le risorse possono arrivare come dict 'resources' (Job.resources) o come colonne
+        usage = record.get('resources') or record
+        return (record['id'], start_time, record['link'], label, record.get('exit_code'),
+                record.get('duration'), record.get('outcome'), record.get('output'),
+                record.get('log_path')) + tuple(usage.get(field) for field in USAGE_FIELDS)
+
+    @staticmethod
+    def _from_row(row):
+        record = dict(zip(COLUMNS, row))
+        record['start_time'] = datetime.datetime.fromtimestamp(record['start_time'])
+        return record
+
+    def flush(self):
+        """Attende che tutte le scritture accodate siano salvate."""
+        self._queue.join()
+
+    def close(self):
+        self._queue.put(_STOP)
+        self._writer.join()
+
+    # --- lettura ---------------------------------------------------------
+
+    def get(self, record_id):
+        with self._pending_lock:
+            pending = self._pending.get(record_id)
+        if pending is not None:
+            return self._from_row(self._to_row(pending))
+        row = self._connection().execute(
+            f"SELECT {', '.join(COLUMNS)} FROM history WHERE id = ?", (record_id,)).fetchone()
+        return self._from_row(row) if row else None
+
+    def _pending_records(self):
+        with self._pending_lock:
+            return [self._from_row(self._to_row(record)) for record in self._pending.values()]
+
+    def recent(self, limit=200):
+        """Ultimi `limit` record, dal più vecchio al più recente (compresi quelli non ancora salvati)."""
+        rows = self._connection().execute(
+            f"SELECT {', '.join(COLUMNS)} FROM history ORDER BY start_time DESC, id DESC LIMIT ?",
+            (limit,)).fetchall()
+        records = {row[0]: self._from_row(row) for row in rows}
+        for record in self._pending_records():
+            records[record['id']] = record
+        ordered = sorted(records.values(), key=lambda r: (r['start_time'], r['id']))
+        return ordered[-limit:]
+
+    @staticmethod
+    def fts_query(text):
+        """Il testo cercato diventa una frase FTS5 (parole consecutive)."""
+        return '"' + text.replace('"', '""') + '"'
+
+    def _where(self, filters):
+        """
+        Traduce i filtri in una clausola WHERE:
+            {'text': 'HTTP Error 403'} -> ricerca full-text su link, azione e output
+            {'link': 'youtube'}  -> link contiene 'youtube' (anche action_label, outcome)
+            {'status': 'ok'}     -> exit_code = 0 ('error' per gli altri)
+            {'exit_code': 1}     -> exit_code = 1
+        """
+        clauses = []
+        params = []
+        for column, value in (filters or {}).items():
+            if value in (None, ''):
+                continue
+            if column == 'text':
+                if self.fts:
+                    clauses.append("id IN (SELECT rowid FROM history_fts WHERE history_fts MATCH ?)")
+                    params.append(self.fts_query(str(value)))
+                else:
+                    escaped = str(value).replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+                    clauses.append("(" + " OR ".join(f"{c} LIKE ? ESCAPE '\\'"
+                                                     for c in ('link', 'action_label', 'output')) + ")")
+                    params.extend([f"%{escaped}%"] * 3)
+            elif column in TEXT_FILTER_COLUMNS:
+                escaped = str(value).replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+                clauses.append(f"{column} LIKE ? ESCAPE '\\'")
+                params.append(f"%{escaped}%")
+            elif column == 'status':
+                clauses.append("exit_code = 0" if value == 'ok' else "(exit_code IS NULL OR exit_code != 0)")
+            elif column == 'exit_code':
+                clauses.append("exit_code = ?")
+                params.append(int(value))
+            else:
+                raise ValueError(f"Filtro non supportato: {column}")
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        return where, params
+
+    def query(self, offset=0, limit=100, order_by='start_time', descending=True, filters=None):
+        """Una pagina di record ordinata e filtrata direttamente da SQLite."""
+        if order_by not in SORTABLE_COLUMNS:
+            raise ValueError(f"Ordinamento non supportato: {order_by}")
+        direction = "DESC" if descending else "ASC"
+        where, params = self._where(filters)
+        rows = self._connection().execute(
+            f"SELECT {', '.join(COLUMNS)} FROM history{where} "
+            f"ORDER BY {order_by} {direction}, id {direction} LIMIT ? OFFSET ?",
+            params + [limit, offset]).fetchall()
+        return [self._from_row(row) for row in rows]
+
+    def find_success(self, link, action_label, since=None):
+        """Ultima esecuzione riuscita di `action_label` su `link` (dopo il timestamp `since`)."""
+        sql = (f"SELECT {', '.join(COLUMNS)} FROM history "
+               f"WHERE link = ? AND action_label = ? AND exit_code = 0")
+        params = [link, action_label]
+        if since is not None:
+            sql += " AND start_time >= ?"
+            params.append(since)
+        row = self._connection().execute(sql + " ORDER BY start_time DESC LIMIT 1", params).fetchone()
+        return self._from_row(row) if row else None
+
+    def search(self, text, limit=200):
+        """Record che contengono `text`, dal più rilevante."""
+        if not self.fts:
+            return self.query(0, limit, filters={'text': text})
+        rows = self._connection().execute(
+            f"SELECT {', '.join('h.' + c for c in COLUMNS)} FROM history_fts "
+            f"JOIN history h ON h.id = history_fts.rowid "
+            f"WHERE history_fts MATCH ? ORDER BY rank LIMIT ?",
+            (self.fts_query(text), limit)).fetchall()
+        return [self._from_row(row) for row in rows]
+
+    def count(self, filters=None):
+        """Record salvati che soddisfano i filtri (gli stessi che query() può restituire)."""
+        where, params = self._where(filters)
+        return self._connection().execute(f"SELECT COUNT(*) FROM history{where}", params).fetchone()[0]
@@ -0,0 +1,315 @@
+import json
+import os
+import queue
+import socket
+import socketserver
+import threading
+import time
+from metrics import REGISTRY
+from jobs import Job, PRIORITY_BATCH, PRIORITY_NORMAL, QUEUED, RUNNING
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Il server è disponibile solo dove esistono i socket UNIX
+HAS_UNIX_SOCKETS = hasattr(socket, 'AF_UNIX')
+
+
+def default_runtime_dir():
+    base = os.environ.get('XDG_RUNTIME_DIR') or os.path.join(os.path.expanduser("~"), ".link_monitor")
+    return os.path.join(base, "link_monitor")
+
+
+class InstanceLock:
+    """Lock su file che garantisce una sola istanza per utente."""
+    def __init__(self, path):
+        self.path = path
+        self._fh = None
+
+    def acquire(self):
+        """Ritorna True se il lock è stato ottenuto, False se un'altra istanza è attiva."""
+        os.makedirs(os.path.dirname(self.path), mode=0o700, exist_ok=True)
+        fh = open(self.path, 'a+')
+        try:
+            if fcntl is not None:
+                fcntl.flock(fh.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                fh.seek(0)
+                msvcrt.locking(fh.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            fh.close()
+            return False
+        fh.seek(0)
+        fh.truncate()
+        fh.write(str(os.getpid()))
+        fh.flush()
+        self._fh = fh
+        return True
+
+    def release(self):
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+
+
+def job_info(job, scheduler=None):
+    info = {
+        'id': job.id,
+        'state': job.state,
+        'action': job.action.label,
+        'url': job.url,
+        'priority': job.priority,
+        'stage': job.stage + 1,
+        'stages': len(job.stages),
+        'exit_code': job.exit_code,
+        'start_time': job.start_time,
+        'duration': job.duration,
+        'log_path': job.log_path,
+        'resources': job.resources,
+        'timed_out': job.timed_out,
+        'progress': job.progress.as_dict() if job.progress is not None else None,
+    }
+    if scheduler is not None:
+        info['position'] = scheduler.queue_position(job)
+    return info
+
+
+def _encode(message):
+    return (json.dumps(message, ensure_ascii=False, default=str) + "\n").encode('utf-8')
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for raw in self.rfile:
+            try:
+                request = json.loads(raw)
+                if not isinstance(request, dict):
+                    raise ValueError("la richiesta deve essere un oggetto JSON")
+            except ValueError as e:
+                self._send({'ok': False, 'error': f"Richiesta non valida: {e}"})
+                continue
+            if request.get('cmd') == 'stream':
+                # Lo stream occupa la connessione fino all'uscita del job
+                self.server.api.stream(request, self._send)
+                return
+            self._send(self.server.api.handle(request))
+
+    def _send(self, message):
+        self.wfile.write(_encode(message))
+        self.wfile.flush()
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class InstanceServer:
+    """
+    API locale dell'istanza in esecuzione su socket UNIX: una richiesta
+    JSON per riga, una risposta JSON per riga.
+
+        {"cmd": "ping"}
+        {"cmd": "submit", "urls": [...], "action": "label", "force": false}
+            senza "action" i link vengono trattati come se fossero stati copiati
+        {"cmd": "list"}
+        {"cmd": "cancel", "job_id": 3}    oppure {"cmd": "cancel", "all": true}
+        {"cmd": "stream", "job_id": 3}    coda dell'output, poi una riga per evento (output,
+                                          avanzamento al massimo una volta al secondo) fino all'uscita
+        {"cmd": "history", "limit": 50, "offset": 0, "filters": {"text": "..."}}
+        {"cmd": "metrics"}                riepilogo delle metriche di esecuzione
+        {"cmd": "show"}                   porta in primo piano la finestra (se c'è)
+
+    `get_actions()` ritorna l'ActionSet corrente, `on_text(text)` gestisce i
+    link senza azione, `on_job_exit(job)` registra in cronologia i job
+    avviati tramite l'API, `on_show()` risponde a "show".
+    """
+    def __init__(self, path, scheduler, get_actions, on_text, history_store=None, result_cache=None,
+                 on_job_exit=None, on_show=None):
+        self.path = path
+        self.scheduler = scheduler
+        self.get_actions = get_actions
+        self.on_text = on_text
+        self.history_store = history_store
+        self.result_cache = result_cache
+        self.on_job_exit = on_job_exit
+        self.on_show = on_show
+        self._server = None
+
+    def start(self):
+        os.makedirs(os.path.dirname(self.path), mode=0o700, exist_ok=True)
+        # Il lock è nostro: un socket rimasto su disco appartiene a un'istanza terminata
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._server = _Server(self.path, _Handler)
+        os.chmod(self.path, 0o600)
+        self._server.api = self
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+
+    # --- comandi -----------------------------------------------------------
+
+    def handle(self, request):
+        cmd = request.get('cmd')
+        method = getattr(self, f"cmd_{cmd}", None) if isinstance(cmd, str) else None
+        if method is None:
+            return {'ok': False, 'error': f"Comando sconosciuto: {cmd}"}
+        try:
+            return method(request)
+        except Exception as e:
+            return {'ok': False, 'error': str(e)}
+
+    def cmd_ping(self, request):
+        return {'ok': True, 'pid': os.getpid()}
+
+    def cmd_show(self, request):
+        if self.on_show is not None:
+            self.on_show()
+        return {'ok': True}
+
+    def cmd_submit(self, request):
+        urls = request.get('urls') or []
+        if isinstance(urls, str):
+            urls = [urls]
+        label = request.get('action')
+        if label is None:
+            self.on_text("\n".join(urls))
+            return {'ok': True, 'forwarded': len(urls)}
+
+        action = next((a for a in self.get_actions() if a.label == label), None)
+        if action is None:
+            return {'ok': False, 'error': f"Azione sconosciuta: {label}"}
+        priority = PRIORITY_NORMAL if len(urls) == 1 else PRIORITY_BATCH
+        jobs = []
+        skipped = []
+        for url in urls:
+            url = action.filter_url(url)
+            if (not request.get('force') and self.result_cache is not None
+                    and self.result_cache.previous(action, url) is not None):
+                skipped.append(url)
+                continue
+            job = Job(action, url, priority)
+            if self.on_job_exit is not None:
+                job.add_listener(on_exit=lambda j, mine=job: j is mine and self.on_job_exit(j))
+            jobs.append(job)
+        accepted = self.scheduler.submit_many(jobs) if jobs else []
+        return {'ok': True, 'jobs': [job_info(job) for job in accepted], 'skipped': skipped}
+
+    def cmd_list(self, request):
+        jobs = self.scheduler.running_jobs() + self.scheduler.queued_jobs()
+        return {'ok': True, 'jobs': [job_info(job, self.scheduler) for job in jobs]}
+
+    def cmd_cancel(self, request):
+        if request.get('all'):
+            jobs = self.scheduler.queued_jobs() + self.scheduler.running_jobs()
+        else:
+            job = self.scheduler.get_job(int(request.get('job_id')))
+            if job is None:
+                return {'ok': False, 'error': f"Job non trovato: {request.get('job_id')}"}
+            jobs = [job]
+        for job in jobs:
+            self.scheduler.cancel(job)
+        return {'ok': True, 'cancelled': [job.id for job in jobs]}
+
+    def cmd_history(self, request):
+        if self.history_store is None:
+            return {'ok': False, 'error': "Cronologia non disponibile"}
+        records = self.history_store.query(int(request.get('offset', 0)), int(request.get('limit', 50)),
+                                           filters=request.get('filters'))
+        return {'ok': True, 'records': records}
+
+    def cmd_metrics(self, request):
+        return {'ok': True, 'metrics': REGISTRY.snapshot()}
+
+    def stream(self, request, send):
+        """Invia la coda dell'output del job e poi i suoi eventi fino all'uscita."""
+        try:
+            job = self.scheduler.get_job(int(request.get('job_id')))
+        except (TypeError, ValueError):
+            job = None
+        if job is None:
+            send({'ok': False, 'error': f"Job non trovato: {request.get('job_id')}"})
+            return
+        events = queue.Queue()
+        last_progress = [0.0]
+
+        def on_progress(j, progress):
+            # Al massimo un evento di avanzamento al secondo
+            now = time.monotonic()
+            if now - last_progress[0] >= 1.0:
+                last_progress[0] = now
+                events.put({'event': 'progress', **progress.as_dict()})
+
+        listener = job.add_listener(
+            on_start=lambda j: events.put({'event': 'start', 'job': job_info(j)}),
+            on_output=lambda j, line: events.put({'event': 'output', 'line': line}),
+            on_progress=on_progress,
+            on_exit=lambda j: events.put({'event': 'exit', 'job': job_info(j)}))
+        try:
+            send({'ok': True, 'job': job_info(job, self.scheduler)})
+            if job.tail():
+                send({'event': 'output', 'line': job.tail()})
+            if job.state not in (QUEUED, RUNNING):
+                send({'event': 'exit', 'job': job_info(job)})
+                return
+            while True:
+                event = events.get()
+                send(event)
+                if event['event'] == 'exit':
+                    return
+        except OSError:
+            # Client disconnesso
+            pass
+        finally:
+            job.remove_listener(listener)
+
+
+class InstanceClient:
+    """Client per l'API di un'istanza già in esecuzione."""
+    def __init__(self, path, timeout=5.0):
+        self.path = path
+        self.timeout = timeout
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.path)
+        return sock
+
+    def request(self, message):
+        with self._connect() as sock:
+            sock.sendall(_encode(message))
+            with sock.makefile('r', encoding='utf-8') as reader:
+                line = reader.readline()
+        if not line:
+            raise ConnectionError("Nessuna risposta dall'istanza in esecuzione")
+        return json.loads(line)
+
+    def stream(self, job_id):
+        """Generatore dei messaggi di {"cmd": "stream"}; termina all'uscita del job."""
+        with self._connect() as sock:
+            sock.settimeout(None)
+            sock.sendall(_encode({'cmd': 'stream', 'job_id': job_id}))
+            with sock.makefile('r', encoding='utf-8') as reader:
+                for line in reader:
+                    message = json.loads(line)
+                    yield message
+                    if message.get('event') == 'exit' or message.get('ok') is False:
+                        return
+
+    def alive(self):
+        try:
+            return self.request({'cmd': 'ping'}).get('ok', False)
+        except (OSError, ValueError):
+            return False
@@ -0,0 +1,116 @@
+import datetime
+import gzip
+import mmap
+import os
+import struct
+from collections import deque
+
+LOG_PAGE_SIZE = 256 * 1024
+
+
+def default_log_dir():
+    return os.path.join(os.path.expanduser("~"), ".link_monitor", "logs")
+
+
+class JobLog:
+    """
+    Log su disco dell'output di un job (eventualmente compresso gzip).
+    In memoria resta solo la coda delle ultime `tail_lines` righe.
+    """
+    def __init__(self, path, compress=False, tail_lines=200):
+        self.path = path
+        self.compress = compress
+        self.tail = deque(maxlen=tail_lines)
+        if compress:
+            self._fh = gzip.open(path, 'wt', encoding='utf-8', errors='replace')
+        else:
+            self._fh = open(path, 'w', encoding='utf-8', errors='replace')
+
+    @classmethod
+    def create(cls, log_dir, job_id, compress=False, tail_lines=200):
+        os.makedirs(log_dir, exist_ok=True)
+        stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        name = f"{stamp}-{os.getpid()}-{job_id}.log" + (".gz" if compress else "")
+        return cls(os.path.join(log_dir, name), compress, tail_lines)
+
+    def write(self, text):
+        self._fh.write(text)
+        self.tail.append(text)
+
+    def tail_text(self):
+        return "".join(self.tail)
+
+    def close(self):
+        if not self._fh.closed:
+            self._fh.close()
+
+
+class LogReader:
+    """
+    Lettura a pagine di un log di JobLog: i file non compressi vengono
+    mappati in memoria e se ne copia solo la pagina richiesta, quelli
+    compressi restano aperti tra una pagina e l'altra, così la lettura
+    sequenziale decomprime il file una sola volta (gzip non ha accesso
+    diretto: ogni riapertura ripartirebbe dall'inizio).
+    """
+    def __init__(self, path):
+        self.path = path
+        self.compressed = path.endswith('.gz')
+        self._gzip = None
+        # Offset della pagina successiva e byte già decompressi oltre l'ultimo a capo
+        self._position = 0
+        self._rest = b''
+
+    def size(self):
+        """Dimensione in byte del contenuto (non compresso)."""
+        if not self.compressed:
+            return os.path.getsize(self.path)
+        # Il trailer gzip contiene la dimensione originale modulo 2**32
+        with open(self.path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            if f.tell() < 4:
+                return 0
+            f.seek(-4, os.SEEK_END)
+            return struct.unpack('<I', f.read(4))[0]
+
+    def read_page(self, offset=0, page_size=LOG_PAGE_SIZE):
+        """
+        Legge circa `page_size` byte a partire da `offset`, fermandosi
+        all'ultimo a capo. Ritorna (testo, offset della pagina successiva).
+        """
+        if self.compressed:
+            if self._gzip is None:
+                self._gzip = gzip.open(self.path, 'rb')
+                self._position, self._rest = 0, b''
+            if offset != self._position:
+                # Accesso non sequenziale: all'indietro gzip riparte dall'inizio
+                self._gzip.seek(offset)
+                self._position, self._rest = offset, b''
+            data = self._rest + self._gzip.read(page_size - len(self._rest))
+        else:
+            with open(self.path, 'rb') as f:
+                if os.fstat(f.fileno()).st_size <= offset:
+                    return "", offset
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    data = mm[offset:offset + page_size]
+
+        page = data
+        if len(data) == page_size:
+            cut = data.rfind(b'\n')
+            if cut > 0:
+                page = data[:cut + 1]
+        if self.compressed:
+            self._position, self._rest = offset + len(page), data[len(page):]
+        return page.decode('utf-8', errors='replace'), offset + len(page)
+
+    def close(self):
+        if self._gzip is not None:
+            self._gzip.close()
+            self._gzip = None
+
+
+def read_log_text(path, max_chars=2 * 1024 * 1024):
+    """Legge (al massimo `max_chars` caratteri di) un log, compresso o no."""
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8', errors='replace') as f:
+        return f.read(max_chars)
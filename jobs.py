@@ -0,0 +1,522 @@
+import asyncio
+import bisect
+import datetime
+import itertools
+import threading
+import time
+import metrics
+from tracing import TRACER
+from joblog import JobLog
+from engine import JobEngine, run_process, signal_process
+from output_parsers import make_decoder, parser_for
+from resources import add_usage
+
+# Priorità: numeri più bassi vengono eseguiti prima
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 5
+PRIORITY_BATCH = 10
+
+# Secondi concessi dopo SIGTERM a un job scaduto (timeoutN) prima di SIGKILL
+TIMEOUT_KILL_GRACE = 5.0
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+CANCELLED = 'cancelled'
+FAILED = 'failed'
+
+_job_ids = itertools.count(1)
+
+
+class _JobOutput:
+    """Parser, destinazione e metriche dell'output di un processo (vedi run_command_async)."""
+    def __init__(self, action, on_output, log, job_id, on_progress):
+        self.action = action
+        self.on_output = on_output
+        self.log = log
+        self.job_id = job_id
+        self.on_progress = on_progress
+        self.parser = parser_for(getattr(action, 'output_parser', 'auto'), action.command.executable)
+        self.lines = []
+        self.spawned = None
+
+    def spawned_now(self, spawn_start, pid):
+        self.spawned = time.perf_counter()
+        metrics.SPAWN_SECONDS.observe(self.spawned - spawn_start, action=self.action.label)
+        TRACER.complete('popen', spawn_start, self.spawned, cat='job', action=self.action.label, job=self.job_id,
+                        pid=pid)
+        limits = getattr(self.action, 'limits', None)
+        for warning in limits.unsupported() if limits else []:
+            self.emit(f"[link_monitor] Limite non applicato: {warning}\n")
+
+    def emit(self, line):
+        if self.on_output:
+            self.on_output(line)
+        if self.log is not None:
+            self.log.write(line)
+        else:
+            self.lines.append(line)
+
+    def feed(self, text):
+        if self.spawned is not None:
+            metrics.FIRST_OUTPUT_SECONDS.observe(time.perf_counter() - self.spawned, action=self.action.label)
+            TRACER.instant('first_output', cat='job', action=self.action.label, job=self.job_id)
+            self.spawned = None
+        for item in self.parser.feed_text(text):
+            if isinstance(item, str):
+                self.emit(item)
+            elif self.on_progress:
+                self.on_progress(item)
+
+    def finish(self):
+        for line in self.parser.finish():
+            self.emit(line)
+        return self.log.tail_text() if self.log is not None else "".join(self.lines)
+
+
+def _command(action, url, job_id, prev):
+    if action.run_in_shell:
+        return action.command.shell_command(url, job_id, prev)
+    return action.command.argv(url, job_id, prev)
+
+
+async def run_command_async(action, url, on_output=None, on_start=None, log=None, job_id=None, on_progress=None,
+                            prev=None):
+    """
+    Esegue il programma dell'azione sull'url (già filtrato), passando ogni
+    riga di output a `on_output`. `on_start` riceve il processo appena
+    creato (Popen o asyncio.subprocess.Process).
+    L'output passa dal parser dell'azione (output_parsers): le righe di
+    avanzamento riscritte con '\r' vanno solo a `on_progress` (Progress) e
+    dell'avanzamento resta nell'output solo l'ultimo stato.
+    Con `log` (JobLog) l'output va su disco e viene restituita solo la coda.
+    Il programma viene avviato direttamente dall'argv precompilato; solo con
+    run_in_shell passa dalla shell. I limiti dell'azione (nice, ionice,
+    rlimit) vengono applicati nel figlio prima di exec. `prev` è il
+    valore di {prev} (fasi successive di una pipeline).
+    Gira nel loop di engine.JobEngine: nessun thread per il processo, la
+    pipe viene letta senza bloccare e decodificata a blocchi.
+    Ritorna (exit_code, start_time, end_time, output, usage), con usage il
+    dict delle risorse usate (vedi resources.reap_with_usage) o None.
+    """
+    cmd = _command(action, url, job_id, prev)
+    out = _JobOutput(action, on_output, log, job_id, on_progress)
+    decoder = make_decoder()
+    procs = []
+    start_time = datetime.datetime.now()
+    spawn_start = time.perf_counter()
+
+    def on_spawn(proc):
+        procs.append(proc)
+        out.spawned_now(spawn_start, proc.pid)
+        if on_start:
+            on_start(proc)
+
+    def on_data(data):
+        text = decoder.decode(data, final=not data)
+        if text:
+            out.feed(text)
+
+    limits = getattr(action, 'limits', None)
+    preexec_fn = limits.preexec() if limits else None
+    usage = await run_process(cmd, action.run_in_shell, on_spawn, on_data, preexec_fn)
+    output = out.finish()
+    returncode = procs[0].returncode
+    TRACER.complete('process', spawn_start, cat='job', action=action.label, job=job_id, exit_code=returncode)
+    return returncode, start_time, datetime.datetime.now(), output, usage
+
+
+class Job:
+    """
+    Esecuzione di un'azione su un url. Gli eventi vengono notificati ai
+    listener (chiamati dal thread del motore dello scheduler, non dal thread
+    di Tk; non devono bloccare):
+      on_queue_position(job, posizione), on_start(job),
+      on_output(job, riga), on_progress(job, Progress), on_exit(job)
+    Se l'azione ha più fasi (pipeline) il job torna in coda dopo ogni fase
+    riuscita: on_queue_position e on_start vengono notificati per ogni fase,
+    on_exit solo alla fine. {prev} di una fase vale l'ultima riga di output
+    della precedente.
+    """
+    def __init__(self, action, url, priority=PRIORITY_NORMAL, **callbacks):
+        self.id = next(_job_ids)
+        self.action = action
+        self.url = url
+        self.priority = priority
+        self.state = QUEUED
+        self.proc = None
+        self.exit_code = None
+        self.start_time = None
+        self.end_time = None
+        self.output = ""
+        self.log_path = None
+        self.error = None
+        self.cancel_requested = False
+        self.queued_at = None
+        # Risorse usate (vedi resources.USAGE_FIELDS) e interruzione per timeoutN
+        self.resources = None
+        self.timed_out = False
+        # Ultimo stato di avanzamento (output_parsers.Progress)
+        self.progress = None
+        # Fase della pipeline in corso (indice in action.stages) e output della precedente
+        self.stage = 0
+        self.prev = None
+        self._seq = None
+        self._log = None
+        self._listeners = []
+        if callbacks:
+            self.add_listener(**callbacks)
+
+    @property
+    def stages(self):
+        return getattr(self.action, 'stages', None) or [self.action]
+
+    @property
+    def stage_action(self):
+        """Azione della fase in corso (l'azione stessa se non è una pipeline)."""
+        return self.stages[self.stage]
+
+    @property
+    def stage_text(self):
+        """'fase 2/3: etichetta' per le pipeline, altrimenti ''."""
+        stages = self.stages
+        if len(stages) < 2:
+            return ""
+        return f"fase {self.stage + 1}/{len(stages)}: {stages[self.stage].label}"
+
+    @property
+    def limit_key(self):
+        """Chiave dei limiti della fase in corso: poolN, altrimenti la voce di [DICT_PROGRAMS] usata."""
+        action = self.stage_action
+        key = getattr(action, 'pool', None) or getattr(action, 'program_key', None)
+        if key:
+            return key
+        return action.command.executable or action.label
+
+    @property
+    def key(self):
+        """Identità del lavoro: stessa azione sullo stesso url filtrato."""
+        return (self.action.label, self.action.program, self.url)
+
+    @property
+    def duration(self):
+        if self.start_time and self.end_time:
+            return (self.end_time - self.start_time).total_seconds()
+        return None
+
+    @property
+    def outcome(self):
+        """Esito come mostrato nella cronologia."""
+        if self.exit_code == 0 and not self.timed_out:
+            return "OK"
+        outcome = "Timeout" if self.timed_out else f"Errore {self.exit_code}"
+        return f"{outcome} ({self.stage_text})" if self.stage_text else outcome
+
+    def add_listener(self, on_queue_position=None, on_start=None, on_output=None, on_exit=None, on_progress=None):
+        listener = {
+            'on_queue_position': on_queue_position,
+            'on_start': on_start,
+            'on_output': on_output,
+            'on_progress': on_progress,
+            'on_exit': on_exit,
+        }
+        self._listeners.append(listener)
+        return listener
+
+    def remove_listener(self, listener):
+        try:
+            self._listeners.remove(listener)
+        except ValueError:
+            pass
+
+    def tail(self):
+        """Ultima parte dell'output: durante l'esecuzione quella tenuta in memoria dal log."""
+        log = self._log
+        if self.state == RUNNING and log is not None:
+            return log.tail_text()
+        return self.output
+
+    def emit(self, event, *args):
+        for listener in list(self._listeners):
+            callback = listener.get(event)
+            if callback:
+                try:
+                    callback(self, *args)
+                except Exception:
+                    pass
+
+
+class JobScheduler:
+    """
+    Esegue i Job con al massimo `max_workers` processi contemporanei e
+    `program_limits[chiave]` per ciascun programma. I job in attesa sono
+    ordinati per priorità e poi in ordine di arrivo (FIFO).
+    Con `log_dir` l'output di ogni job viene scritto su file e in memoria
+    resta solo la coda (job.output).
+    Un job per la stessa (azione, url) di uno già in coda o in esecuzione
+    non viene duplicato: i suoi listener si uniscono al job esistente.
+    Con `result_cache` gli esiti riusciti vengono registrati nella cache.
+    I processi girano tutti nell'event loop di `engine` (engine.JobEngine,
+    un solo thread qualunque sia il numero di job in corso).
+    Le fasi di una pipeline vengono accodate una alla volta, ciascuna con i
+    limiti della propria chiave (poolN_K o programma): fasi diverse di link
+    diversi si sovrappongono e una fase già avviata precede in coda i link
+    arrivati dopo.
+    """
+    def __init__(self, max_workers=2, program_limits=None, log_dir=None, compress_logs=False, tail_lines=200,
+                 result_cache=None, engine=None):
+        self.max_workers = max(1, max_workers)
+        self.engine = engine or JobEngine()
+        self.program_limits = dict(program_limits or {})
+        self.log_dir = log_dir
+        self.compress_logs = compress_logs
+        self.tail_lines = tail_lines
+        self.result_cache = result_cache
+        self._inflight = {}
+        self._queue = []  # lista ordinata di (priorità, sequenza, job)
+        self._seq = itertools.count()
+        self._running = {}
+        self._per_key = {}
+        self._lock = threading.RLock()
+        self._closed = False
+
+    def submit(self, job):
+        return self.submit_many([job])[0]
+
+    def submit_many(self, jobs):
+        """
+        Accoda i job e ritorna la lista dei job effettivi: per i duplicati
+        di un job già attivo viene restituito quest'ultimo.
+        """
+        accepted = []
+        merged = []
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Scheduler chiuso")
+            for job in jobs:
+                existing = self._inflight.get(job.key)
+                if existing is not None and not existing.cancel_requested:
+                    existing._listeners.extend(job._listeners)
+                    merged.append((existing, job))
+                    accepted.append(existing)
+                    continue
+                job.state = QUEUED
+                job.queued_at = time.perf_counter()
+                job._seq = next(self._seq)
+                self._inflight[job.key] = job
+                bisect.insort(self._queue, (job.priority, job._seq, job))
+                accepted.append(job)
+        # I listener uniti ricevono lo stato attuale del job esistente
+        for existing, job in merged:
+            if existing.state == RUNNING:
+                for listener in job._listeners:
+                    if listener['on_start']:
+                        listener['on_start'](existing)
+        if not self._pump():
+            self._notify_positions()
+        return accepted
+
+    def cancel(self, job):
+        was_queued = False
+        with self._lock:
+            job.cancel_requested = True
+            for entry in self._queue:
+                if entry[2] is job:
+                    self._queue.remove(entry)
+                    job.state = CANCELLED
+                    if self._inflight.get(job.key) is job:
+                        del self._inflight[job.key]
+                    was_queued = True
+                    break
+            proc = job.proc if job.state == RUNNING else None
+        if was_queued:
+            if job._log is not None:
+                # Pipeline annullata tra una fase e l'altra
+                job._log.close()
+            job.emit('on_exit')
+            self._notify_positions()
+        elif proc is not None and proc.returncode is None:
+            self.engine.call_soon(signal_process, proc, 'terminate')
+
+    def queued_jobs(self):
+        with self._lock:
+            return [entry[2] for entry in self._queue]
+
+    def running_jobs(self):
+        with self._lock:
+            return list(self._running.values())
+
+    def get_job(self, job_id):
+        """Job in coda o in esecuzione con l'id dato, altrimenti None."""
+        with self._lock:
+            job = self._running.get(job_id)
+            if job is not None:
+                return job
+            for entry in self._queue:
+                if entry[2].id == job_id:
+                    return entry[2]
+        return None
+
+    def queue_position(self, job):
+        with self._lock:
+            for pos, entry in enumerate(self._queue, 1):
+                if entry[2] is job:
+                    return pos
+        return None
+
+    def shutdown(self):
+        with self._lock:
+            self._closed = True
+            jobs = self.queued_jobs() + self.running_jobs()
+        for job in jobs:
+            self.cancel(job)
+
+    def set_limits(self, max_workers, program_limits=None):
+        """Aggiorna i limiti (es. dopo la modifica di [LIMITS]); i job in corso non vengono toccati."""
+        with self._lock:
+            self.max_workers = max(1, max_workers)
+            self.program_limits = dict(program_limits or {})
+        if not self._pump():
+            self._notify_positions()
+
+    def _limit_for(self, key):
+        return self.program_limits.get(key, self.max_workers)
+
+    def _pump(self):
+        to_start = []
+        with self._lock:
+            for entry in list(self._queue):
+                if len(self._running) >= self.max_workers:
+                    break
+                job = entry[2]
+                key = job.limit_key
+                if self._per_key.get(key, 0) >= self._limit_for(key):
+                    continue
+                self._queue.remove(entry)
+                self._per_key[key] = self._per_key.get(key, 0) + 1
+                self._running[job.id] = job
+                job.state = RUNNING
+                to_start.append(job)
+        for job in to_start:
+            self.engine.submit(self._run(job))
+        if to_start:
+            self._notify_positions()
+        return bool(to_start)
+
+    def _notify_positions(self):
+        for pos, job in enumerate(self.queued_jobs(), 1):
+            job.emit('on_queue_position', pos)
+
+    @staticmethod
+    def _progress(job, progress):
+        job.progress = progress
+        job.emit('on_progress', progress)
+
+    async def _run(self, job):
+        loop = asyncio.get_running_loop()
+        timers = []
+        stage = job.stage_action
+        key = job.limit_key
+
+        def kill_if_running():
+            if job.proc.returncode is None:
+                signal_process(job.proc, 'kill')
+
+        def on_timeout():
+            job.timed_out = True
+            signal_process(job.proc, 'terminate')
+            # Se il programma ignora SIGTERM viene terminato dopo qualche secondo
+            timers.append(loop.call_later(TIMEOUT_KILL_GRACE, kill_if_running))
+
+        def on_start(proc):
+            job.proc = proc
+            if job.cancel_requested:
+                signal_process(proc, 'terminate')
+            timeout = getattr(getattr(stage, 'limits', None), 'timeout', None)
+            if timeout:
+                timers.append(loop.call_later(timeout, on_timeout))
+
+        last_line = [None]
+
+        def on_output(line):
+            if line.strip():
+                last_line[0] = line.strip()
+            job.emit('on_output', line)
+
+        if job.stage == 0:
+            job.start_time = datetime.datetime.now()
+        job.progress = None
+        if job.queued_at is not None:
+            metrics.QUEUE_WAIT_SECONDS.observe(time.perf_counter() - job.queued_at, action=stage.label)
+            TRACER.complete('queue_wait', job.queued_at, cat='job', action=stage.label, job=job.id)
+        job.emit('on_start')
+        log = job._log
+        run_start = run_end = None
+        advance = False
+        try:
+            if self.log_dir and log is None:
+                log = JobLog.create(self.log_dir, job.id, self.compress_logs, self.tail_lines)
+                job.log_path = log.path
+                job._log = log
+            header = ""
+            if job.stage_text:
+                header = f"[link_monitor] Fase {job.stage + 1}/{len(job.stages)}: {stage.label}\n"
+                job.emit('on_output', header)
+                if log is not None:
+                    log.write(header)
+            exit_code, run_start, run_end, output, usage = await run_command_async(
+                stage, job.url,
+                on_output=on_output,
+                on_progress=lambda progress: self._progress(job, progress),
+                on_start=on_start,
+                log=log,
+                job_id=job.id,
+                prev=job.prev)
+            job.exit_code = exit_code
+            job.end_time = run_end
+            if job.stage == 0:
+                job.start_time = run_start
+            job.resources = add_usage(job.resources, usage)
+            job.output = output if log is not None else job.output + header + output
+            if job.cancel_requested:
+                job.state = CANCELLED
+            elif exit_code == 0 and not job.timed_out and job.stage + 1 < len(job.stages):
+                advance = True
+            else:
+                job.state = DONE
+        except Exception as e:
+            job.error = e
+            job.state = FAILED
+        finally:
+            for timer in timers:
+                timer.cancel()
+            if log is not None and not advance:
+                log.close()
+            with self._lock:
+                self._running.pop(job.id, None)
+                self._per_key[key] = self._per_key.get(key, 1) - 1
+                if advance and not job.cancel_requested:
+                    # Fase successiva: torna in coda con la posizione originale del job
+                    job.stage += 1
+                    job.prev = last_line[0]
+                    job.state = QUEUED
+                    job.queued_at = time.perf_counter()
+                    bisect.insort(self._queue, (job.priority, job._seq, job))
+                else:
+                    if advance:
+                        job.state = CANCELLED
+                        if log is not None:
+                            log.close()
+                    advance = False
+                    if self._inflight.get(job.key) is job:
+                        del self._inflight[job.key]
+            if run_start is not None and run_end is not None:
+                metrics.JOB_DURATION_SECONDS.observe((run_end - run_start).total_seconds(), action=stage.label)
+            metrics.JOB_EXITS.inc(action=stage.label,
+                                  exit_code=job.exit_code if job.state != FAILED else 'error')
+            if not advance:
+                if self.result_cache is not None and job.state == DONE and job.exit_code == 0:
+                    self.result_cache.put(job.action, job.url, job.start_time)
+                job.emit('on_exit')
+            if not self._pump() and advance:
+                self._notify_positions()
@@ -1,8 +1,19 @@
-from config import load_config
-from clipboard_monitor import ClipboardMonitor
-from gui import ClipboardGUI
+import time
+
+# Riferimento per i tempi di avvio (--benchmark-startup)
+_T0 = time.perf_counter()
+
+import argparse
+import datetime
+import json
 import os, sys
-from tkinter import filedialog, messagebox
+import threading
+import metrics
+from tracing import TRACER
+from config import (ConfigReloader, load_cache_settings, load_history_settings, load_job_limits,
+                    load_metrics_settings, load_monitor_settings, load_tracing_settings)
+from config_watcher import ConfigWatcher
+from clipboard_monitor import AdaptivePollScheduler, ClipboardMonitor, ContentPolicy
 
 
 def find_or_select_config(default_paths=None):
@@ -20,6 +31,7 @@ def find_or_select_config(default_paths=None):
             print(path)
             return path
 
+    from tkinter import filedialog, messagebox
     messagebox.showwarning("File config.ini non trovato",
                            "Il file di configurazione 'config.ini' non è stato trovato nelle posizioni predefinite.\n"
                            "Selezionane uno manualmente, oppure annulla per uscire.")
@@ -46,33 +58,585 @@ def getDefaultPaths():
         # aggiungi altre posizioni di default valide per te
     ]
 
-def main():
-    # Lista posizioni preferenziali dove cercare config.ini
-    default_config_paths = getDefaultPaths()
-    # print(default_config_paths)
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Clipboard Link Handler")
+    parser.add_argument('--config', help="file di configurazione (default: ricerca nelle posizioni predefinite)")
+    parser.add_argument('--benchmark-startup', metavar='TESTO',
+                        help="misura i tempi di avvio: la clipboard (finta) contiene TESTO, "
+                             "stampa i tempi in JSON ed esce")
+    parser.add_argument('--trace', action='store_true',
+                        help="registra la traccia della sessione (come enabled in [TRACING])")
+    parser.add_argument('--headless', action='store_true',
+                        help="nessuna finestra: esegue le azioni autorun (o quelle scelte con --action) "
+                             "e scrive gli eventi in JSON, uno per riga")
+    parser.add_argument('--action', action='append', metavar='LABEL',
+                        help="(headless) azione da eseguire sui link riconosciuti, ripetibile; "
+                             "di default quelle con autorunN = true")
+    parser.add_argument('--backend', help="backend della clipboard (sostituisce backend di [MONITOR])")
+    parser.add_argument('--input', metavar='FILE',
+                        help="(headless) con --backend fake ogni riga di FILE ('-' = stdin) viene copiata "
+                             "nella clipboard; a fine file attende i job ed esce")
+    parser.add_argument('--log', metavar='FILE', help="(headless) file degli eventi (default: stdout)")
+    parser.add_argument('--no-history', action='store_true', help="(headless) non salva la cronologia")
+    # Istanza unica e comandi verso l'istanza in esecuzione
+    parser.add_argument('urls', nargs='*', metavar='URL',
+                        help="link da elaborare: con --action vengono accodati direttamente, "
+                             "altrimenti trattati come copiati; se il programma è già attivo vengono inviati a lui")
+    parser.add_argument('--force', action='store_true', help="con --action esegue anche i link già elaborati")
+    parser.add_argument('--list', action='store_true', help="elenca i job dell'istanza in esecuzione")
+    parser.add_argument('--cancel', metavar='JOB_ID', help="annulla un job dell'istanza in esecuzione ('all' = tutti)")
+    parser.add_argument('--stream', metavar='JOB_ID', type=int, help="segue l'output di un job dell'istanza in esecuzione")
+    parser.add_argument('--history', metavar='N', type=int, nargs='?', const=20,
+                        help="ultimi N record della cronologia dell'istanza in esecuzione")
+    parser.add_argument('--multi-instance', action='store_true',
+                        help="non controlla se il programma è già in esecuzione")
+    return parser.parse_args(argv)
+
+
+def instance_paths():
+    from instance import default_runtime_dir
+    runtime_dir = default_runtime_dir()
+    return os.path.join(runtime_dir, "instance.lock"), os.path.join(runtime_dir, "instance.sock")
+
+
+def client_requests(args):
+    """Richieste per l'istanza in esecuzione corrispondenti agli argomenti (lista vuota = nessuna)."""
+    requests = []
+    if args.urls:
+        requests.append({'cmd': 'submit', 'urls': args.urls, 'action': (args.action or [None])[0],
+                         'force': args.force})
+    if args.cancel:
+        if args.cancel == 'all':
+            requests.append({'cmd': 'cancel', 'all': True})
+        else:
+            requests.append({'cmd': 'cancel', 'job_id': int(args.cancel)})
+    if args.list:
+        requests.append({'cmd': 'list'})
+    if args.history is not None:
+        requests.append({'cmd': 'history', 'limit': args.history})
+    if args.stream is not None:
+        requests.append({'cmd': 'stream', 'job_id': args.stream})
+    return requests
+
+
+def forward_to_instance(args, socket_path):
+    """Invia il lavoro all'istanza già in esecuzione, stampando le risposte in JSON. Ritorna il codice di uscita."""
+    from instance import HAS_UNIX_SOCKETS, InstanceClient
+    if not HAS_UNIX_SOCKETS:
+        print("Il programma è già in esecuzione.", file=sys.stderr)
+        return 1
+    client = InstanceClient(socket_path)
+    requests = client_requests(args) or [{'cmd': 'show'}]
+    status = 0
+    try:
+        for request in requests:
+            if request['cmd'] == 'stream':
+                for message in client.stream(request['job_id']):
+                    print(json.dumps(message, ensure_ascii=False), flush=True)
+                    if message.get('ok') is False:
+                        status = 1
+                continue
+            response = client.request(request)
+            print(json.dumps(response, ensure_ascii=False, default=str))
+            if not response.get('ok'):
+                status = 1
+    except OSError as e:
+        print(f"Impossibile contattare l'istanza in esecuzione: {e}", file=sys.stderr)
+        return 1
+    return status
+
+
+def start_instance_server(args, scheduler, get_actions, on_text, history_store, result_cache,
+                          on_job_exit=None, on_show=None):
+    """
+    Avvia l'API locale (se l'istanza è unica e i socket UNIX sono
+    disponibili) ed elabora i link passati sulla riga di comando.
+    """
+    from instance import HAS_UNIX_SOCKETS, InstanceServer
+    server = InstanceServer(instance_paths()[1], scheduler, get_actions, on_text, history_store, result_cache,
+                            on_job_exit=on_job_exit, on_show=on_show)
+    if args.urls:
+        server.handle({'cmd': 'submit', 'urls': args.urls, 'action': (args.action or [None])[0],
+                       'force': args.force})
+    if args.multi_instance or args.benchmark_startup is not None or not HAS_UNIX_SOCKETS:
+        return None
+    try:
+        server.start()
+    except OSError as e:
+        print(f"API locale non disponibile: {e}", file=sys.stderr)
+        return None
+    return server
+
+
+def classify_clipboard(text, actions, bulk_min_links):
+    """
+    Ritorna ('batch', {azione: [url]}) se il testo contiene almeno
+    `bulk_min_links` link distinti, ('single', [azioni]) se è un link
+    riconosciuto, altrimenti None.
+    """
+    if len(text.split(None, bulk_min_links)) >= bulk_min_links:
+        links_by_action = actions.extract_links(text)
+        distinct = {url for urls in links_by_action.values() for url in urls}
+        if len(distinct) >= bulk_min_links:
+            return 'batch', links_by_action
+    matches = actions.match(text)
+    if matches:
+        return 'single', matches
+    return None
+
+
+def make_config_handler(reloader, scheduler, poll_scheduler, policy, settings, on_actions=None):
+    """
+    Callback per ConfigWatcher: ricarica solo le sezioni cambiate e applica
+    i nuovi valori a scheduler, polling e limiti del contenuto.
+    `on_actions` riceve la nuova ActionSet quando le azioni cambiano.
+    """
+    def on_config_change(path):
+        # Thread del watcher: si ricarica solo ciò che è cambiato
+        previous = reloader.actions
+        try:
+            changed = reloader.reload(path)
+        except Exception as e:
+            print(f"Configurazione non valida, mantengo la precedente: {e}", file=sys.stderr)
+            return
+        if 'LIMITS' in changed:
+            scheduler.set_limits(*load_job_limits(path))
+        if 'MONITOR' in changed:
+            new_settings = load_monitor_settings(path)
+            if new_settings['backend'] != settings['backend']:
+                print("Il cambio di backend clipboard ha effetto al prossimo avvio", file=sys.stderr)
+            poll_scheduler.min_interval = new_settings['poll_min_interval']
+            poll_scheduler.max_interval = new_settings['poll_max_interval']
+            poll_scheduler.backoff = max(new_settings['poll_backoff'], 1.0)
+            poll_scheduler.burst_polls = new_settings['poll_burst']
+            policy.max_size = new_settings['max_clipboard_chars']
+            policy.max_scan = new_settings['max_scan_chars']
+            policy.oversize = new_settings['oversize']
+            settings['bulk_min_links'] = new_settings['bulk_min_links']
+        if on_actions is not None and reloader.actions is not previous:
+            on_actions(reloader.actions)
+    return on_config_change
+
+
+def build_monitor(settings, callback, backend=None):
+    """Crea (senza avviarlo) il monitor della clipboard con i parametri di [MONITOR]."""
+    poll_scheduler = AdaptivePollScheduler(min_interval=settings['poll_min_interval'],
+                                           max_interval=settings['poll_max_interval'],
+                                           backoff=settings['poll_backoff'],
+                                           burst_polls=settings['poll_burst'])
+    policy = ContentPolicy(max_size=settings['max_clipboard_chars'],
+                           max_scan=settings['max_scan_chars'],
+                           oversize=settings['oversize'])
+    monitor = ClipboardMonitor(callback, backend=backend or settings['backend'],
+                               scheduler=poll_scheduler, policy=policy)
+    monitor.daemon = True
+    return monitor
+
+
+def build_scheduler(config_path, history=True):
+    """
+    Cronologia, cache dei risultati e scheduler dei job secondo [HISTORY],
+    [CACHE] e [LIMITS]. Con history=False la cronologia non viene aperta (None).
+    """
+    from jobs import JobScheduler
+    from history_store import HistoryStore
+    from result_cache import ResultCache
+
+    max_jobs, program_limits = load_job_limits(config_path)
+    history_settings = load_history_settings(config_path)
+    history_store = HistoryStore(history_settings['db_path']) if history else None
+    cache_settings = load_cache_settings(config_path)
+    result_cache = ResultCache(ttl=cache_settings['ttl'], max_entries=cache_settings['max_entries'],
+                               history_store=history_store)
+    scheduler = JobScheduler(max_workers=max_jobs, program_limits=program_limits,
+                             log_dir=history_settings['log_dir'],
+                             compress_logs=history_settings['compress_logs'],
+                             tail_lines=history_settings['tail_lines'],
+                             result_cache=result_cache)
+    metrics.watch_scheduler(scheduler)
+    return history_store, result_cache, scheduler
+
+
+def start_metrics_server(config_path):
+    """Avvia l'endpoint Prometheus se [METRICS] port è impostato; ritorna il server o None."""
+    port = load_metrics_settings(config_path)['port']
+    if not port:
+        return None
+    server = metrics.MetricsServer(port)
+    try:
+        server.start()
+    except OSError as e:
+        print(f"Endpoint delle metriche non avviato sulla porta {port}: {e}", file=sys.stderr)
+        return None
+    return server
+
+
+def start_tracing(args, config_path):
+    """Attiva il tracciamento se richiesto da --trace o da [TRACING]."""
+    settings = load_tracing_settings(config_path)
+    if not (args.trace or settings['enabled']):
+        return
+    try:
+        path = TRACER.start(settings['trace_dir'])
+    except OSError as e:
+        print(f"Traccia non attivata: {e}", file=sys.stderr)
+        return
+    print(f"Traccia della sessione: {path}", file=sys.stderr)
+
+
+def change_time(monitor):
+    """Inizio della lettura che ha portato al testo in esame (ora, se non arriva dal monitor)."""
+    if threading.current_thread() is monitor and monitor.last_change_time is not None:
+        return monitor.last_change_time
+    return time.perf_counter()
+
+
+class JsonEventLog:
+    """Eventi della modalità headless: un oggetto JSON per riga."""
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+        self._lock = threading.Lock()
+
+    def emit(self, event, **fields):
+        record = {'time': datetime.datetime.now().isoformat(timespec='milliseconds'), 'event': event}
+        record.update(fields)
+        line = json.dumps(record, ensure_ascii=False, default=str)
+        with self._lock:
+            self.stream.write(line + "\n")
+            self.stream.flush()
+
 
-    config_path = find_or_select_config(default_config_paths)
+def run_headless(args, config_path):
+    """
+    Monitor, riconoscimento ed esecuzione senza tkinter. Su ogni link
+    riconosciuto viene eseguita la prima azione selezionata (--action) o,
+    in mancanza, la prima con autorun; in caso di più link l'azione scelta
+    viene accodata per tutti. Ritorna il codice di uscita.
+    """
+    import signal
+    from jobs import Job, CANCELLED, FAILED, PRIORITY_BATCH, PRIORITY_NORMAL
+
+    # Argomenti controllati prima di aprire il log e avviare la traccia
+    if args.input and args.backend != 'fake':
+        print("--input richiede --backend fake", file=sys.stderr)
+        return 2
+
+    log_file = open(args.log, 'a', encoding='utf-8') if args.log else None
+    events = JsonEventLog(log_file)
+    start_tracing(args, config_path)
+    try:
+        reloader = ConfigReloader(config_path)
+        settings = load_monitor_settings(config_path)
+        history_store, result_cache, scheduler = build_scheduler(config_path, history=not args.no_history)
+    except BaseException:
+        # Configurazione non valida: niente da fermare oltre a traccia e log
+        TRACER.stop()
+        if log_file is not None:
+            log_file.close()
+        raise
+    selected = set(args.action or ())
+
+    stop_event = threading.Event()
+    active = set()
+    active_changed = threading.Condition()
+    saved_jobs = set()
+
+    def choose(actions):
+        for action in actions:
+            if (action.label in selected) if selected else action.autorun:
+                return action
+        return None
+
+    def finish(job):
+        fields = {'job_id': job.id, 'state': job.state, 'exit_code': job.exit_code, 'duration': job.duration,
+                  'log_path': job.log_path, 'resources': job.resources}
+        if job.timed_out:
+            fields['timed_out'] = True
+        if job.state == FAILED:
+            fields['error'] = str(job.error)
+        events.emit('exit', **fields)
+        if history_store is not None and job.state not in (CANCELLED, FAILED) and job.id not in saved_jobs:
+            saved_jobs.add(job.id)
+            history_store.add({
+                "link": job.url,
+                "start_time": job.start_time,
+                "duration": job.duration,
+                "exit_code": job.exit_code,
+                "outcome": job.outcome,
+                "action_label": job.action.label,
+                "output": job.output,
+                "log_path": job.log_path,
+                "resources": job.resources,
+            })
+
+    def on_exit(mine, job):
+        # Se il job è stato unito a un altro, l'uscita viene scritta dal job originale
+        if job is mine:
+            finish(job)
+        with active_changed:
+            active.discard(mine)
+            active_changed.notify_all()
+
+    def submit(action, url, priority):
+        # Senza finestra non si può chiedere: 'ask' equivale a 'skip'
+        hit = result_cache.previous(action, url)
+        if hit is not None:
+            events.emit('skipped', action=action.label, url=url, last_success=hit['start_time'])
+            return
+        job = Job(action, url, priority)
+        last_progress = [0.0]
+
+        def on_progress(j, progress):
+            # Al massimo un evento di avanzamento al secondo per job
+            now = time.monotonic()
+            if j is job and now - last_progress[0] >= 1.0:
+                last_progress[0] = now
+                events.emit('progress', job_id=j.id, **progress.as_dict())
+
+        # Se il job viene unito a uno già attivo i suoi listener ricevono gli eventi
+        # di quello: start e output vengono scritti una sola volta, dal job originale
+        job.add_listener(
+            on_start=lambda j: j is job and events.emit('start', job_id=j.id, action=j.action.label, url=j.url,
+                                                        stage=j.stage + 1, stages=len(j.stages)),
+            on_output=lambda j, line: j is job and events.emit('output', job_id=j.id, line=line.rstrip('\n')),
+            on_progress=on_progress,
+            on_exit=lambda j: on_exit(job, j))
+        with active_changed:
+            active.add(job)
+        events.emit('queued', job_id=job.id, action=action.label, url=url)
+        accepted = scheduler.submit(job)
+        if accepted is not job:
+            events.emit('merged', job_id=job.id, into=accepted.id)
+
+    def on_clipboard_change(text):
+        started = change_time(monitor)
+        with TRACER.span('match', chars=len(text)):
+            result = classify_clipboard(text, reloader.actions, settings['bulk_min_links'])
+        if result is None:
+            return
+        kind, found = result
+        metrics.DETECTIONS.inc(kind=kind)
+        metrics.COPY_TO_MATCH_SECONDS.observe(time.perf_counter() - started)
+        if kind == 'batch':
+            action = choose(found)
+            urls = found[action] if action is not None else []
+            events.emit('detection', kind=kind, links=len({url for urls in found.values() for url in urls}),
+                        actions=[a.label for a in found], selected=getattr(action, 'label', None))
+            for url in urls:
+                submit(action, url, PRIORITY_BATCH)
+        else:
+            action = choose(found)
+            events.emit('detection', kind=kind, text=text[:500], actions=[a.label for a in found],
+                        selected=getattr(action, 'label', None))
+            if action is not None:
+                submit(action, action.filter_url(text), PRIORITY_NORMAL)
+
+    backend = args.backend
+    if backend == 'fake':
+        from clipboard_backends import FakeClipboard
+        backend = FakeClipboard()
+    monitor = build_monitor(settings, on_clipboard_change, backend)
+    watcher = ConfigWatcher(config_path, make_config_handler(reloader, scheduler, monitor.scheduler,
+                                                             monitor.policy, settings))
+
+    def request_stop(signum=None, frame=None):
+        stop_event.set()
+
+    signal.signal(signal.SIGINT, request_stop)
+    signal.signal(signal.SIGTERM, request_stop)
+
+    server = start_instance_server(args, scheduler, lambda: reloader.actions, on_clipboard_change,
+                                   history_store, result_cache, on_job_exit=finish)
+    metrics_server = start_metrics_server(config_path)
+
+    monitor.start()
+    watcher.start()
+    events.emit('started', config=os.path.abspath(config_path), backend=args.backend or settings['backend'],
+                actions=[a.label for a in reloader.actions], selected=sorted(selected))
+
+    if args.input:
+        def feed():
+            # Ogni riga diventa un nuovo contenuto della clipboard finta
+            stream = sys.stdin if args.input == '-' else open(args.input, encoding='utf-8')
+            with stream:
+                for line in stream:
+                    line = line.rstrip('\n')
+                    if not line or stop_event.is_set():
+                        continue
+                    backend.set_text(line)
+                    # Attende che il monitor abbia gestito il contenuto prima del successivo:
+                    # alla fine dell'input i job devono essere già in `active`
+                    fingerprint = monitor.policy.fingerprint(line)
+                    deadline = time.monotonic() + 5
+                    while monitor.handled_fingerprint != fingerprint and time.monotonic() < deadline:
+                        time.sleep(0.001)
+            # Fine dell'input: attende i job accodati e termina
+            with active_changed:
+                while active and not stop_event.is_set():
+                    active_changed.wait(0.5)
+            stop_event.set()
+
+        threading.Thread(target=feed, daemon=True).start()
+
+    try:
+        while not stop_event.wait(0.5):
+            pass
+    finally:
+        if server is not None:
+            server.stop()
+        if metrics_server is not None:
+            metrics_server.stop()
+        watcher.stop()
+        monitor.stop()
+        scheduler.shutdown()
+        if history_store is not None:
+            history_store.close()
+        TRACER.stop()
+        events.emit('stopped')
+        if log_file is not None:
+            log_file.close()
+    return 0
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    marks = {}
+
+    def mark(name):
+        marks.setdefault(name, round(time.perf_counter() - _T0, 4))
+
+    # Una sola istanza: le successive inoltrano il lavoro a quella attiva
+    lock = None
+    if not args.multi_instance and args.benchmark_startup is None:
+        from instance import InstanceLock
+        lock_path, socket_path = instance_paths()
+        # Il riferimento resta vivo fino all'uscita: chiudere il file rilascerebbe il lock
+        lock = InstanceLock(lock_path)
+        if not lock.acquire():
+            sys.exit(forward_to_instance(args, socket_path))
+    if args.list or args.cancel or args.stream is not None or args.history is not None:
+        print("Nessuna istanza in esecuzione.", file=sys.stderr)
+        sys.exit(1)
+
+    if args.config:
+        config_path = args.config
+    elif args.headless:
+        config_path = next((path for path in getDefaultPaths() if os.path.isfile(path)), None)
+    else:
+        # Lista posizioni preferenziali dove cercare config.ini
+        config_path = find_or_select_config(getDefaultPaths())
     if not config_path:
+        if args.headless:
+            print("Impossibile trovare il file di configurazione.", file=sys.stderr)
+            sys.exit(1)
+        from tkinter import messagebox
         messagebox.showerror("Configurazione assente", "Impossibile trovare il file di configurazione. Il programma verrà chiuso.")
         sys.exit(1)
 
-    # Carica config di default usando il percorso `config_path`
-    # config_path = 'config.ini'
-    actions = load_config(config_path)
-    gui = ClipboardGUI(actions)
+    if args.headless:
+        sys.exit(run_headless(args, config_path))
+
+    start_tracing(args, config_path)
+    # Prima si avvia il monitor della clipboard: la finestra viene costruita dopo
+    reloader = ConfigReloader(config_path)
+    settings = load_monitor_settings(config_path)
+
+    # Finché la GUI non esiste le richieste per la finestra restano in attesa
+    gui = None
+    pending = []
+    pending_lock = threading.Lock()
+
+    def to_gui(func):
+        with pending_lock:
+            if gui is None:
+                pending.append(func)
+                return
+        gui.ui.post(func)
 
     def on_clipboard_change(text):
-        if any(a.pattern.match(text) for a in gui.actions):
-            gui.after(0, lambda: gui.show_actions_for_link(text))
+        started = change_time(monitor)
+        with TRACER.span('match', chars=len(text)):
+            result = classify_clipboard(text, reloader.actions, settings['bulk_min_links'])
+        if result is None:
+            return
+        if args.benchmark_startup is not None:
+            mark('first_detection')
+            return
+        kind, found = result
+        metrics.DETECTIONS.inc(kind=kind)
+        queued = time.perf_counter()
 
-    monitor = ClipboardMonitor(on_clipboard_change)
-    monitor.daemon = True
+        def present():
+            # Attesa nel canale verso Tk (gui.ui)
+            TRACER.complete('ui.post', queued)
+            if kind == 'batch':
+                # Più link nella clipboard: un'unica tab batch
+                gui.show_batch_for_links(found)
+            else:
+                gui.show_actions_for_link(text)
+            metrics.COPY_TO_MATCH_SECONDS.observe(time.perf_counter() - started)
+
+        to_gui(present)
+
+    backend = args.backend
+    if args.benchmark_startup is not None:
+        from clipboard_backends import FakeClipboard
+        backend = FakeClipboard(args.benchmark_startup)
+    monitor = build_monitor(settings, on_clipboard_change, backend)
     monitor.start()
+    mark('monitor_armed')
+
+    # Moduli della finestra e dell'esecuzione: importati solo ora
+    from gui import ClipboardGUI
+    history_store, result_cache, scheduler = build_scheduler(config_path)
+    window = ClipboardGUI(reloader.actions, scheduler=scheduler, history_store=history_store)
+    with pending_lock:
+        gui = window
+        for func in pending:
+            gui.ui.post(func)
+        pending.clear()
+
+    def show_window():
+        gui.deiconify()
+        gui.lift()
+        gui.focus_force()
+
+    server = start_instance_server(args, scheduler, lambda: reloader.actions, on_clipboard_change,
+                                   history_store, result_cache,
+                                   on_job_exit=lambda job: gui.ui.post(gui.save_job_to_history, job),
+                                   on_show=lambda: gui.ui.post(show_window))
+    metrics_server = start_metrics_server(config_path)
+
+    on_config_change = make_config_handler(
+        reloader, scheduler, monitor.scheduler, monitor.policy, settings,
+        on_actions=lambda actions: gui.ui.post(gui.set_actions, actions))
+    watcher = ConfigWatcher(config_path, on_config_change)
+    gui.config_watcher = watcher
+    watcher.start()
+
+    if args.benchmark_startup is not None:
+        def window_shown():
+            mark('window')
+            if 'first_detection' in marks or time.perf_counter() - _T0 > 30:
+                print(json.dumps(marks))
+                gui.destroy()
+            else:
+                gui.after(5, window_shown)
+        gui.after_idle(window_shown)
 
     try:
         gui.mainloop()
     finally:
+        gui.ui.close()
+        if server is not None:
+            server.stop()
+        if metrics_server is not None:
+            metrics_server.stop()
+        watcher.stop()
         monitor.stop()
+        scheduler.shutdown()
+        history_store.close()
+        TRACER.stop()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,207 @@
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+from metrics import MATCH_SECONDS
+from regex_cost import RULE, guard_for
+
+try:
+    import re._parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
+
+
+_TOKEN_RE = re.compile(r'\S+')
+
+
+def text_digest(text):
+    """Digest compatto del testo, usato come chiave di cache."""
+    return hashlib.blake2b(text.encode('utf-8', 'surrogatepass'), digest_size=16).digest()
+
+
+def required_literal(compiled):
+    """
+    Ritorna la sequenza letterale più lunga che deve comparire nel testo
+    perché `compiled` possa fare match (es. 'youtube.com/watch' per
+    'https?://.*youtube\\.com/watch.*'), oppure '' se non è ricavabile.
+    """
+    if compiled.flags & re.IGNORECASE:
+        return ''
+    try:
+        parsed = sre_parse.parse(compiled.pattern, compiled.flags)
+    except Exception:
+        return ''
+
+    best = current = ''
+    # Solo gli elementi al primo livello della sequenza sono obbligatori
+    for op, av in parsed:
+        if op == sre_parse.LITERAL:
+            current += chr(av)
+        else:
+            if len(current) > len(best):
+                best = current
+            current = ''
+    if len(current) > len(best):
+        best = current
+    return best
+
+
+def _overlaps(literal, other):
+    """True se una parte finale di `literal` è l'inizio di `other` (che non vi è contenuto)."""
+    return other not in literal and any(literal.endswith(other[:size])
+                                        for size in range(1, min(len(literal), len(other))))
+
+
+class LinkMatcher:
+    """
+    Dispatcher compilato delle LinkAction: le regex duplicate vengono
+    valutate una sola volta e ciascuna è indicizzata sul proprio letterale
+    obbligatorio, così per ogni testo si provano solo le regex candidate:
+    i letterali sono cercati tutti insieme con un'unica regex alternata
+    (una sola scansione del testo, qualunque sia il numero di regole).
+    I risultati sono memorizzati per digest del testo. Ogni regex ha il suo
+    budget di tempo (regex_cost.PatternGuard): oltre il budget viene sospesa.
+    """
+    def __init__(self, actions, cache_size=64):
+        groups = OrderedDict()
+        for position, action in enumerate(actions):
+            key = (action.pattern.pattern, action.pattern.flags)
+            if key not in groups:
+                groups[key] = (action.pattern, [], MATCH_SECONDS.labels(rule=action.pattern.pattern),
+                               guard_for(action.pattern, RULE))
+            groups[key][1].append((position, action))
+
+        self._groups = list(groups.values())
+        self._by_literal = {}
+        self._always = []
+        for idx, (pattern, _, _, _) in enumerate(self._groups):
+            literal = required_literal(pattern)
+            if literal:
+                self._by_literal.setdefault(literal, []).append(idx)
+            else:
+                self._always.append(idx)
+
+        # Dal più lungo: a parità di posizione l'alternanza trova il letterale più lungo,
+        # che implica quelli contenuti in esso
+        literals = sorted(self._by_literal, key=len, reverse=True)
+        self._literal_re = re.compile('|'.join(map(re.escape, literals))) if literals else None
+        self._implied = {literal: sorted({idx for other in literals if other in literal
+                                          for idx in self._by_literal[other]})
+                         for literal in literals}
+        # Letterali dopo i quali la ricerca riparte dalla posizione successiva e non
+        # dalla fine: un altro letterale può iniziare al loro interno
+        self._overlapping = {literal for literal in literals
+                             if any(_overlaps(literal, other) for other in literals)}
+
+        self._cache = OrderedDict()
+        self._cache_size = cache_size
+        self._lock = threading.Lock()
+
+    @property
+    def pattern_count(self):
+        return len(self._groups)
+
+    def candidates(self, text):
+        """Indici dei gruppi di regex che superano il prefiltro letterale."""
+        if self._literal_re is None:
+            return list(self._always)
+        if self._overlapping:
+            search = self._literal_re.search
+            found = set()
+            pos = 0
+            while True:
+                m = search(text, pos)
+                if m is None:
+                    break
+                literal = m.group()
+                found.add(literal)
+                pos = m.start() + 1 if literal in self._overlapping else m.end()
+        else:
+            found = set(self._literal_re.findall(text))
+        if not found:
+            return list(self._always)
+        idxs = set(self._always)
+        for literal in found:
+            idxs.update(self._implied[literal])
+        return sorted(idxs)
+
+    def _match_uncached(self, text):
+        matched = []
+        for idx in self.candidates(text):
+            pattern, actions, timing, guard = self._groups[idx]
+            # Regex sospesa (oltre il budget) o testo limitato alla lunghezza sicura
+            end = guard.window(text)
+            if end is None:
+                continue
+            start = time.perf_counter()
+            found = pattern.match(text, 0, end)
+            elapsed = time.perf_counter() - start
+            timing.observe(elapsed)
+            guard.record(elapsed)
+            if found:
+                matched.extend(actions)
+        matched.sort(key=lambda item: item[0])
+        return [action for _, action in matched]
+
+    def iter_links(self, text):
+        """
+        Scorre il testo token per token (separati da spazi o a capo) e
+        restituisce le coppie (token, azioni che fanno match).
+        """
+        for token_match in _TOKEN_RE.finditer(text):
+            token = token_match.group().strip('<>"\'').rstrip(',;')
+            if not token:
+                continue
+            actions = self._match_uncached(token)
+            if actions:
+                yield token, actions
+
+    def extract_links(self, text):
+        """
+        Estrae tutti i link dal testo (es. una lista di URL) e li raggruppa
+        per azione. I duplicati vengono rimossi dopo aver applicato il filtro
+        dell'azione, mantenendo l'ordine di comparsa.
+        Ritorna un dict {azione: [url filtrati]}.
+        """
+        links_by_action = OrderedDict()
+        seen = {}
+        for token, actions in self.iter_links(text):
+            for action in actions:
+                url = action.filter_url(token)
+                action_seen = seen.setdefault(id(action), set())
+                if url in action_seen:
+                    continue
+                action_seen.add(url)
+                links_by_action.setdefault(action, []).append(url)
+        return links_by_action
+
+    def match(self, text, digest=None):
+        """Ritorna tutte le azioni la cui regex fa match su `text`, in ordine di configurazione."""
+        key = digest if digest is not None else text_digest(text)
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                return list(cached)
+
+        result = self._match_uncached(text)
+
+        with self._lock:
+            self._cache[key] = result
+            if len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+        return list(result)
+
+
+class ActionSet(list):
+    """Lista delle LinkAction caricate, con il relativo LinkMatcher."""
+    def __init__(self, actions=()):
+        super().__init__(actions)
+        self.matcher = LinkMatcher(self)
+
+    def match(self, text, digest=None):
+        return self.matcher.match(text, digest)
+
+    def extract_links(self, text):
+        return self.matcher.extract_links(text)
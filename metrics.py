@@ -0,0 +1,305 @@
+import bisect
+import math
+import threading
+import time
+
+# Limiti dei bucket (secondi) per gli istogrammi dei tempi: da 50 µs a 30 minuti
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+                   0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 1800.0)
+
+
+def _label_key(labelnames, labels):
+    if set(labels) != set(labelnames):
+        raise ValueError(f"Etichette attese {labelnames}, ricevute {tuple(labels)}")
+    return tuple(str(labels[name]) for name in labelnames)
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labelnames, key, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, key)]
+    pairs.extend(f'{name}="{value}"' for name, value in extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return sorted(self._values.items())
+
+    def render(self):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                for key, value in self.samples()]
+
+
+class Gauge(Counter):
+    """Valore istantaneo; con set_function viene letto al momento dell'esportazione."""
+    kind = 'gauge'
+
+    def __init__(self, name, help_text, labelnames=()):
+        super().__init__(name, help_text, labelnames)
+        self._function = None
+
+    def set(self, value, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = value
+
+    def set_function(self, function):
+        self._function = function
+
+    def samples(self):
+        if self._function is not None:
+            try:
+                return [((), self._function())]
+            except Exception:
+                return []
+        return super().samples()
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # chiave etichette -> [conteggi per bucket (+Inf in fondo), somma, conteggio]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        self._observe(_label_key(self.labelnames, labels), value)
+
+    def labels(self, **labels):
+        """Istogramma con le etichette già risolte, per i percorsi più frequenti."""
+        return _BoundHistogram(self, _label_key(self.labelnames, labels))
+
+    def _observe(self, key, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def time(self, **labels):
+        """Context manager che misura la durata del blocco."""
+        return _Timer(self, labels)
+
+    def samples(self):
+        with self._lock:
+            return sorted((key, (list(entry[0]), entry[1], entry[2])) for key, entry in self._values.items())
+
+    def quantile(self, counts, total, q):
+        """Stima del quantile q dai bucket (interpolazione lineare nel bucket)."""
+        if not total:
+            return None
+        rank = q * total
+        cumulative = 0
+        lower = 0.0
+        for bound, count in zip(self.buckets + (math.inf,), counts):
+            if cumulative + count >= rank and count:
+                if bound == math.inf:
+                    return lower
+                return lower + (bound - lower) * (rank - cumulative) / count
+            cumulative += count
+            lower = bound
+        return lower
+
+    def render(self):
+        lines = []
+        for key, (counts, total_sum, count) in self.samples():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', _format_value(bound))])} "
+                             f"{cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total_sum)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class _BoundHistogram:
+    def __init__(self, histogram, key):
+        self._histogram = histogram
+        self._key = key
+
+    def observe(self, value):
+        self._histogram._observe(self._key, value)
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, help_text, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help_text, labelnames, **kwargs)
+            return metric
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._get(Counter, name, help_text, labelnames)
+
+    def gauge(self, name, help_text, labelnames=()):
+        return self._get(Gauge, name, help_text, labelnames)
+
+    def histogram(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._get(Histogram, name, help_text, labelnames, buckets=buckets)
+
+    def metrics(self):
+        with self._lock:
+            return list(self._metrics.values())
+
+    def render_prometheus(self):
+        """Tutte le metriche nel formato di testo di Prometheus (0.0.4)."""
+        lines = []
+        for metric in self.metrics():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        """
+        Righe riassuntive per la finestra delle statistiche e per l'API:
+        {'name', 'labels', 'count', 'value', 'mean', 'p50', 'p95'}.
+        """
+        rows = []
+        for metric in self.metrics():
+            for key, sample in metric.samples():
+                row = {'name': metric.name, 'labels': dict(zip(metric.labelnames, key))}
+                if metric.kind == 'histogram':
+                    counts, total_sum, count = sample
+                    row.update(count=count, value=total_sum, mean=total_sum / count if count else None,
+                               p50=metric.quantile(counts, count, 0.5), p95=metric.quantile(counts, count, 0.95))
+                else:
+                    row.update(count=None, value=sample, mean=None, p50=None, p95=None)
+                rows.append(row)
+        return rows
+
+
+REGISTRY = Registry()
+
+# --- metriche del programma -------------------------------------------------------
+
+CLIPBOARD_READ_SECONDS = REGISTRY.histogram(
+    'link_monitor_clipboard_read_seconds', "Durata di una lettura della clipboard", ('backend',))
+CLIPBOARD_CHANGES = REGISTRY.counter(
+    'link_monitor_clipboard_changes_total', "Cambi di contenuto della clipboard")
+MATCH_SECONDS = REGISTRY.histogram(
+    'link_monitor_match_seconds', "Durata della regex di una regola su un testo", ('rule',))
+DETECTIONS = REGISTRY.counter(
+    'link_monitor_detections_total', "Testi copiati riconosciuti da almeno una regola", ('kind',))
+COPY_TO_MATCH_SECONDS = REGISTRY.histogram(
+    'link_monitor_copy_to_match_seconds', "Dalla lettura della clipboard alla presentazione delle azioni")
+QUEUE_WAIT_SECONDS = REGISTRY.histogram(
+    'link_monitor_job_queue_wait_seconds', "Attesa in coda prima dell'avvio", ('action',))
+SPAWN_SECONDS = REGISTRY.histogram(
+    'link_monitor_job_spawn_seconds', "Durata dell'avvio del processo (Popen)", ('action',))
+FIRST_OUTPUT_SECONDS = REGISTRY.histogram(
+    'link_monitor_job_first_output_seconds', "Dall'avvio del processo alla prima riga di output", ('action',))
+JOB_DURATION_SECONDS = REGISTRY.histogram(
+    'link_monitor_job_duration_seconds', "Durata dei job", ('action',))
+JOB_EXITS = REGISTRY.counter(
+    'link_monitor_job_exits_total', "Job terminati per azione ed exit code", ('action', 'exit_code'))
+REGEX_BUDGET_EXCEEDED = REGISTRY.counter(
+    'link_monitor_regex_budget_exceeded_total', "Chiamate di una regex oltre il budget di tempo", ('rule',))
+REGEX_SKIPPED = REGISTRY.counter(
+    'link_monitor_regex_skipped_total', "Testi non analizzati (sospesa) o troncati (length) per una regex",
+    ('rule', 'reason'))
+JOBS_RUNNING = REGISTRY.gauge('link_monitor_jobs_running', "Job in esecuzione")
+JOBS_QUEUED = REGISTRY.gauge('link_monitor_jobs_queued', "Job in coda")
+
+
+def watch_scheduler(scheduler):
+    """Collega i gauge dei job allo scheduler."""
+    JOBS_RUNNING.set_function(lambda: len(scheduler.running_jobs()))
+    JOBS_QUEUED.set_function(lambda: len(scheduler.queued_jobs()))
+
+
+def _handler_class():
+    # http.server viene importato solo se l'esportazione è attiva (avvio più rapido)
+    import http.server
+
+    class MetricsHandler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] not in ('/', '/metrics'):
+                self.send_error(404)
+                return
+            body = self.server.registry.render_prometheus().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return http.server.ThreadingHTTPServer, MetricsHandler
+
+
+class MetricsServer:
+    """Esporta il registro in formato Prometheus su http://host:port/metrics."""
+    def __init__(self, port, host='127.0.0.1', registry=REGISTRY):
+        self.host = host
+        self.port = port
+        self.registry = registry
+        self._server = None
+
+    def start(self):
+        server_class, handler_class = _handler_class()
+        self._server = server_class((self.host, self.port), handler_class)
+        self._server.daemon_threads = True
+        self._server.registry = self.registry
+        self.port = self._server.server_address[1]
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
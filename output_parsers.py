@@ -0,0 +1,221 @@
+import codecs
+import locale
+import ntpath
+import re
+
+_LINE_END_RE = re.compile(r'(\r\n|\r|\n)')
+_PERCENT_RE = re.compile(r'(\d{1,3}(?:\.\d+)?)\s*%')
+
+
+def make_decoder(encoding=None):
+    """Decoder incrementale per l'output dei processi (i byte non validi vengono sostituiti)."""
+    return codecs.getincrementaldecoder(encoding or locale.getpreferredencoding(False))(errors='replace')
+
+
+def read_text(stream, encoding=None, chunk_size=65536):
+    """
+    Legge l'output binario di un processo man mano che arriva e restituisce
+    il testo decodificato, senza toccare i fine riga.
+    """
+    decoder = make_decoder(encoding)
+    read = getattr(stream, 'read1', stream.read)
+    while True:
+        data = read(chunk_size)
+        text = decoder.decode(data, final=not data)
+        if text:
+            yield text
+        if not data:
+            return
+
+
+class Progress:
+    """Stato di avanzamento di un job: percent (0-100 o None), speed ed eta come testo."""
+    __slots__ = ('percent', 'speed', 'eta', 'text')
+
+    def __init__(self, text, percent=None, speed=None, eta=None):
+        self.text = text
+        self.percent = percent
+        self.speed = speed
+        self.eta = eta
+
+    def as_dict(self):
+        return {'percent': self.percent, 'speed': self.speed, 'eta': self.eta, 'text': self.text}
+
+    def summary(self):
+        parts = [f"{self.percent:.1f}%"] if self.percent is not None else []
+        if self.speed:
+            parts.append(self.speed)
+        if self.eta:
+            parts.append(f"ETA {self.eta}")
+        return " · ".join(parts) if parts else self.text.strip()
+
+
+class OutputParser:
+    """
+    Interpreta l'output di un programma segmento per segmento.
+
+    feed() ritorna la lista degli elementi da produrre: stringhe (righe da
+    mostrare e conservare, terminate da '\\n') o Progress (stato transitorio,
+    da mostrare sul posto e non conservare). Le righe riscritte con '\\r'
+    sono transitorie; l'ultimo stato viene conservato come riga quando il
+    programma va a capo, prima di un messaggio o alla fine (finish()).
+    Le sottoclassi riconoscono i formati di avanzamento dei singoli programmi.
+    """
+    # Testo presente in tutte le righe di avanzamento terminate da '\n' (vedi progress_line)
+    marker = None
+
+    def __init__(self):
+        self.pending = None
+        # True se il segmento precedente terminava con '\r' (il prossimo riscrive la riga)
+        self.rewriting = False
+        # Ultimo segmento ancora senza terminatore
+        self._rest = ""
+
+    def feed_text(self, text):
+        """Come feed() per un blocco di testo qualsiasi (es. quello letto da read_text)."""
+        text = self._rest + text
+        if ('\r' not in text and self.pending is None and not self.rewriting
+                and (self.marker is None or self.marker not in text)):
+            # Solo righe normali: nessuna analisi riga per riga
+            lines = text.split('\n')
+            self._rest = lines.pop()
+            return [line + '\n' for line in lines]
+        parts = _LINE_END_RE.split(text)
+        self._rest = parts.pop()
+        items = []
+        for i in range(0, len(parts), 2):
+            items.extend(self.feed(parts[i], '\r' if parts[i + 1] == '\r' else '\n'))
+        return items
+
+    def transient(self, text):
+        """Progress per una riga riscritta con '\\r'."""
+        match = _PERCENT_RE.search(text)
+        percent = float(match.group(1)) if match else None
+        return Progress(text, percent if percent is not None and percent <= 100 else None)
+
+    def progress_line(self, text):
+        """Progress se una riga terminata da '\\n' è in realtà un aggiornamento di avanzamento."""
+        return None
+
+    def feed(self, text, terminator):
+        if terminator == '\r':
+            self.rewriting = True
+            if not text:
+                return []
+            self.pending = self.transient(text)
+            return [self.pending]
+        rewriting = self.rewriting
+        self.rewriting = False
+        if not text and self.pending is not None:
+            # Fine della riga di avanzamento: l'ultimo stato resta nell'output
+            return [self._commit()]
+        progress = self.progress_line(text)
+        if progress is not None:
+            self.pending = progress
+            return [progress]
+        line = text + '\n'
+        if self.pending is not None:
+            if rewriting:
+                # La riga sostituisce quella di avanzamento (come in un terminale)
+                self.pending = None
+                return [line]
+            return [self._commit(), line]
+        return [line]
+
+    def finish(self):
+        """Righe finali da conservare: l'ultimo segmento e lo stato di avanzamento non ancora chiuso."""
+        items = self.feed(self._rest, '') if self._rest else []
+        self._rest = ""
+        if self.pending is not None:
+            items.append(self._commit())
+        return items
+
+    def _commit(self):
+        line = self.pending.text.strip() + '\n'
+        self.pending = None
+        return line
+
+
+class RawParser(OutputParser):
+    """Nessuna interpretazione: ogni segmento è una riga (comportamento precedente)."""
+    def feed(self, text, terminator):
+        if terminator == '\r':
+            self.rewriting = True
+            return [text + '\n'] if text else []
+        rewriting = self.rewriting
+        self.rewriting = False
+        if not text and rewriting:
+            # '\r\n' diviso tra due letture
+            return []
+        return [text + '\n']
+
+
+class YtDlpParser(OutputParser):
+    """yt-dlp / youtube-dl: '[download]  42.3% of ~ 10.00MiB at 3.10MiB/s ETA 00:02 (frag 3/10)'."""
+    marker = '[download]'
+    PROGRESS_RE = re.compile(
+        r'^\[download\]\s+(?P<percent>\d{1,3}(?:\.\d+)?)%'
+        r'(?:\s+of\s+~?\s*(?P<size>\S+))?'
+        r'(?:\s+in\s+(?P<elapsed>\S+))?'
+        r'(?:\s+at\s+(?P<speed>[^\s]+(?:\s*/s)?))?'
+        r'(?:\s+ETA\s+(?P<eta>\S+))?')
+
+    def _parse(self, text):
+        match = self.PROGRESS_RE.match(text.strip())
+        if match is None:
+            return None
+        speed = match.group('speed')
+        return Progress(text, float(match.group('percent')),
+                        speed if speed and speed != 'Unknown' else None, match.group('eta'))
+
+    def transient(self, text):
+        return self._parse(text) or super().transient(text)
+
+    def progress_line(self, text):
+        return self._parse(text)
+
+
+class FfmpegParser(OutputParser):
+    """ffmpeg: 'frame= 1234 fps= 98 ... time=00:01:02.03 bitrate=... speed=3.9x'."""
+    STATS_RE = re.compile(r'time=\s*(?P<time>\S+).*?speed=\s*(?P<speed>\S+)')
+
+    def transient(self, text):
+        match = self.STATS_RE.search(text)
+        if match is None:
+            return super().transient(text)
+        return Progress(text, None, match.group('speed'), None)
+
+
+PARSERS = {
+    'plain': OutputParser,
+    'raw': RawParser,
+    'yt-dlp': YtDlpParser,
+    'ffmpeg': FfmpegParser,
+}
+
+# Nome dell'eseguibile -> parser scelto con parserN = auto (il default)
+AUTO_PARSERS = {
+    'yt-dlp': 'yt-dlp',
+    'youtube-dl': 'yt-dlp',
+    'ffmpeg': 'ffmpeg',
+}
+
+
+def register_parser(name, parser_class, executables=()):
+    """Aggiunge un parser (sottoclasse di OutputParser), scelto anche in automatico per `executables`."""
+    PARSERS[name] = parser_class
+    for executable in executables:
+        AUTO_PARSERS[executable] = name
+
+
+def parser_for(name, executable=None):
+    """Istanza del parser `name` ('auto' = in base al nome dell'eseguibile)."""
+    if name in (None, '', 'auto'):
+        # ntpath divide sia '/' sia '\\': i percorsi Windows del config valgono anche altrove
+        base = ntpath.basename(executable or "").lower()
+        base = base[:-4] if base.endswith('.exe') else base
+        name = AUTO_PARSERS.get(base, 'plain')
+    try:
+        return PARSERS[name]()
+    except KeyError:
+        raise ValueError(f"Parser di output sconosciuto: {name} (disponibili: auto, {', '.join(PARSERS)})")
@@ -0,0 +1,90 @@
+import queue
+import tkinter as tk
+
+
+class OutputPump:
+    """
+    Porta l'output dei processi in un widget Text senza toccare Tk dai
+    thread di lettura: put() accoda le righe (thread-safe), il timer after()
+    del thread di Tk le inserisce a blocchi, al massimo una volta ogni
+    `flush_ms`, raggruppando le righe consecutive con lo stesso tag.
+    Il widget conserva solo le ultime `max_lines` righe.
+    """
+    def __init__(self, text_widget, classify=None, flush_ms=100, idle_ms=250, max_lines=2000,
+                 max_chars_per_flush=262144):
+        self.widget = text_widget
+        self.classify = classify or (lambda line: None)
+        self.flush_ms = flush_ms
+        self.idle_ms = idle_ms
+        self.max_lines = max_lines
+        self.max_chars_per_flush = max_chars_per_flush
+        self._queue = queue.SimpleQueue()
+        self._after_id = None
+        self._stopped = False
+        self._schedule(self.idle_ms)
+
+    def put(self, text):
+        self._queue.put(text)
+
+    def clear(self):
+        self._drain(None)
+        self.widget.delete('1.0', tk.END)
+
+    def stop(self):
+        self._stopped = True
+        if self._after_id is not None:
+            try:
+                self.widget.after_cancel(self._after_id)
+            except tk.TclError:
+                pass
+            self._after_id = None
+
+    def _schedule(self, delay):
+        if not self._stopped:
+            self._after_id = self.widget.after(delay, self._flush)
+
+    def _drain(self, max_chars):
+        chunks = []
+        size = 0
+        while max_chars is None or size < max_chars:
+            try:
+                text = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            chunks.append(text)
+            size += len(text)
+        return chunks
+
+    def _flush(self):
+        self._after_id = None
+        try:
+            if not self.widget.winfo_exists():
+                return
+        except tk.TclError:
+            return
+
+        chunks = self._drain(self.max_chars_per_flush)
+        if not chunks:
+            self._schedule(self.idle_ms)
+            return
+
+        # Raggruppa le righe consecutive con lo stesso tag: un solo insert
+        args = []
+        current_tag = object()
+        for text in chunks:
+            tag = self.classify(text)
+            if args and tag == current_tag:
+                args[-2] += text
+            else:
+                args.extend([text, tag or ()])
+                current_tag = tag
+        self.widget.insert(tk.END, *args)
+
+        # Buffer circolare: elimina le righe più vecchie oltre il limite
+        line_count = int(self.widget.index('end-1c').split('.')[0])
+        excess = line_count - self.max_lines
+        if excess > 0:
+            self.widget.delete('1.0', f'{excess + 1}.0')
+        self.widget.see(tk.END)
+
+        self._schedule(self.flush_ms)
@@ -0,0 +1,474 @@
+import math
+import sys
+import threading
+import time
+from collections import deque
+import metrics
+
+try:
+    import re._parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
+
+# Tipi di regex: le regole fanno match all'inizio del testo, i filtri cercano ovunque (sub)
+RULE = 'regola'
+FILTER = 'filtro'
+
+DEFAULT_REGEX_SETTINGS = {
+    'budget_ms': 50.0,
+    'quarantine': 600,
+    'strikes': 3,
+    'profile': True,
+    'profile_chars': 8192,
+}
+
+_REPEATS = {sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT}
+_UNBOUNDED = sre_parse.MAXREPEAT
+
+
+# --- analisi statica -------------------------------------------------------------
+
+def _children(op, av):
+    """Sotto-sequenze di un nodo dell'albero di sre_parse."""
+    if op in _REPEATS or op == getattr(sre_parse, 'POSSESSIVE_REPEAT', None):
+        return [av[2]]
+    if op == sre_parse.SUBPATTERN:
+        return [av[3]]
+    if op == sre_parse.BRANCH:
+        return list(av[1])
+    if op in (sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+        return [av[1]]
+    if op == getattr(sre_parse, 'ATOMIC_GROUP', None):
+        return [av]
+    return []
+
+
+def _has_variable_repeat(seq):
+    for op, av in seq:
+        if op in _REPEATS and av[1] != av[0]:
+            return True
+        if any(_has_variable_repeat(child) for child in _children(op, av)):
+            return True
+    return False
+
+
+def _has_branch(seq):
+    for op, av in seq:
+        if op == sre_parse.BRANCH and len(av[1]) > 1:
+            return True
+        if op not in _REPEATS and any(_has_branch(child) for child in _children(op, av)):
+            return True
+    return False
+
+
+def _analyze(seq, risks, in_repeat=False):
+    unbounded = 0
+    for op, av in seq:
+        if op == sre_parse.GROUPREF:
+            risks.add("riferimento a un gruppo (\\N): il costo non è limitato")
+        if op in _REPEATS and av[1] == _UNBOUNDED:
+            unbounded += 1
+            if _has_variable_repeat(av[2]):
+                risks.add("quantificatore annidato (es. (a+)+): backtracking esponenziale")
+            elif _has_branch(av[2]):
+                risks.add("alternativa dentro una ripetizione (es. (a|ab)*): backtracking esponenziale "
+                          "se le alternative si sovrappongono")
+            _analyze(av[2], risks, True)
+            continue
+        for child in _children(op, av):
+            _analyze(child, risks, in_repeat)
+    if unbounded >= 2 and not in_repeat:
+        risks.add(f"{unbounded} ripetizioni illimitate in sequenza (es. .*x.*): costo fino a O(n^{unbounded})")
+
+
+def _uses_end(seq):
+    for op, av in seq:
+        if op == sre_parse.AT and av in (sre_parse.AT_END, sre_parse.AT_END_STRING):
+            return True
+        if op in (sre_parse.ASSERT, sre_parse.ASSERT_NOT) or any(_uses_end(child) for child in _children(op, av)):
+            return True
+    return False
+
+
+def needs_whole_text(compiled):
+    """
+    True se il risultato della regex dipende dalla fine del testo ($, \\Z,
+    lookahead): su un testo troncato darebbe un match sbagliato.
+    """
+    try:
+        return _uses_end(list(sre_parse.parse(compiled.pattern, compiled.flags)))
+    except Exception:
+        return True
+
+
+def risky_constructs(compiled):
+    """Costrutti a rischio di backtracking nella regex compilata (lista di descrizioni)."""
+    try:
+        parsed = sre_parse.parse(compiled.pattern, compiled.flags)
+    except Exception:
+        return []
+    risks = set()
+    _analyze(list(parsed), risks)
+    return sorted(risks)
+
+
+# --- corpus avversario ---------------------------------------------------------------
+
+def _literal_chars(seq, chars):
+    for op, av in seq:
+        if op == sre_parse.LITERAL:
+            chars.append(chr(av))
+        for child in _children(op, av):
+            _literal_chars(child, chars)
+
+
+def adversarial_corpus(compiled):
+    """
+    Generatori n -> testo di n caratteri circa che portano al caso peggiore
+    le regex comuni: lunghe ripetizioni dello stesso carattere senza la
+    fine attesa, url senza il resto, e ripetizioni dei caratteri e dei
+    letterali della regex stessa (il "pompaggio" di (a+)+ o .*x.*x).
+    """
+    corpus = [
+        lambda n: 'a' * n + '!',
+        lambda n: 'https://' + 'a' * n + '\x00',
+        lambda n: 'http://' + 'a.' * (n // 2) + '/',
+        lambda n: ' ' * n + '\x00',
+        lambda n: '&list=' * (n // 6 + 1) + '#',
+        lambda n: '/' * n + '?',
+    ]
+    try:
+        parsed = sre_parse.parse(compiled.pattern, compiled.flags)
+    except Exception:
+        return corpus
+    chars = []
+    _literal_chars(list(parsed), chars)
+    for ch in list(dict.fromkeys(chars))[:8]:
+        corpus.append(lambda n, ch=ch: ch * n + '\x00')
+    literal = "".join(chars)
+    for piece in {literal, literal[:-1], literal[:len(literal) // 2]}:
+        if piece:
+            corpus.append(lambda n, piece=piece: (piece * (n // len(piece) + 1))[:n] + '\x00')
+    return corpus
+
+
+# --- profilo ---------------------------------------------------------------------------
+
+class RegexProfile:
+    """
+    Costo misurato di una regex sul corpus avversario:
+        risks = costrutti a rischio (risky_constructs)
+        worst_seconds / tested_chars = caso peggiore alla lunghezza massima provata
+        exponent = crescita stimata del tempo (1 = lineare, 2 = quadratica, ...)
+        safe_chars = lunghezza oltre la quale il caso peggiore supererebbe il
+            budget (None se resta nel budget fino a max_chars)
+    """
+    def __init__(self, risks, worst_seconds, tested_chars, exponent, safe_chars):
+        self.risks = risks
+        self.worst_seconds = worst_seconds
+        self.tested_chars = tested_chars
+        self.exponent = exponent
+        self.safe_chars = safe_chars
+
+    def summary(self):
+        parts = [f"caso peggiore {self.worst_seconds * 1000:.2f} ms su {self.tested_chars} caratteri"]
+        if self.exponent is not None and self.exponent >= 6:
+            parts.append("crescita esponenziale")
+        elif self.exponent is not None:
+            parts.append(f"crescita ~O(n^{self.exponent:.1f})")
+        if self.safe_chars is not None:
+            parts.append(f"analizza al massimo {self.safe_chars} caratteri")
+        return ", ".join(parts)
+
+
+def _worst_time(operation, texts):
+    worst = 0.0
+    for text in texts:
+        best = None
+        # Il minimo di più ripetizioni toglie il rumore (timer, scheduler);
+        # la terza solo per le misure brevi
+        for attempt in range(3):
+            start = time.perf_counter()
+            operation(text)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+            if attempt and best > 0.001:
+                break
+        worst = max(worst, best)
+    return worst
+
+
+def profile_pattern(compiled, kind=RULE, budget=0.05, max_chars=65536, profile_chars=8192):
+    """
+    Misura la regex sul corpus avversario a lunghezze crescenti. Il passo
+    successivo viene scelto in base alla crescita osservata (polinomiale o
+    esponenziale, la più pessimista), così anche una regex esponenziale
+    supera il budget al massimo di poco prima che la misura si fermi (re non
+    si può interrompere). Il risultato viene estrapolato fino a `max_chars`,
+    la lunghezza massima analizzata.
+    """
+    operation = compiled.match if kind == RULE else compiled.search
+    corpus = adversarial_corpus(compiled)
+    limit = min(profile_chars, max_chars)
+    points = []
+    spent = 0.0
+    n = 8
+    while True:
+        start = time.perf_counter()
+        seconds = _worst_time(operation, [generate(n) for generate in corpus])
+        spent += time.perf_counter() - start
+        points.append((n, seconds))
+        # Anche il tempo totale della misura è limitato (load_config resta veloce)
+        if seconds > budget or n >= limit or spent > 20 * budget:
+            break
+        n = min(limit, _next_length(points, budget))
+
+    exponent = _exponent(points)
+    within = [point for point in points if point[1] <= budget]
+    tested_chars, worst_seconds = points[-1]
+    safe_chars = None
+    if len(within) < len(points):
+        # Budget superato: la finestra sicura è l'ultima lunghezza rimasta nel budget
+        safe_chars = within[-1][0] if within else 0
+    elif tested_chars < max_chars and exponent is not None and worst_seconds > 1e-5:
+        estimate = worst_seconds * (max_chars / tested_chars) ** exponent
+        if estimate > budget:
+            safe_chars = int(tested_chars * (budget / worst_seconds) ** (1 / exponent))
+    return RegexProfile(risky_constructs(compiled), worst_seconds, tested_chars, exponent, safe_chars)
+
+
+def _measurable(points):
+    return [(n, t) for n, t in points if t > 2e-5]
+
+
+def _next_length(points, budget):
+    """Prossima lunghezza da provare: al massimo 2x, e con un tempo stimato entro il budget."""
+    n, seconds = points[-1]
+    target = max(2 * n, n + 1)
+    if len(points) >= 2 and seconds > 2e-5:
+        n2, t2 = points[-1]
+        # Punto di confronto ad almeno 2/3 della lunghezza: tra punti vicini
+        # il rumore può nascondere la crescita
+        n1, t1 = next((point for point in reversed(points[:-1]) if point[0] * 3 <= n2 * 2), points[-2])
+        # Un punto sotto il rumore del timer, se sovrastimato, sottostima la
+        # crescita: viene contato al minimo
+        if t1 <= 2e-5:
+            t1 = min(t1, 1e-6)
+        # Tempo obiettivo del prossimo passo: metà budget, oppure, se ci si
+        # è già vicini, poco oltre il budget per chiudere la misura
+        headroom = math.log((budget / 2 if t2 < budget / 4 else budget * 1.5) / t2)
+        ratio = math.log(t2 / t1) if t2 > t1 else 0.0
+        if ratio > 0:
+            # Crescita polinomiale t ~ n^k ed esponenziale t ~ c^n
+            target = min(target, int(n2 * math.exp(headroom * math.log(n2 / n1) / ratio)),
+                         int(n2 + headroom * (n2 - n1) / ratio))
+    return max(n + 1, target)
+
+
+def _exponent(points):
+    """Crescita stimata dagli ultimi due punti misurabili (tempo sopra il rumore del timer)."""
+    measurable = _measurable(points)
+    if len(measurable) < 2:
+        return None
+    (n1, t1), (n2, t2) = measurable[-2], measurable[-1]
+    if n2 <= n1:
+        return None
+    return max(0.0, math.log(t2 / t1) / math.log(n2 / n1))
+
+
+# --- budget in esecuzione -------------------------------------------------------------
+
+# Chiamate recenti in cui contare gli sforamenti del budget
+STRIKE_WINDOW = 20
+
+
+class PatternGuard:
+    """
+    Budget di tempo di una regex durante l'uso (match delle regole,
+    filter_url). Il modulo re non si può interrompere: ogni chiamata viene
+    misurata e, se supera il budget `strikes` volte nelle ultime
+    STRIKE_WINDOW chiamate, la regex viene sospesa per `quarantine` secondi
+    (0 = finché non cambia nel config): una sola misura lenta può venire
+    da un'attesa del GIL o dello scheduler e non basta. Dal profilo
+    viene anche la lunghezza massima di testo che la regex analizza: oltre
+    questa una regola analizza solo l'inizio del testo (o lo salta se ne
+    guarda la fine) e un filtro lascia il testo invariato.
+    """
+    def __init__(self, compiled, kind):
+        self.pattern = compiled.pattern
+        self.kind = kind
+        self.whole_text = needs_whole_text(compiled)
+        self.budget = DEFAULT_REGEX_SETTINGS['budget_ms'] / 1000
+        self.quarantine = DEFAULT_REGEX_SETTINGS['quarantine']
+        self.strikes = DEFAULT_REGEX_SETTINGS['strikes']
+        self.profile = None
+        self.max_chars = None
+        self.quarantined_until = None
+        self.violations = 0
+        self.calls = 0
+        # Numero delle ultime chiamate oltre il budget
+        self._recent = deque()
+        # Impostazioni con cui è stato calcolato il profilo e di quello in coda
+        self._profile_key = None
+        self._pending_key = None
+
+    @property
+    def profiling(self):
+        return self._pending_key is not None
+
+    @property
+    def quarantined(self):
+        until = self.quarantined_until
+        return until is not None and (until == math.inf or time.monotonic() < until)
+
+    def window(self, text):
+        """
+        Fine della parte di `text` da analizzare (len(text) se tutta), oppure
+        None se la regex è sospesa o il testo è troppo lungo per analizzarne
+        solo una parte.
+        """
+        if self.quarantined_until is not None:
+            if self.quarantined:
+                metrics.REGEX_SKIPPED.inc(rule=self.pattern, reason='quarantine')
+                return None
+            self.quarantined_until = None
+        if self.max_chars is not None and len(text) > self.max_chars:
+            metrics.REGEX_SKIPPED.inc(rule=self.pattern, reason='length')
+            return None if self.whole_text else self.max_chars
+        return len(text)
+
+    def record(self, seconds):
+        self.calls += 1
+        if seconds <= self.budget:
+            return
+        self.violations += 1
+        metrics.REGEX_BUDGET_EXCEEDED.inc(rule=self.pattern)
+        recent = self._recent
+        recent.append(self.calls)
+        while recent and (len(recent) > self.strikes or self.calls - recent[0] >= STRIKE_WINDOW):
+            recent.popleft()
+        if len(recent) < self.strikes:
+            return
+        recent.clear()
+        self.quarantined_until = time.monotonic() + self.quarantine if self.quarantine else math.inf
+        duration = f"per {self.quarantine:g} s" if self.quarantine else "fino alla modifica del config"
+        print(f"[link_monitor] Regex ({self.kind}) {self.pattern!r} sospesa {duration}: "
+              f"{self.strikes} volte oltre il budget di {self.budget * 1000:g} ms "
+              f"(l'ultima {seconds * 1000:.0f} ms)", file=sys.stderr)
+
+    def sub(self, compiled, replace, text):
+        """
+        compiled.sub nel budget: il testo resta invariato se la regex è
+        sospesa o se è più lungo della finestra (vedi window). Un filtro
+        applicato solo all'inizio del testo lo modificherebbe a metà.
+        """
+        end = self.window(text)
+        if end is None or end < len(text):
+            return text
+        start = time.perf_counter()
+        result = compiled.sub(replace, text)
+        self.record(time.perf_counter() - start)
+        return result
+
+
+_guards = {}
+_guards_lock = threading.Lock()
+
+
+def guard_for(compiled, kind=RULE):
+    """PatternGuard condiviso da tutte le azioni che usano la stessa regex per lo stesso scopo."""
+    key = (kind, compiled.pattern, compiled.flags)
+    guard = _guards.get(key)
+    if guard is not None:
+        return guard
+    with _guards_lock:
+        guard = _guards.get(key)
+        if guard is None:
+            guard = _guards[key] = PatternGuard(compiled, kind)
+        return guard
+
+
+class _Profiler:
+    """
+    Un thread ('regex-profiler') che misura le regex in coda: load_config
+    (anche dal thread di tkinter) non attende la misura. Finché il profilo
+    non è pronto il PatternGuard resta com'era (al primo caricamento senza
+    limite di lunghezza, ma con il budget di tempo).
+    """
+    def __init__(self):
+        self._queue = deque()
+        self._busy = False
+        self._thread = None
+        self._cond = threading.Condition()
+
+    def request(self, guard, compiled, kind, max_chars, profile_chars, key):
+        with self._cond:
+            # L'ultima richiesta per il guard sostituisce quelle non ancora misurate
+            guard._pending_key = key
+            self._queue.append((guard, compiled, kind, max_chars, profile_chars, key))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='regex-profiler', daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+
+    def cancel(self, guard):
+        with self._cond:
+            guard._pending_key = None
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                guard, compiled, kind, max_chars, profile_chars, key = self._queue.popleft()
+                if guard._pending_key != key:
+                    continue
+                self._busy = True
+            try:
+                profile = profile_pattern(compiled, kind, key[0], max_chars, profile_chars)
+            except Exception as e:
+                profile = None
+                print(f"[link_monitor] Profilo della regex {compiled.pattern!r} non riuscito: {e}", file=sys.stderr)
+            with self._cond:
+                self._busy = False
+                if guard._pending_key == key:
+                    guard._pending_key = None
+                    if profile is not None:
+                        guard.profile = profile
+                        guard.max_chars = profile.safe_chars
+                        guard._profile_key = key
+                self._cond.notify_all()
+
+    def wait(self, timeout=None):
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._queue and not self._busy, timeout)
+
+
+_profiler = _Profiler()
+
+
+def apply_settings(compiled, kind, settings, max_chars):
+    """
+    Aggiorna budget e sospensione della regex da [REGEX] e, con
+    profile = true, ne accoda la misura (una sola volta per regex e
+    impostazioni; vedi _Profiler). Ritorna il PatternGuard.
+    """
+    guard = guard_for(compiled, kind)
+    guard.budget = settings['budget_ms'] / 1000
+    guard.quarantine = settings['quarantine']
+    guard.strikes = max(1, settings['strikes'])
+    if not settings['profile']:
+        _profiler.cancel(guard)
+        guard.profile = None
+        guard.max_chars = None
+        guard._profile_key = None
+        return guard
+    key = (guard.budget, max_chars, settings['profile_chars'])
+    if key not in (guard._profile_key, guard._pending_key):
+        _profiler.request(guard, compiled, kind, max_chars, settings['profile_chars'], key)
+    return guard
+
+
+def wait_for_profiles(timeout=None):
+    """Attende la fine delle misure in coda; False se scade `timeout`."""
+    return _profiler.wait(timeout)
@@ -0,0 +1,307 @@
+import contextlib
+import ctypes
+import functools
+import os
+import platform
+import sys
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Classi di ionice (ioprio_set): realtime richiede i privilegi di root
+IOPRIO_CLASSES = {'realtime': 1, 'rt': 1, 'best-effort': 2, 'be': 2, 'idle': 3}
+_IOPRIO_WHO_PROCESS = 1
+_IOPRIO_CLASS_SHIFT = 13
+# Numero della syscall ioprio_set per architettura
+_SYS_IOPRIO_SET = {'x86_64': 251, 'amd64': 251, 'i386': 289, 'i686': 289, 'aarch64': 30, 'arm64': 30,
+                   'armv7l': 314, 'ppc64le': 273, 'riscv64': 30}
+
+# Nomi accettati in rlimitN -> costante di `resource`
+RLIMITS = {'as': 'RLIMIT_AS', 'data': 'RLIMIT_DATA', 'cpu': 'RLIMIT_CPU', 'fsize': 'RLIMIT_FSIZE',
+           'nofile': 'RLIMIT_NOFILE', 'nproc': 'RLIMIT_NPROC', 'core': 'RLIMIT_CORE'}
+_SIZE_UNITS = {'': 1, 'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3, 't': 1024 ** 4}
+
+# Campi raccolti per ogni job (salvati anche nella cronologia)
+USAGE_FIELDS = ('cpu_user', 'cpu_sys', 'max_rss', 'read_bytes', 'write_bytes')
+
+
+class ResourceLimitError(ValueError):
+    pass
+
+
+def parse_size(text):
+    """'512M' -> 536870912; 'unlimited' -> RLIM_INFINITY."""
+    text = text.strip().lower()
+    if text in ('unlimited', 'infinity'):
+        return resource.RLIM_INFINITY if resource is not None else -1
+    number, unit = text, ''
+    if text and text[-1] in 'kmgt':
+        number, unit = text[:-1], text[-1]
+    elif text.endswith(('kb', 'mb', 'gb', 'tb')):
+        number, unit = text[:-2], text[-2]
+    try:
+        return int(float(number) * _SIZE_UNITS[unit])
+    except ValueError:
+        raise ResourceLimitError(f"Valore non valido: {text}")
+
+
+class ResourceLimits:
+    """
+    Limiti di un'azione, dalle chiavi di [LINKS]:
+        niceN = priorità CPU (-20..19)
+        ioniceN = idle | best-effort[:0-7] | realtime[:0-7]
+        rlimitN = as=2G, cpu=600, nofile=1024, ... (vedi RLIMITS)
+        timeoutN = secondi massimi di esecuzione
+
+    I limiti vengono applicati nel processo figlio prima di exec (vedi
+    preexec), così valgono fin dalla prima istruzione del programma e i
+    processi che crea li ereditano. ionice e rlimit sono disponibili solo
+    su Linux, nice sui sistemi POSIX; il timeout ovunque.
+    """
+    def __init__(self, nice=None, ionice=None, rlimit=None, timeout=None):
+        # Valori come scritti nel config (per riconoscere le azioni invariate)
+        self.spec = (nice, ionice, rlimit, timeout)
+        self.nice = self._parse_nice(nice)
+        self.ionice = self._parse_ionice(ionice)
+        self.rlimits = self._parse_rlimits(rlimit)
+        self.timeout = self._parse_timeout(timeout)
+
+    def __bool__(self):
+        return any(value is not None for value in self.spec)
+
+    @staticmethod
+    def _parse_nice(value):
+        if value in (None, ''):
+            return None
+        try:
+            nice = int(value)
+        except ValueError:
+            raise ResourceLimitError(f"nice non valido: {value}")
+        if not -20 <= nice <= 19:
+            raise ResourceLimitError(f"nice fuori intervallo (-20..19): {value}")
+        return nice
+
+    @staticmethod
+    def _parse_ionice(value):
+        if value in (None, ''):
+            return None
+        name, _, level = value.strip().lower().partition(':')
+        if name not in IOPRIO_CLASSES:
+            raise ResourceLimitError(f"ionice non valido: {value} (ammessi: idle, best-effort[:0-7], realtime[:0-7])")
+        io_class = IOPRIO_CLASSES[name]
+        try:
+            level = int(level) if level else 4
+        except ValueError:
+            raise ResourceLimitError(f"Livello ionice non valido: {value}")
+        if not 0 <= level <= 7:
+            raise ResourceLimitError(f"Livello ionice fuori intervallo (0..7): {value}")
+        return io_class, 0 if io_class == IOPRIO_CLASSES['idle'] else level
+
+    @staticmethod
+    def _parse_rlimits(value):
+        if value in (None, ''):
+            return {}
+        limits = {}
+        for item in value.split(','):
+            if not item.strip():
+                continue
+            name, sep, amount = item.partition('=')
+            name = name.strip().lower()
+            if not sep or name not in RLIMITS:
+                raise ResourceLimitError(
+                    f"rlimit non valido: {item.strip()} (ammessi: {', '.join(sorted(RLIMITS))})")
+            limits[name] = parse_size(amount)
+        return limits
+
+    @staticmethod
+    def _parse_timeout(value):
+        if value in (None, ''):
+            return None
+        try:
+            timeout = float(value)
+        except ValueError:
+            raise ResourceLimitError(f"timeout non valido: {value}")
+        return timeout if timeout > 0 else None
+
+    def unsupported(self):
+        """Avvisi per i limiti che questo sistema non può applicare (vengono ignorati)."""
+        warnings = []
+        if self.nice is not None and not hasattr(os, 'setpriority'):
+            warnings.append("nice non supportato su questo sistema")
+        if self.ionice is not None and _ioprio_syscall() is None:
+            warnings.append("ionice: ioprio_set non supportato su questo sistema")
+        if resource is None:
+            warnings.extend(f"rlimit {name} non supportato su questo sistema" for name in self.rlimits)
+        return warnings
+
+    def preexec(self):
+        """
+        Funzione per preexec_fn che applica nice, ionice e rlimit nel figlio
+        prima di exec, o None se non c'è nulla da applicare. Quanto serve
+        (la syscall di ioprio_set, le costanti di resource) viene preparato
+        qui, nel processo principale: dopo fork il figlio fa solo syscall.
+        Un limite rifiutato (ad esempio nice negativo senza privilegi) non
+        blocca l'avvio: l'avviso viene scritto su stderr, cioè nell'output
+        del job.
+        """
+        steps = []
+        if self.nice is not None and hasattr(os, 'setpriority'):
+            nice = self.nice
+            steps.append((f"nice {nice}", lambda: os.setpriority(os.PRIO_PROCESS, 0, nice)))
+        syscall = _ioprio_syscall()
+        if self.ionice is not None and syscall is not None:
+            io_class, level = self.ionice
+            steps.append(("ionice", lambda: _set_ioprio(0, io_class, level, syscall)))
+        if resource is not None:
+            for name, value in self.rlimits.items():
+                limit = getattr(resource, RLIMITS[name])
+                steps.append((f"rlimit {name}", functools.partial(_set_rlimit, limit, value)))
+        if not steps:
+            return None
+
+        def apply_limits():
+            for name, step in steps:
+                try:
+                    step()
+                except (OSError, ValueError) as e:
+                    os.write(2, f"[link_monitor] Limite non applicato: {name}: {e}\n".encode('utf-8', 'replace'))
+        return apply_limits
+
+
+def _set_rlimit(limit, value):
+    # Oltre il limite hard serve CAP_SYS_RESOURCE: si ripiega sul massimo consentito
+    _, hard = resource.getrlimit(limit)
+    if hard != resource.RLIM_INFINITY and (value == resource.RLIM_INFINITY or value > hard):
+        value = hard
+    resource.setrlimit(limit, (value, hard))
+
+
+def _ioprio_syscall():
+    """libc syscall() e numero di ioprio_set, o None fuori da Linux."""
+    number = _SYS_IOPRIO_SET.get(platform.machine().lower())
+    if not sys.platform.startswith('linux') or number is None:
+        return None
+    return ctypes.CDLL(None, use_errno=True).syscall, number
+
+
+def _set_ioprio(pid, io_class, level, syscall):
+    function, number = syscall
+    if function(number, _IOPRIO_WHO_PROCESS, pid, (io_class << _IOPRIO_CLASS_SHIFT) | level) != 0:
+        errno = ctypes.get_errno()
+        raise OSError(errno, os.strerror(errno))
+
+
+def _read_proc_io(pid):
+    values = {}
+    try:
+        with open(f"/proc/{pid}/io") as fh:
+            for line in fh:
+                key, _, value = line.partition(':')
+                values[key] = int(value)
+    except (OSError, ValueError):
+        return {}
+    return {'read_bytes': values.get('read_bytes'), 'write_bytes': values.get('write_bytes')}
+
+
+def _peak_rss_self():
+    """VmHWM del processo corrente in byte, o None senza /proc."""
+    try:
+        with open("/proc/self/status") as fh:
+            for line in fh:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def wait_with_usage(proc):
+    """
+    Attende l'uscita del processo come proc.wait() e ritorna le risorse
+    usate da lui e dai suoi figli: {'cpu_user', 'cpu_sys' (secondi),
+    'max_rss', 'read_bytes', 'write_bytes' (byte)}, oppure None dove wait4
+    non esiste. Su Linux il processo terminato viene prima atteso senza
+    raccoglierlo (WNOWAIT), così /proc/<pid>/io è ancora leggibile.
+
+    ru_maxrss parte dal picco del processo da cui il figlio è stato creato
+    (fork/vfork e exec lo ereditano): un programma che non supera il picco
+    di questo processo non è distinguibile e max_rss vale None. Dopo
+    l'uscita /proc/<pid>/status non ha più VmHWM, quindi non c'è una misura
+    del solo programma.
+    """
+    if not hasattr(os, 'wait4'):
+        proc.wait()
+        return None
+    # Come Popen.wait: finché si attende, poll() non raccoglie il processo
+    lock = getattr(proc, '_waitpid_lock', None) or contextlib.nullcontext()
+    with lock:
+        return reap_with_usage(proc)
+
+
+def reap_with_usage(proc):
+    """
+    Come wait_with_usage, ma il chiamante tiene già proc._waitpid_lock
+    (se il processo è già terminato non si blocca: vedi engine).
+    """
+    if proc.returncode is not None:
+        return None
+    io = {}
+    try:
+        if hasattr(os, 'waitid') and os.path.isdir(f"/proc/{proc.pid}"):
+            os.waitid(os.P_PID, proc.pid, os.WEXITED | os.WNOWAIT)
+            io = _read_proc_io(proc.pid)
+        _, status, usage = os.wait4(proc.pid, 0)
+    except ChildProcessError:
+        # Già raccolto altrove: come Popen, l'exit code non è più noto
+        proc.returncode = 0
+        return None
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    # ru_maxrss è in KiB su Linux, in byte su macOS
+    max_rss = usage.ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+    baseline = _peak_rss_self()
+    if baseline is not None and max_rss <= baseline:
+        # Picco ereditato da questo processo (vedi wait_with_usage)
+        max_rss = None
+    return {
+        'cpu_user': usage.ru_utime,
+        'cpu_sys': usage.ru_stime,
+        'max_rss': max_rss,
+        'read_bytes': io.get('read_bytes'),
+        'write_bytes': io.get('write_bytes'),
+    }
+
+
+def add_usage(total, usage):
+    """Somma le risorse di più processi (le fasi di una pipeline); max_rss è il massimo."""
+    if total is None or usage is None:
+        return usage if total is None else total
+    combined = {}
+    for field in USAGE_FIELDS:
+        values = [value for value in (total.get(field), usage.get(field)) if value is not None]
+        if not values:
+            combined[field] = None
+        else:
+            combined[field] = max(values) if field == 'max_rss' else sum(values)
+    return combined
+
+
+def _format_bytes(value):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if value < 1024 or unit == 'GB':
+            return f"{value:.0f} {unit}" if unit == 'B' else f"{value:.1f} {unit}"
+        value /= 1024
+
+
+def format_usage(record):
+    """Riga riassuntiva delle risorse di un job o di un record di cronologia ('' se assenti)."""
+    parts = []
+    if record.get('cpu_user') is not None:
+        parts.append(f"CPU {record['cpu_user']:.2f}s utente, {record['cpu_sys']:.2f}s sistema")
+    if record.get('max_rss') is not None:
+        parts.append(f"memoria max {_format_bytes(record['max_rss'])}")
+    if record.get('read_bytes') is not None:
+        parts.append(f"disco {_format_bytes(record['read_bytes'])} letti, "
+                     f"{_format_bytes(record['write_bytes'])} scritti")
+    return " · ".join(parts)
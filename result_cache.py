@@ -0,0 +1,88 @@
+import datetime
+import threading
+import time
+from collections import OrderedDict
+
+# Politiche per azione quando (azione, url) è già stato eseguito con successo
+SKIP = 'skip'
+ASK = 'ask'
+FORCE = 'force'
+POLICIES = (SKIP, ASK, FORCE)
+
+
+class ResultCache:
+    """
+    Esiti riusciti per (label azione, url filtrato), con scadenza `ttl`
+    secondi (0 = mai) e al massimo `max_entries` voci (LRU).
+    Se c'è uno store di cronologia, le voci mancanti vengono cercate lì,
+    così la cache sopravvive ai riavvii.
+    """
+    def __init__(self, ttl=86400, max_entries=10000, history_store=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.history_store = history_store
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(action, url):
+        return (action.label, url)
+
+    def _expired(self, timestamp):
+        return self.ttl > 0 and time.time() - timestamp > self.ttl
+
+    def get(self, action, url):
+        """Ritorna {'start_time', 'record_id'} dell'ultima esecuzione riuscita, o None."""
+        key = self.key(action, url)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if self._expired(entry['timestamp']):
+                    del self._entries[key]
+                else:
+                    self._entries.move_to_end(key)
+                    return entry
+
+        if self.history_store is not None:
+            since = time.time() - self.ttl if self.ttl > 0 else None
+            record = self.history_store.find_success(url, action.label, since)
+            if record is not None:
+                return self._store(key, record['start_time'].timestamp(), record['id'])
+        return None
+
+    def previous(self, action, url):
+        """
+        Esecuzione precedente di cui tenere conto secondo la politica
+        dell'azione (skip o ask): come get(), ma sempre None con force.
+        """
+        if getattr(action, 'cache_policy', FORCE) not in (SKIP, ASK):
+            return None
+        return self.get(action, url)
+
+    def put(self, action, url, start_time=None, record_id=None):
+        if isinstance(start_time, datetime.datetime):
+            timestamp = start_time.timestamp()
+        else:
+            timestamp = start_time or time.time()
+        return self._store(self.key(action, url), timestamp, record_id)
+
+    def _store(self, key, timestamp, record_id):
+        entry = {
+            'timestamp': timestamp,
+            'start_time': datetime.datetime.fromtimestamp(timestamp),
+            'record_id': record_id,
+        }
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def invalidate(self, action, url):
+        with self._lock:
+            self._entries.pop(self.key(action, url), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,26 @@
+import pytest
+from clipboard_monitor import ContentPolicy
+
+
+def test_policy_fingerprint_detects_changes():
+    policy = ContentPolicy(max_size=100, sample_size=10)
+    assert policy.fingerprint("abc") == policy.fingerprint("abc")
+    assert policy.fingerprint("abc") != policy.fingerprint("abd")
+    # Oltre max_size conta solo il campione di testa e coda (e la lunghezza)
+    big = "x" * 200
+    assert policy.fingerprint(big) == policy.fingerprint("x" * 100 + "y" + "x" * 99)
+    assert policy.fingerprint(big) != policy.fingerprint("x" * 201)
+
+
+def test_policy_prepare():
+    policy = ContentPolicy(max_size=20, max_scan=5)
+    assert policy.prepare("hello world") == "hello"
+    assert policy.prepare("   \n") is None
+    assert policy.prepare("a\x00b") is None
+    assert policy.prepare("x" * 21) is None
+    assert ContentPolicy(max_size=20, max_scan=5, oversize='truncate').prepare("y" * 21) == "yyyyy"
+
+
+def test_policy_rejects_unknown_oversize():
+    with pytest.raises(ValueError):
+        ContentPolicy(oversize='drop')
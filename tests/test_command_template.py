@@ -0,0 +1,73 @@
+import os
+import subprocess
+import pytest
+from command_template import CommandTemplate, CommandTemplateError, compile_template, split_command
+
+URL = "https://www.youtube.com/watch?v=abc&list=xyz#t=10"
+
+
+def test_split_command_keeps_quotes_and_backslashes():
+    command = 'C:\\yt\\yt-dlp.exe --paths "C:\\My Music" -o \'%(title)s\''
+    assert split_command(command) == ['C:\\yt\\yt-dlp.exe', '--paths', 'C:\\My Music', '-o', '%(title)s']
+
+
+def test_split_command_unclosed_quote():
+    with pytest.raises(CommandTemplateError):
+        split_command('echo "{url}')
+
+
+def test_argv_placeholders():
+    template = CommandTemplate('tool {url} --host {host} --query {query} --frag {fragment} --id {id}')
+    assert template.argv(URL, job_id=7) == [
+        'tool', URL, '--host', 'www.youtube.com', '--query', 'v=abc&list=xyz', '--frag', 't=10', '--id', '7']
+
+
+def test_argv_url_is_a_single_argument():
+    template = CommandTemplate('tool "prefix {url}"')
+    url = "https://example.com/a b;rm -rf x"
+    assert template.argv(url) == ['tool', 'prefix ' + url]
+
+
+def test_prev_placeholder():
+    assert CommandTemplate('ffmpeg -i {prev} out.mp3').argv(URL, prev='/tmp/a b.webm') == [
+        'ffmpeg', '-i', '/tmp/a b.webm', 'out.mp3']
+    assert CommandTemplate('echo {prev}').argv(URL) == ['echo', '']
+
+
+def test_escaped_braces():
+    assert CommandTemplate('echo {{url}} {url}').argv('u') == ['echo', '{url}', 'u']
+    assert compile_template('a{{b}}c') == [('a{b}c', None)]
+
+
+def test_unknown_braces_are_kept():
+    template = CommandTemplate('yt-dlp --exec "mv {} /tmp" python -c "print(f\'{x}\')" {i} {url}')
+    assert template.argv('u') == ['yt-dlp', '--exec', 'mv {} /tmp', 'python', '-c', "print(f'{x}')", '{i}', 'u']
+
+
+def test_static_arguments_are_precomputed():
+    template = CommandTemplate('tool -x {url}')
+    assert template.args[0] == ('tool', None)
+    assert template.args[2][1] is not None
+    assert template.executable == 'tool'
+
+
+def test_empty_program():
+    with pytest.raises(CommandTemplateError):
+        CommandTemplate('').argv('u')
+
+
+@pytest.mark.skipif(os.name == 'nt', reason="quoting POSIX")
+@pytest.mark.parametrize('command', ['printf %s {url}', 'printf %s "{url}"', "printf %s '{url}'"])
+def test_shell_command_quotes_values(command, tmp_path):
+    marker = tmp_path / 'pwned'
+    url = f"https://h/x?a=1&b=$(touch {marker});`touch {marker}`'\"\\ x"
+    line = CommandTemplate(command).shell_command(url)
+    result = subprocess.run(line, shell=True, capture_output=True, text=True)
+    assert result.stdout == url
+    assert not marker.exists()
+
+
+@pytest.mark.skipif(os.name == 'nt', reason="quoting POSIX")
+def test_shell_command_keeps_literal_text():
+    line = CommandTemplate('echo {} && printf %s {host}').shell_command("https://a.b/c")
+    assert line == "echo {} && printf %s a.b"
@@ -0,0 +1,156 @@
+import os
+import re
+import threading
+import pytest
+import config_watcher
+import regex_cost
+from config import ConfigReloader
+from config_watcher import ConfigWatcher
+
+BASE = """
+[LINKS]
+regex1 = https?://uno\\.example/\\S+
+program1 = uno {url}
+label1 = uno
+regex2 = https?://due\\.example/\\S+
+program2 = due {url}
+label2 = due
+filter2 = pulisci
+
+[FILTERS]
+pulisci_pattern = [?&]utm_[^&]*
+pulisci_replace =
+
+[LIMITS]
+max_workers = 2
+"""
+
+
+def write(path, text):
+    path.write_text(text, encoding="utf-8")
+    # mtime diverso anche su filesystem con risoluzione grossolana
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+
+@pytest.fixture
+def config_file(tmp_path):
+    path = tmp_path / "config.ini"
+    write(path, BASE)
+    return path
+
+
+def test_unchanged_file_keeps_actions(config_file):
+    reloader = ConfigReloader(str(config_file))
+    actions = reloader.actions
+    assert [a.label for a in actions] == ["uno", "due"]
+    assert reloader.reload() == set()
+    assert reloader.actions is actions
+
+
+def test_only_changed_sections_are_reported(config_file):
+    reloader = ConfigReloader(str(config_file))
+    actions = reloader.actions
+    write(config_file, BASE.replace("max_workers = 2", "max_workers = 4"))
+    assert reloader.reload() == {'LIMITS'}
+    # [LIMITS] non riguarda le azioni: non vengono ricalcolate
+    assert reloader.actions is actions
+    write(config_file, BASE.replace("max_workers = 2", "max_workers = 4") + "\n[METRICS]\nport = 0\n")
+    assert reloader.reload() == {'METRICS'}
+
+
+def test_unchanged_actions_are_reused(config_file):
+    reloader = ConfigReloader(str(config_file))
+    uno, due = reloader.actions
+    write(config_file, BASE.replace("program2 = due {url}", "program2 = due --nuovo {url}"))
+    assert reloader.reload() == {'LINKS'}
+    new_uno, new_due = reloader.actions
+    assert new_uno is uno
+    assert new_due is not due
+    assert new_due.program == "due --nuovo {url}"
+
+
+def test_invalid_filter_keeps_previous_config(config_file):
+    reloader = ConfigReloader(str(config_file))
+    actions = reloader.actions
+    write(config_file, BASE.replace("utm_[^&]*", "utm_[^&*"))
+    with pytest.raises(re.error):
+        reloader.reload()
+    assert reloader.actions is actions
+    # Corretto il file, la modifica successiva viene vista di nuovo
+    write(config_file, BASE.replace("utm_[^&]*", "utm_[^#]*"))
+    assert reloader.reload() == {'FILTERS'}
+    assert reloader.actions[1].filter_url("https://due.example/x?utm_a=1") == "https://due.example/x"
+
+
+def test_invalid_action_is_skipped(config_file, capsys):
+    reloader = ConfigReloader(str(config_file))
+    uno = reloader.actions[0]
+    write(config_file, BASE.replace("https?://due\\.example/\\S+", "https?://due\\.example/(\\S+"))
+    assert reloader.reload() == {'LINKS'}
+    assert list(reloader.actions) == [uno]
+    assert "regex2" in capsys.readouterr().err
+
+
+def test_monitor_change_updates_regex_window(config_file):
+    # Regex propria del test: i PatternGuard sono condivisi per regex
+    rule = "https?://finestra\\.example/\\S+"
+    settings = "[REGEX]\nbudget_ms = 10000\nprofile = true\n[MONITOR]\nmax_scan_chars = {}\n"
+    write(config_file, BASE.replace("https?://uno\\.example/\\S+", rule) + settings.format(64))
+    reloader = ConfigReloader(str(config_file))
+    guard = regex_cost.guard_for(reloader.actions[0].pattern)
+    assert regex_cost.wait_for_profiles(10)
+    assert guard.profile.tested_chars == 64
+    write(config_file, BASE.replace("https?://uno\\.example/\\S+", rule) + settings.format(128))
+    assert reloader.reload() == {'MONITOR'}
+    assert regex_cost.wait_for_profiles(10)
+    assert guard.profile.tested_chars == 128
+
+
+def watch(path, **kwargs):
+    changes = []
+    changed = threading.Event()
+
+    def on_change(changed_path):
+        changes.append(changed_path)
+        changed.set()
+
+    watcher = ConfigWatcher(str(path), on_change, **kwargs)
+    watcher.start()
+    return watcher, changes, changed
+
+
+def test_watcher_polls_mtime_without_inotify(config_file, monkeypatch):
+    def no_inotify(directory):
+        raise OSError("inotify non disponibile")
+
+    monkeypatch.setattr(config_watcher, '_Inotify', no_inotify)
+    watcher, changes, changed = watch(config_file, poll_interval=0.01)
+    try:
+        assert not changed.wait(0.1)
+        write(config_file, BASE + "\n[METRICS]\nport = 0\n")
+        assert changed.wait(5)
+        assert changes == [str(config_file)]
+    finally:
+        watcher.stop()
+        watcher.join(5)
+
+
+def test_watcher_inotify(config_file):
+    try:
+        config_watcher._Inotify(str(config_file.parent)).close()
+    except (OSError, AttributeError):
+        pytest.skip("inotify non disponibile")
+    watcher, changes, changed = watch(config_file, debounce=0.01)
+    try:
+        # Attende che il thread osservi la cartella
+        threading.Event().wait(0.2)
+        other = config_file.parent / "altro.ini"
+        other.write_text("[X]\n", encoding="utf-8")
+        assert not changed.wait(0.2)
+        write(config_file, BASE + "\n[METRICS]\nport = 0\n")
+        assert changed.wait(5)
+        assert changes == [str(config_file)]
+    finally:
+        watcher.stop()
+        watcher.join(5)
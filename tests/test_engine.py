@@ -0,0 +1,189 @@
+import asyncio
+import gc
+import subprocess
+import sys
+import threading
+import time
+import pytest
+import engine
+from engine import JobEngine, run_process
+from ui_channel import UiChannel
+
+PRINT_CODE = "import sys; sys.stdout.write('uno\\n'); sys.stderr.write('due\\n'); sys.exit(3)"
+
+
+def run(cmd, shell=False, on_spawn=None):
+    procs = []
+    chunks = []
+
+    def spawned(proc):
+        procs.append(proc)
+        if on_spawn:
+            on_spawn(proc)
+
+    usage = asyncio.run(run_process(cmd, shell, spawned, chunks.append))
+    return procs[0], b"".join(chunks), chunks, usage
+
+
+@pytest.mark.skipif(not engine.PIDFD_SUPPORTED, reason="pidfd non disponibili")
+def test_pidfd_path_reaps_with_wait4():
+    locked = []
+    proc, data, chunks, usage = run([sys.executable, "-c", PRINT_CODE],
+                                    on_spawn=lambda proc: locked.append(proc._waitpid_lock.locked()))
+    assert isinstance(proc, subprocess.Popen)
+    # Finché il processo non è raccolto da wait4, poll() non può raccoglierlo
+    assert locked == [True]
+    assert not proc._waitpid_lock.locked()
+    assert proc.returncode == 3
+    assert data.replace(b"\r\n", b"\n") in (b"uno\ndue\n", b"due\nuno\n")
+    assert chunks[-1] == b""
+    assert set(usage) >= {'cpu_user', 'cpu_sys', 'max_rss'}
+    assert usage['cpu_user'] >= 0
+
+
+@pytest.mark.skipif(not engine.PIDFD_SUPPORTED, reason="pidfd non disponibili")
+def test_pidfd_path_kills_on_error():
+    procs = []
+
+    def on_spawn(proc):
+        procs.append(proc)
+        raise RuntimeError("errore nel callback")
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(run_process([sys.executable, "-c", "import time; time.sleep(30)"], False, on_spawn,
+                                lambda data: None))
+    proc = procs[0]
+    assert proc.returncode is not None
+    assert not proc._waitpid_lock.locked()
+
+
+@pytest.mark.parametrize('shell', [False, True])
+def test_fallback_without_pidfd(monkeypatch, shell):
+    monkeypatch.setattr(engine, 'PIDFD_SUPPORTED', False)
+    cmd = [sys.executable, "-c", PRINT_CODE]
+    if shell:
+        cmd = subprocess.list2cmdline(cmd) if sys.platform == 'win32' else f'"{sys.executable}" -c "{PRINT_CODE}"'
+    proc, data, chunks, usage = run(cmd, shell=shell)
+    assert isinstance(proc, asyncio.subprocess.Process)
+    assert usage is None
+    assert proc.returncode == 3
+    assert b"uno" in data and b"due" in data
+    assert chunks[-1] == b""
+
+
+def test_job_engine_runs_in_one_thread():
+    job_engine = JobEngine()
+    threads = []
+
+    async def work(i):
+        threads.append(threading.current_thread().name)
+        await asyncio.sleep(0)
+        return i * 2
+
+    try:
+        futures = [job_engine.submit(work(i)) for i in range(5)]
+        assert [future.result(5) for future in futures] == [0, 2, 4, 6, 8]
+        assert set(threads) == {'job-engine'}
+    finally:
+        job_engine.stop()
+
+
+def test_job_engine_keeps_running_jobs_alive():
+    # Il task attende un StreamReader legato al loop solo da riferimenti deboli:
+    # anche senza tenere il Future di submit() il job deve arrivare in fondo
+    job_engine = JobEngine()
+    done = threading.Event()
+
+    async def job():
+        await run_process([sys.executable, "-c", "import time; time.sleep(0.3)"], False, lambda proc: None,
+                          lambda data: None)
+        done.set()
+
+    try:
+        job_engine.submit(job())
+        time.sleep(0.1)
+        gc.collect()
+        assert done.wait(5)
+    finally:
+        job_engine.stop()
+
+
+class FakeRoot:
+    """Le parti di tk.Tk usate da UiChannel: after e after_idle accodano, run() esegue."""
+    def __init__(self):
+        self.pending = []
+        self.after_calls = 0
+        self.fail = None
+        self.errors = []
+
+    def after(self, delay, func):
+        if self.fail:
+            raise self.fail
+        self.after_calls += 1
+        self.pending.append(func)
+
+    def after_idle(self, func):
+        self.pending.append(func)
+
+    def report_callback_exception(self, *exc_info):
+        self.errors.append(exc_info[1])
+
+    def run(self):
+        pending, self.pending = self.pending, []
+        for func in pending:
+            func()
+
+
+def test_ui_channel_batches_in_order():
+    root = FakeRoot()
+    channel = UiChannel(root)
+    root.run()
+    received = []
+    for i in range(5):
+        channel.post(received.append, i)
+    # Un solo after() per il blocco di chiamate
+    assert root.after_calls == 1
+    assert received == []
+    root.run()
+    assert received == [0, 1, 2, 3, 4]
+    channel.post(received.append, 5)
+    assert root.after_calls == 2
+
+
+def test_ui_channel_keeps_calls_until_tk_is_ready():
+    root = FakeRoot()
+    channel = UiChannel(root)
+    received = []
+    root.fail = RuntimeError("main thread is not in main loop")
+    channel.post(received.append, 1)
+    root.fail = None
+    channel.post(received.append, 2)
+    root.run()
+    assert received == [1, 2]
+
+
+def test_ui_channel_drains_at_mainloop_start():
+    root = FakeRoot()
+    root.fail = RuntimeError("main thread is not in main loop")
+    channel = UiChannel(root)
+    received = []
+    channel.post(received.append, 1)
+    # Il drain di after_idle consegna le chiamate arrivate prima di mainloop
+    root.run()
+    assert received == [1]
+
+
+def test_ui_channel_reports_errors_and_close():
+    root = FakeRoot()
+    channel = UiChannel(root)
+    received = []
+    channel.post(lambda: 1 / 0)
+    channel.post(received.append, 1)
+    root.run()
+    assert received == [1]
+    assert isinstance(root.errors[0], ZeroDivisionError)
+    channel.close()
+    channel.post(received.append, 2)
+    assert root.after_calls == 1
+    root.run()
+    assert received == [1]
@@ -0,0 +1,63 @@
+import json
+import os
+import subprocess
+import sys
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# tkinter bloccato: se la modalità headless lo importasse il processo fallirebbe
+RUNNER = ("import runpy, sys; sys.path.insert(0, sys.argv[1]); sys.modules['tkinter'] = None; "
+          "sys.argv = sys.argv[2:]; runpy.run_path(sys.argv[0], run_name='__main__')")
+
+CONFIG = """
+[LINKS]
+regex1 = https?://uno\\.example/\\S+
+program1 = "{python}" -c "import sys; print('scaricato', sys.argv[1])" {{url}}
+label1 = uno
+cache1 = ask
+
+[HISTORY]
+db_path = {db_path}
+"""
+
+
+def run_headless(tmp_path, lines):
+    (tmp_path / "input.txt").write_text("\n".join(lines) + "\n", encoding="utf-8")
+    env = dict(os.environ, HOME=str(tmp_path))
+    proc = subprocess.run(
+        [sys.executable, "-c", RUNNER, ROOT, os.path.join(ROOT, "link_monitor.py"), "--headless",
+         "--multi-instance", "--backend", "fake", "--input", "input.txt", "--config", "config.ini",
+         "--action", "uno"],
+        cwd=tmp_path, env=env, capture_output=True, text=True, timeout=60)
+    assert proc.returncode == 0, proc.stderr
+    return [json.loads(line) for line in proc.stdout.splitlines()]
+
+
+@pytest.fixture
+def config_dir(tmp_path):
+    (tmp_path / "config.ini").write_text(
+        CONFIG.format(python=sys.executable, db_path=tmp_path / "history.db"), encoding="utf-8")
+    return tmp_path
+
+
+def test_headless_runs_action_and_emits_json_lines(config_dir):
+    events = run_headless(config_dir, ["ciao", "https://uno.example/a"])
+    names = [event['event'] for event in events]
+    assert names == ["started", "detection", "queued", "start", "output", "exit", "stopped"]
+    by_name = {event['event']: event for event in events}
+    assert by_name['started']['actions'] == ["uno"]
+    assert by_name['detection']['selected'] == "uno"
+    assert by_name['output']['line'] == "scaricato https://uno.example/a"
+    assert by_name['exit']['state'] == "done"
+    assert by_name['exit']['exit_code'] == 0
+    assert all('time' in event for event in events)
+
+
+def test_headless_treats_ask_as_skip(config_dir):
+    run_headless(config_dir, ["https://uno.example/a"])
+    # Seconda esecuzione: l'esito riuscito è nella cronologia e cache1 = ask non può chiedere
+    events = run_headless(config_dir, ["https://uno.example/a", "https://uno.example/b"])
+    skipped = [event for event in events if event['event'] == 'skipped']
+    assert [(event['action'], event['url']) for event in skipped] == [("uno", "https://uno.example/a")]
+    assert [event['url'] for event in events if event['event'] == 'queued'] == ["https://uno.example/b"]
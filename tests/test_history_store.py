@@ -0,0 +1,213 @@
+import datetime
+import sqlite3
+import threading
+import pytest
+from history_store import HistoryStore
+
+
+class GatedStore(HistoryStore):
+    """Lo scrittore attende `gate` prima di ogni transazione e annota la dimensione dei blocchi."""
+    def __init__(self, *args, **kwargs):
+        self.gate = threading.Event()
+        self.batches = []
+        super().__init__(*args, **kwargs)
+
+    def _insert(self, conn, records):
+        self.gate.wait(5)
+        self.batches.append(len(records))
+        super()._insert(conn, records)
+
+
+def record(i, link=None, label="yt", exit_code=0, **extra):
+    values = dict(start_time=datetime.datetime(2024, 1, 1, 12, 0, i), link=link or f"https://example.org/{i}",
+                  action_label=label, exit_code=exit_code, duration=float(i),
+                  outcome="OK" if exit_code == 0 else f"Errore {exit_code}", output=f"output {i}\n")
+    values.update(extra)
+    return values
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = HistoryStore(str(tmp_path / "history.db"), flush_interval=0.05)
+    yield store
+    store.close()
+
+
+def test_writer_saves_in_batches(tmp_path):
+    store = GatedStore(str(tmp_path / "history.db"), batch_size=3, flush_interval=0.2)
+    try:
+        ids = [store.add(record(i)) for i in range(7)]
+        assert ids == list(range(1, 8))
+        store.gate.set()
+        store.flush()
+        # Il primo record viene preso subito, gli altri si accumulano fino a batch_size
+        assert sum(store.batches) == 7
+        assert max(store.batches) == 3
+        assert len(store.batches) < 7
+        assert store.count() == 7
+    finally:
+        store.gate.set()
+        store.close()
+
+
+def test_pending_records_are_visible_before_write(tmp_path):
+    store = GatedStore(str(tmp_path / "history.db"))
+    try:
+        record_id = store.add(record(1, output="in attesa\n"))
+        assert store.get(record_id)['output'] == "in attesa\n"
+        assert [r['id'] for r in store.recent()] == [record_id]
+        # count() conta solo i record salvati, come query()
+        assert store.count() == 0
+        assert store.query() == []
+        store.gate.set()
+        store.flush()
+        assert store.count() == 1
+        assert store.get(record_id)['start_time'] == datetime.datetime(2024, 1, 1, 12, 0, 1)
+    finally:
+        store.gate.set()
+        store.close()
+
+
+def test_invalid_record_is_dropped_alone(store, capsys):
+    # link NULL viola il vincolo NOT NULL: la transazione del blocco viene ripetuta record per record
+    invalid = record(2)
+    invalid['link'] = None
+    ids = [store.add(record(1)), store.add(invalid), store.add(record(3))]
+    store.flush()
+    assert store.get(ids[0]) is not None
+    assert store.get(ids[1]) is None
+    assert store.get(ids[2]) is not None
+    assert f"record {ids[1]}" in capsys.readouterr().err
+
+
+def test_ids_continue_after_reopen(tmp_path):
+    path = str(tmp_path / "history.db")
+    store = HistoryStore(path)
+    store.add(record(1))
+    store.add(record(2))
+    store.close()
+    store = HistoryStore(path)
+    try:
+        assert store.add(record(3)) == 3
+        store.flush()
+        assert [r['id'] for r in store.recent(2)] == [2, 3]
+    finally:
+        store.close()
+
+
+def test_query_order_and_paging(store):
+    for i in (3, 1, 2, 5, 4):
+        store.add(record(i))
+    store.flush()
+    assert [r['duration'] for r in store.query()] == [5, 4, 3, 2, 1]
+    assert [r['duration'] for r in store.query(order_by='duration', descending=False)] == [1, 2, 3, 4, 5]
+    assert [r['duration'] for r in store.query(offset=1, limit=2)] == [4, 3]
+    with pytest.raises(ValueError):
+        store.query(order_by='output')
+
+
+def test_query_and_count_filters(store):
+    store.add(record(1, link="https://youtube.com/a", label="yt"))
+    store.add(record(2, link="https://vimeo.com/b", label="vimeo", exit_code=1))
+    store.add(record(3, link="https://youtube.com/c_d", label="yt", exit_code=2))
+    store.add(record(4, link="https://youtube.com/100%", label="audio"))
+    store.flush()
+
+    def links(filters):
+        assert store.count(filters) == len(store.query(filters=filters))
+        return sorted(r['link'].rsplit('/', 1)[1] for r in store.query(filters=filters))
+
+    assert links({'link': 'youtube'}) == ["100%", "a", "c_d"]
+    assert links({'status': 'ok'}) == ["100%", "a"]
+    assert links({'status': 'error'}) == ["b", "c_d"]
+    assert links({'exit_code': 2}) == ["c_d"]
+    assert links({'link': 'youtube', 'action_label': 'yt'}) == ["a", "c_d"]
+    # % e _ sono cercati come caratteri, non come jolly di LIKE
+    assert links({'link': '_'}) == ["c_d"]
+    assert links({'link': '%'}) == ["100%"]
+    assert links({'link': '', 'status': None}) == ["100%", "a", "b", "c_d"]
+    with pytest.raises(ValueError):
+        store.query(filters={'output': 'x'})
+
+
+def test_find_success(store):
+    store.add(record(1, link="u", exit_code=0))
+    store.add(record(2, link="u", exit_code=0))
+    store.add(record(3, link="u", exit_code=1))
+    store.flush()
+    found = store.find_success("u", "yt")
+    assert found['id'] == 2
+    assert store.find_success("u", "yt", since=datetime.datetime(2024, 1, 1, 12, 0, 3).timestamp()) is None
+    assert store.find_success("u", "altra") is None
+
+
+def requires_fts(store):
+    if not store.fts:
+        pytest.skip("SQLite senza FTS5")
+
+
+def test_fts_index_is_contentless(store):
+    requires_fts(store)
+    store.add(record(1, output="HTTP Error 403: Forbidden\n"))
+    store.flush()
+    conn = store._connection()
+    # L'indice non conserva una copia del testo
+    assert conn.execute("SELECT output FROM history_fts").fetchall() == [(None,)]
+    assert [r['id'] for r in store.search("error 403")] == [1]
+
+
+def test_fts_indexes_full_log(store, tmp_path):
+    requires_fts(store)
+    log_path = tmp_path / "1.log"
+    log_path.write_text("Downloading webpage\nERROR: Unsupported URL\n" + "riga\n" * 100, encoding="utf-8")
+    # L'output salvato è solo la coda del log: l'errore è solo nel file
+    store.add(record(1, output="riga\n", log_path=str(log_path)))
+    store.add(record(2, output="tutto bene\n"))
+    store.flush()
+    assert [r['id'] for r in store.search("unsupported url")] == [1]
+    assert store.search("url unsupported") == []
+
+
+def test_fts_search_and_filters(store):
+    requires_fts(store)
+    store.add(record(1, link="https://youtube.com/a", output="ERROR: video unavailable\n", exit_code=1))
+    store.add(record(2, link="https://youtube.com/b", output="video salvato\n"))
+    store.add(record(3, link="https://vimeo.com/c", label="vimeo", output="ERROR: video unavailable\n",
+                     exit_code=1))
+    store.add(record(4, link="https://vimeo.com/d", label="vimeo", output='errore "quoted"\n', exit_code=2))
+    store.flush()
+    assert sorted(r['id'] for r in store.search("video")) == [1, 2, 3]
+    assert sorted(r['id'] for r in store.search("vimeo")) == [3, 4]
+    assert [r['id'] for r in store.search('"quoted"')] == [4]
+
+    def ids(filters):
+        assert store.count(filters) == len(store.query(filters=filters))
+        return sorted(r['id'] for r in store.query(filters=filters))
+
+    assert ids({'text': 'video unavailable'}) == [1, 3]
+    assert ids({'text': 'video unavailable', 'link': 'youtube'}) == [1]
+    assert ids({'text': 'video', 'status': 'ok'}) == [2]
+    assert ids({'text': 'unavailable', 'outcome': 'Errore'}) == [1, 3]
+    assert ids({'outcome': 'Errore 2'}) == [4]
+
+
+def test_fts_backfills_existing_rows(tmp_path):
+    path = str(tmp_path / "history.db")
+    store = HistoryStore(path)
+    requires_fts(store)
+    store.add(record(1, output="prima dell'indice\n"))
+    store.add(record(2, output="anche questa\n"))
+    store.close()
+    # Database creato da una versione senza indice full-text
+    conn = sqlite3.connect(path)
+    conn.execute("DROP TABLE history_fts")
+    conn.commit()
+    conn.close()
+    store = HistoryStore(path)
+    try:
+        store.add(record(3, output="dopo l'indice\n"))
+        store.flush()
+        assert sorted(r['id'] for r in store.search("indice")) == [1, 3]
+        assert [r['id'] for r in store.search("anche questa")] == [2]
+    finally:
+        store.close()
@@ -0,0 +1,108 @@
+import datetime
+import sys
+import pytest
+from config import LinkAction
+from history_store import HistoryStore
+from instance import HAS_UNIX_SOCKETS, InstanceClient, InstanceLock, InstanceServer
+from jobs import CANCELLED, DONE, JobScheduler
+from matcher import ActionSet
+
+pytestmark = pytest.mark.skipif(not HAS_UNIX_SOCKETS, reason="socket UNIX non disponibili")
+
+PRINT = "import sys, time; print('inizio', flush=True); time.sleep(0.3); print('fine', sys.argv[1])"
+SLEEP = 'import time; time.sleep(30)'
+
+
+def python_action(label, code):
+    return LinkAction(r"https?://\S+", f'"{sys.executable}" -c "{code}" {{url}}', label)
+
+
+def test_second_lock_fails(tmp_path):
+    path = str(tmp_path / "run" / "instance.lock")
+    first = InstanceLock(path)
+    assert first.acquire()
+    second = InstanceLock(path)
+    assert not second.acquire()
+    first.release()
+    assert second.acquire()
+    second.release()
+
+
+@pytest.fixture
+def api(tmp_path):
+    history = HistoryStore(str(tmp_path / "history.db"))
+    history.add(dict(start_time=datetime.datetime(2024, 1, 1), link="https://vecchio.example/", action_label="stampa",
+                     exit_code=0, output="salvato\n"))
+    history.flush()
+    scheduler = JobScheduler(max_workers=2)
+    actions = ActionSet([python_action("stampa", PRINT), python_action("dormi", SLEEP)])
+    texts = []
+    shown = []
+    server = InstanceServer(str(tmp_path / "instance.sock"), scheduler, lambda: actions, texts.append,
+                            history_store=history, on_show=lambda: shown.append(True))
+    server.start()
+    yield InstanceClient(server.path), texts, shown
+    server.stop()
+    scheduler.shutdown()
+    scheduler.engine.stop()
+    history.close()
+
+
+def test_ping_show_and_forwarded_text(api):
+    client, texts, shown = api
+    assert client.alive()
+    assert client.request({'cmd': 'show'}) == {'ok': True}
+    assert shown == [True]
+    response = client.request({'cmd': 'submit', 'urls': ["https://a.example/", "https://b.example/"]})
+    assert response == {'ok': True, 'forwarded': 2}
+    assert texts == ["https://a.example/\nhttps://b.example/"]
+    assert client.request({'cmd': 'nessuno'})['ok'] is False
+    assert client.request({'cmd': 'submit', 'urls': ["u"], 'action': 'ignota'})['ok'] is False
+
+
+def test_submit_stream_and_list(api):
+    client, _, _ = api
+    response = client.request({'cmd': 'submit', 'urls': "https://a.example/x", 'action': 'stampa'})
+    assert response['ok']
+    job_id = response['jobs'][0]['id']
+    listed = client.request({'cmd': 'list'})['jobs']
+    assert [job['id'] for job in listed] == [job_id]
+    messages = list(client.stream(job_id))
+    assert messages[0]['ok'] and messages[0]['job']['id'] == job_id
+    output = "".join(message['line'] for message in messages if message.get('event') == 'output')
+    assert "fine https://a.example/x" in output
+    assert messages[-1]['event'] == 'exit'
+    assert messages[-1]['job']['state'] == DONE
+    assert client.request({'cmd': 'list'})['jobs'] == []
+    assert list(client.stream(job_id)) == [{'ok': False, 'error': f"Job non trovato: {job_id}"}]
+
+
+def test_cancel(api):
+    client, _, _ = api
+    response = client.request({'cmd': 'submit', 'urls': ["https://a.example/1", "https://a.example/2",
+                                                          "https://a.example/3"], 'action': 'dormi'})
+    ids = [job['id'] for job in response['jobs']]
+    listed = client.request({'cmd': 'list'})['jobs']
+    assert sorted(job['id'] for job in listed) == sorted(ids)
+    assert [(job['id'], job['position']) for job in listed if job['state'] == 'queued'] == [(ids[2], 1)]
+    # Job in coda: annullato subito
+    assert client.request({'cmd': 'cancel', 'job_id': ids[2]}) == {'ok': True, 'cancelled': [ids[2]]}
+    assert sorted(job['id'] for job in client.request({'cmd': 'list'})['jobs']) == ids[:2]
+    # Job in esecuzione: il processo viene terminato e lo stream riceve l'uscita
+    stream = client.stream(ids[0])
+    assert next(stream)['job']['state'] == 'running'
+    assert client.request({'cmd': 'cancel', 'job_id': ids[0]}) == {'ok': True, 'cancelled': [ids[0]]}
+    assert list(stream)[-1]['job']['state'] == CANCELLED
+    assert client.request({'cmd': 'cancel', 'job_id': 999999})['ok'] is False
+    assert client.request({'cmd': 'cancel', 'all': True}) == {'ok': True, 'cancelled': [ids[1]]}
+
+
+def test_history_and_metrics(api):
+    client, _, _ = api
+    records = client.request({'cmd': 'history', 'limit': 10})['records']
+    assert [record['link'] for record in records] == ["https://vecchio.example/"]
+    assert client.request({'cmd': 'history', 'filters': {'text': 'salvato'}})['records'][0]['output'] == "salvato\n"
+    assert client.request({'cmd': 'history', 'filters': {'text': 'assente'}})['records'] == []
+    response = client.request({'cmd': 'metrics'})
+    assert response['ok']
+    assert isinstance(response['metrics'], list)
@@ -0,0 +1,95 @@
+import gzip
+import pytest
+import joblog
+from joblog import JobLog, LogReader, read_log_text
+
+LINES = [f"riga {i:03d} " + "x" * (i % 7) + "\n" for i in range(200)]
+
+
+@pytest.fixture(params=[False, True], ids=['testo', 'gzip'])
+def log_path(request, tmp_path):
+    log = JobLog.create(str(tmp_path), 1, compress=request.param, tail_lines=5)
+    for line in LINES:
+        log.write(line)
+    log.close()
+    return log.path
+
+
+def read_all(reader, page_size):
+    pages = []
+    offset = 0
+    while True:
+        text, offset = reader.read_page(offset, page_size)
+        if not text:
+            return pages
+        pages.append(text)
+
+
+def test_tail_is_bounded(tmp_path):
+    log = JobLog.create(str(tmp_path), 1, tail_lines=3)
+    for line in LINES:
+        log.write(line)
+    log.close()
+    assert log.tail_text() == "".join(LINES[-3:])
+    # Il file contiene tutto l'output
+    assert read_log_text(log.path) == "".join(LINES)
+
+
+def test_compressed_log(tmp_path):
+    log = JobLog.create(str(tmp_path), 7, compress=True)
+    log.write("compresso\n")
+    log.close()
+    assert log.path.endswith("-7.log.gz")
+    with gzip.open(log.path, 'rt', encoding='utf-8') as f:
+        assert f.read() == "compresso\n"
+
+
+def test_pages_end_at_last_newline(log_path):
+    reader = LogReader(log_path)
+    try:
+        assert reader.size() == len("".join(LINES).encode())
+        pages = read_all(reader, 100)
+        assert "".join(pages) == "".join(LINES)
+        # Ogni pagina piena finisce con una riga intera
+        assert all(page.endswith("\n") and len(page) <= 100 for page in pages)
+        assert len(pages) > len("".join(LINES)) // 100
+    finally:
+        reader.close()
+
+
+def test_line_longer_than_page_is_split(tmp_path):
+    path = tmp_path / "lungo.log"
+    path.write_text("a" * 50 + "\nfine\n", encoding="utf-8")
+    reader = LogReader(str(path))
+    # Nessun a capo nella pagina: viene restituita intera
+    assert reader.read_page(0, 20) == ("a" * 20, 20)
+    assert reader.read_page(20, 35) == ("a" * 30 + "\n", 51)
+    # Ultima pagina, più corta: niente da tagliare
+    assert reader.read_page(51, 35) == ("fine\n", 56)
+    assert reader.read_page(56, 35) == ("", 56)
+
+
+def test_gzip_stays_open_between_pages(tmp_path, monkeypatch):
+    log = JobLog.create(str(tmp_path), 1, compress=True)
+    for line in LINES:
+        log.write(line)
+    log.close()
+    opened = []
+    real_open = gzip.open
+
+    def counting_open(*args, **kwargs):
+        opened.append(args[0])
+        return real_open(*args, **kwargs)
+
+    monkeypatch.setattr(joblog.gzip, 'open', counting_open)
+    content = "".join(LINES)
+    reader = LogReader(log.path)
+    try:
+        assert "".join(read_all(reader, 64)) == content
+        assert opened == [log.path]
+        # Ritorno a una pagina precedente: stesso contenuto
+        first, offset = reader.read_page(0, 64)
+        second, end = reader.read_page(offset, 64)
+        assert first + second == content[:end]
+    finally:
+        reader.close()
@@ -0,0 +1,252 @@
+import asyncio
+import datetime
+import time
+import pytest
+import jobs
+from config import LinkAction
+from jobs import CANCELLED, DONE, PRIORITY_HIGH, PRIORITY_BATCH, QUEUED, RUNNING, Job, JobScheduler
+
+
+class FakeProcess:
+    def __init__(self, gate):
+        self.pid = 0
+        self.returncode = None
+        self._gate = gate
+
+    def terminate(self):
+        self.returncode = -15
+        self._gate.set()
+
+    kill = terminate
+
+
+class FakeRunner:
+    """Sostituisce run_command_async: ogni processo resta in esecuzione finché il test non lo fa uscire."""
+    def __init__(self):
+        self.engine = None
+        self.started = []  # (etichetta, url, prev) in ordine di avvio
+        self._gates = {}
+        self._codes = {}
+
+    async def __call__(self, action, url, on_output=None, on_start=None, log=None, job_id=None, on_progress=None,
+                       prev=None):
+        gate = asyncio.Event()
+        proc = FakeProcess(gate)
+        self._gates[(action.label, url)] = gate
+        on_start(proc)
+        self.started.append((action.label, url, prev))
+        start = datetime.datetime.now()
+        await gate.wait()
+        if proc.returncode is None:
+            proc.returncode = self._codes.pop((action.label, url), 0)
+        output = f"{action.label} {url}\nrisultato di {action.label}\n"
+        for line in output.splitlines(keepends=True):
+            on_output(line)
+        return proc.returncode, start, datetime.datetime.now(), output, None
+
+    def finish(self, label, url, exit_code=0):
+        wait_until(lambda: (label, url) in self._gates)
+
+        def release():
+            self._codes[(label, url)] = exit_code
+            self._gates.pop((label, url)).set()
+        self.engine.call_soon(release)
+
+    def labels(self):
+        return [label for label, url, prev in self.started]
+
+
+def wait_until(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise AssertionError("condizione non raggiunta")
+        time.sleep(0.005)
+
+
+@pytest.fixture
+def runner(monkeypatch):
+    runner = FakeRunner()
+    monkeypatch.setattr(jobs, 'run_command_async', runner)
+    return runner
+
+
+@pytest.fixture
+def make_scheduler(runner):
+    schedulers = []
+
+    def make(**kwargs):
+        scheduler = JobScheduler(**kwargs)
+        runner.engine = scheduler.engine
+        schedulers.append(scheduler)
+        return scheduler
+
+    yield make
+    for scheduler in schedulers:
+        scheduler.shutdown()
+        wait_until(lambda: not scheduler.running_jobs())
+        scheduler.engine.stop()
+
+
+def action(label, program="prog {url}", **kwargs):
+    return LinkAction(r".*", program, label, **kwargs)
+
+
+def test_global_limit(runner, make_scheduler):
+    scheduler = make_scheduler(max_workers=2)
+    a = action("a")
+    submitted = scheduler.submit_many([Job(a, f"u{i}") for i in range(4)])
+    wait_until(lambda: len(runner.started) == 2)
+    assert [job.state for job in submitted] == [RUNNING, RUNNING, QUEUED, QUEUED]
+    runner.finish("a", "u0")
+    wait_until(lambda: len(runner.started) == 3)
+    assert submitted[0].state == DONE
+    assert submitted[2].state == RUNNING
+    assert len(scheduler.running_jobs()) == 2
+
+
+def test_program_limits(runner, make_scheduler):
+    scheduler = make_scheduler(max_workers=3, program_limits={'slow': 1})
+    slow = action("slow", program_key='slow')
+    fast = action("fast", program_key='fast')
+    scheduler.submit_many([Job(slow, "s1"), Job(slow, "s2"), Job(fast, "f1"), Job(fast, "f2")])
+    # Un solo 'slow' alla volta: 's2' viene scavalcato dai job di 'fast'
+    wait_until(lambda: len(runner.started) == 3)
+    assert [(label, url) for label, url, prev in runner.started] == [("slow", "s1"), ("fast", "f1"), ("fast", "f2")]
+    assert [job.url for job in scheduler.queued_jobs()] == ["s2"]
+    runner.finish("fast", "f1")
+    time.sleep(0.05)
+    assert len(runner.started) == 3
+    runner.finish("slow", "s1")
+    wait_until(lambda: len(runner.started) == 4)
+    assert runner.started[-1][:2] == ("slow", "s2")
+
+
+def test_pool_shares_limit(runner, make_scheduler):
+    scheduler = make_scheduler(max_workers=3, program_limits={'rete': 1})
+    one = action("one", program_key='one', pool='rete')
+    two = action("two", program_key='two', pool='rete')
+    scheduler.submit_many([Job(one, "u"), Job(two, "u")])
+    wait_until(lambda: len(runner.started) == 1)
+    time.sleep(0.05)
+    assert runner.labels() == ["one"]
+
+
+def test_priority_then_fifo(runner, make_scheduler):
+    scheduler = make_scheduler(max_workers=1)
+    a = action("a")
+    first = scheduler.submit(Job(a, "first"))
+    wait_until(lambda: first.state == RUNNING)
+    scheduler.submit_many([Job(a, "batch", priority=PRIORITY_BATCH), Job(a, "n1"), Job(a, "n2"),
+                           Job(a, "high", priority=PRIORITY_HIGH)])
+    assert [job.url for job in scheduler.queued_jobs()] == ["high", "n1", "n2", "batch"]
+    for url in ["first", "high", "n1", "n2"]:
+        runner.finish("a", url)
+    wait_until(lambda: len(runner.started) == 5)
+    assert [url for label, url, prev in runner.started] == ["first", "high", "n1", "n2", "batch"]
+
+
+def test_queue_position(runner, make_scheduler):
+    scheduler = make_scheduler(max_workers=1)
+    a = action("a")
+    positions = []
+    running = scheduler.submit(Job(a, "r"))
+    second = Job(a, "q1")
+    third = Job(a, "q2", on_queue_position=lambda job, pos: positions.append((job.url, pos)))
+    scheduler.submit_many([second, third])
+    assert scheduler.queue_position(running) is None
+    assert scheduler.queue_position(second) == 1
+    assert scheduler.queue_position(third) == 2
+    assert positions[-1] == ("q2", 2)
+    runner.finish("a", "r")
+    wait_until(lambda: second.state == RUNNING)
+    wait_until(lambda: positions[-1] == ("q2", 1))
+    assert scheduler.queue_position(third) == 1
+
+
+def test_cancel_queued(runner, make_scheduler):
+    scheduler = make_scheduler(max_workers=1)
+    a = action("a")
+    exits = []
+    scheduler.submit(Job(a, "r"))
+    queued = scheduler.submit(Job(a, "q", on_exit=exits.append))
+    scheduler.cancel(queued)
+    assert queued.state == CANCELLED
+    assert exits == [queued]
+    assert scheduler.queued_jobs() == []
+    # L'url annullato può essere accodato di nuovo
+    again = scheduler.submit(Job(a, "q"))
+    assert again is not queued
+
+
+def test_cancel_running(runner, make_scheduler):
+    scheduler = make_scheduler(max_workers=1)
+    a = action("a")
+    exits = []
+    job = scheduler.submit(Job(a, "r", on_exit=exits.append))
+    nxt = scheduler.submit(Job(a, "n"))
+    wait_until(lambda: job.proc is not None)
+    scheduler.cancel(job)
+    wait_until(lambda: exits)
+    assert job.state == CANCELLED
+    assert job.exit_code == -15
+    wait_until(lambda: nxt.state == RUNNING)
+
+
+def test_duplicate_key_is_merged(runner, make_scheduler):
+    scheduler = make_scheduler(max_workers=1)
+    a = action("a")
+    exits = []
+    starts = []
+    first = scheduler.submit(Job(a, "u", on_exit=lambda job: exits.append("primo")))
+    wait_until(lambda: first.state == RUNNING)
+    duplicate = Job(a, "u", on_exit=lambda job: exits.append("doppione"), on_start=starts.append)
+    assert scheduler.submit(duplicate) is first
+    # Il listener unito riceve subito lo stato del job in corso
+    assert starts == [first]
+    # Stesso url con un'altra azione: job distinto
+    other = scheduler.submit(Job(action("b"), "u"))
+    assert other is not first
+    runner.finish("a", "u")
+    wait_until(lambda: len(exits) == 2)
+    assert sorted(exits) == ["doppione", "primo"]
+    assert runner.labels().count("a") == 1
+
+
+def pipeline():
+    second = action("converti", program="conv {prev}", pool='cpu')
+    return action("scarica", pool='rete', stages=[second])
+
+
+def test_pipeline_passes_prev_and_overlaps_stages(runner, make_scheduler):
+    scheduler = make_scheduler(max_workers=2, program_limits={'rete': 1, 'cpu': 1})
+    p = pipeline()
+    exits = []
+    first, second = scheduler.submit_many([Job(p, "u1", on_exit=exits.append), Job(p, "u2", on_exit=exits.append)])
+    wait_until(lambda: len(runner.started) == 1)
+    runner.finish("scarica", "u1")
+    # La fase 2 di u1 e la fase 1 di u2 girano insieme: pool diversi
+    wait_until(lambda: len(runner.started) == 3)
+    assert sorted(runner.started[1:]) == [("converti", "u1", "risultato di scarica"), ("scarica", "u2", None)]
+    assert first.stage == 1 and first.state == RUNNING
+    assert exits == []
+    runner.finish("converti", "u1")
+    wait_until(lambda: exits == [first])
+    assert first.state == DONE
+    assert first.outcome == "OK"
+    runner.finish("scarica", "u2")
+    runner.finish("converti", "u2")
+    wait_until(lambda: exits == [first, second])
+
+
+def test_pipeline_stops_on_failed_stage(runner, make_scheduler):
+    scheduler = make_scheduler(max_workers=2)
+    exits = []
+    job = scheduler.submit(Job(pipeline(), "u", on_exit=exits.append))
+    runner.finish("scarica", "u", exit_code=1)
+    wait_until(lambda: exits == [job])
+    assert job.state == DONE
+    assert job.exit_code == 1
+    assert job.outcome == "Errore 1 (fase 1/2: scarica)"
+    time.sleep(0.05)
+    assert runner.labels() == ["scarica"]
@@ -0,0 +1,87 @@
+import re
+from config import LinkAction
+from matcher import LinkMatcher, required_literal
+from metrics import MATCH_SECONDS
+
+YT = r"https?://.*youtube\.com/watch.*"
+VIMEO = r"https?://(www\.)?vimeo\.com/\d+"
+
+
+def make_actions():
+    filters = {'yt': (re.compile(r"(&list.*)"), "")}
+    return [
+        LinkAction(YT, "tool a {url}", "audio", 'yt', filters),
+        LinkAction(VIMEO, "tool v {url}", "vimeo"),
+        LinkAction(YT, "tool b {url}", "video", 'yt', filters),
+    ]
+
+
+def test_required_literal():
+    assert required_literal(re.compile(YT)) == "youtube.com/watch"
+    assert required_literal(re.compile(r"(?i)youtube")) == ""
+    assert required_literal(re.compile(r"a|b")) == ""
+
+
+def test_duplicate_patterns_are_evaluated_once():
+    matcher = LinkMatcher(make_actions())
+    assert matcher.pattern_count == 2
+
+
+def test_match_keeps_configuration_order():
+    actions = make_actions()
+    matcher = LinkMatcher(actions)
+    assert matcher.match("https://www.youtube.com/watch?v=1") == [actions[0], actions[2]]
+    assert matcher.match("https://vimeo.com/42") == [actions[1]]
+    assert matcher.match("nothing here") == []
+
+
+def test_prefilter_skips_patterns_without_literal():
+    matcher = LinkMatcher(make_actions())
+    assert matcher.candidates("https://example.com") == []
+    assert len(matcher.candidates("https://www.youtube.com/watch?v=1")) == 1
+
+
+def test_prefilter_finds_overlapping_literals():
+    actions = [LinkAction(r"https?://\S*abcd\S*", "a {url}", "abcd"),
+               LinkAction(r"https?://\S*cdef\S*", "b {url}", "cdef"),
+               LinkAction(r"https?://\S*bc\S*", "c {url}", "bc"),
+               LinkAction(r"\S*", "d {url}", "sempre")]
+    matcher = LinkMatcher(actions)
+    # 'cdef' inizia dentro 'abcd' e 'bc' vi è contenuto: vanno trovati tutti
+    assert matcher.match("https://x/abcdef") == actions
+    assert matcher.match("https://x/abcd") == [actions[0], actions[2], actions[3]]
+    assert matcher.match("https://x/cdef") == [actions[1], actions[3]]
+    assert matcher.match("https://x/") == [actions[3]]
+
+
+def evaluations(pattern):
+    """Valutazioni della regex registrate nella metrica delle regole."""
+    return sum(count for key, (_, _, count) in MATCH_SECONDS.samples() if key == (pattern,))
+
+
+def test_results_are_cached_by_digest():
+    actions = make_actions()
+    matcher = LinkMatcher(actions, cache_size=2)
+    url = "https://www.youtube.com/watch?v=1"
+    before = evaluations(YT)
+    first = matcher.match(url)
+    first.clear()
+    assert matcher.match(url) == [actions[0], actions[2]]
+    assert evaluations(YT) == before + 1
+    # Oltre cache_size le voci più vecchie vengono scartate
+    matcher.match("https://www.youtube.com/watch?v=2")
+    matcher.match("https://www.youtube.com/watch?v=3")
+    matcher.match(url)
+    assert evaluations(YT) == before + 4
+
+
+def test_extract_links_filters_and_deduplicates():
+    actions = make_actions()
+    matcher = LinkMatcher(actions)
+    text = ("https://www.youtube.com/watch?v=1&list=x\n"
+            "<https://www.youtube.com/watch?v=1&list=y>, https://vimeo.com/7;\n"
+            "https://www.youtube.com/watch?v=2")
+    links = matcher.extract_links(text)
+    assert list(links) == [actions[0], actions[2], actions[1]]
+    assert links[actions[0]] == ["https://www.youtube.com/watch?v=1", "https://www.youtube.com/watch?v=2"]
+    assert links[actions[1]] == ["https://vimeo.com/7"]
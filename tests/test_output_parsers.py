@@ -0,0 +1,82 @@
+from output_parsers import (OutputParser, Progress, RawParser, YtDlpParser, FfmpegParser, parser_for,
+                            read_text)
+import io
+
+
+def feed_all(parser, chunks):
+    items = []
+    for chunk in chunks:
+        items.extend(parser.feed_text(chunk))
+    items.extend(parser.finish())
+    return items
+
+
+def lines(items):
+    return [item for item in items if isinstance(item, str)]
+
+
+def test_plain_lines():
+    assert feed_all(OutputParser(), ["a\nb", "\nc"]) == ["a\n", "b\n", "c\n"]
+
+
+def test_carriage_return_progress_collapses_to_final_state():
+    items = feed_all(OutputParser(), ["start\n", " 10%\r 55%\r", "100%\r\n", "done\n"])
+    progress = [item for item in items if isinstance(item, Progress)]
+    assert [p.percent for p in progress] == [10.0, 55.0]
+    assert lines(items) == ["start\n", "100%\n", "done\n"]
+
+
+def test_crlf_split_across_reads():
+    assert lines(feed_all(OutputParser(), ["one\r", "\ntwo\r\n"])) == ["one\n", "two\n"]
+    assert feed_all(RawParser(), ["one\r", "\ntwo\r\n"]) == ["one\n", "two\n"]
+
+
+def test_message_after_progress_replaces_it():
+    # Riga scritta sopra quella di avanzamento, come in un terminale
+    assert lines(feed_all(OutputParser(), ["50%\r", "errore\n"])) == ["errore\n"]
+
+
+def test_final_state_committed_at_finish():
+    items = feed_all(OutputParser(), ["12%\r", "99%\r"])
+    assert lines(items) == ["99%\n"]
+
+
+def test_unterminated_last_line():
+    assert feed_all(OutputParser(), ["a\nlast"]) == ["a\n", "last\n"]
+
+
+def test_raw_parser_keeps_every_update():
+    assert feed_all(RawParser(), ["1%\r2%\r", "done\n"]) == ["1%\n", "2%\n", "done\n"]
+
+
+def test_ytdlp_progress_lines():
+    parser = YtDlpParser()
+    items = feed_all(parser, [
+        "[youtube] abc: Downloading webpage\n",
+        "[download]  42.3% of ~ 10.00MiB at 3.10MiB/s ETA 00:02\n",
+        "[download] 100% of 10.00MiB in 00:03\n",
+        "[ExtractAudio] Destination: a.mp3\n",
+    ])
+    progress = [item for item in items if isinstance(item, Progress)]
+    assert [(p.percent, p.speed, p.eta) for p in progress] == [(42.3, '3.10MiB/s', '00:02'), (100.0, None, None)]
+    assert lines(items) == ["[youtube] abc: Downloading webpage\n",
+                            "[download] 100% of 10.00MiB in 00:03\n",
+                            "[ExtractAudio] Destination: a.mp3\n"]
+
+
+def test_ffmpeg_speed():
+    items = feed_all(FfmpegParser(), ["frame= 10 time=00:00:01.00 bitrate=1k speed=3.9x\r"])
+    assert items[0].speed == '3.9x'
+
+
+def test_parser_for_executable():
+    assert isinstance(parser_for('auto', r'C:\Tools\yt-dlp.exe'), YtDlpParser)
+    assert isinstance(parser_for('auto', '/usr/bin/ffmpeg'), FfmpegParser)
+    assert type(parser_for('auto', 'ls')) is OutputParser
+    assert isinstance(parser_for('raw', 'yt-dlp'), RawParser)
+
+
+def test_read_text_decodes_split_characters():
+    data = "città\n".encode('utf-8')
+    stream = io.BytesIO(data)
+    assert "".join(read_text(stream, 'utf-8', chunk_size=4)) == "città\n"
@@ -0,0 +1,162 @@
+import re
+import threading
+import pytest
+import regex_cost
+from regex_cost import FILTER, RULE, PatternGuard, needs_whole_text, profile_pattern, risky_constructs
+
+
+@pytest.mark.parametrize('pattern, expected', [
+    (r'(a+)+$', 'quantificatore annidato'),
+    (r'(\w+\s?)*$', 'quantificatore annidato'),
+    (r'(a|ab)*c', 'alternativa dentro una ripetizione'),
+    (r'.*a.*b.*c', '3 ripetizioni illimitate'),
+    (r'(a)\1', 'riferimento a un gruppo'),
+])
+def test_risky_constructs(pattern, expected):
+    assert any(risk.startswith(expected) for risk in risky_constructs(re.compile(pattern)))
+
+
+@pytest.mark.parametrize('pattern', [r'https?://(www\.)?vimeo\.com/\d+', r'(&list.*)', r'a{2,5}b'])
+def test_safe_patterns_have_no_risks(pattern):
+    assert risky_constructs(re.compile(pattern)) == []
+
+
+def test_needs_whole_text():
+    assert needs_whole_text(re.compile(r'a+$'))
+    assert needs_whole_text(re.compile(r'a\Z'))
+    assert needs_whole_text(re.compile(r'a(?=b)'))
+    assert not needs_whole_text(re.compile(r'https?://.*youtube\.com/watch.*'))
+
+
+def test_profile_linear_pattern_is_not_limited():
+    # Budget alto: il risultato non dipende dalla velocità della macchina
+    profile = profile_pattern(re.compile(r'(&list.*)'), FILTER, budget=10, max_chars=4096, profile_chars=4096)
+    assert profile.risks == []
+    assert profile.tested_chars == 4096
+    assert profile.safe_chars is None
+
+
+def test_profile_exponential_pattern():
+    profile = profile_pattern(re.compile(r'(a+)+$'), RULE, budget=10, max_chars=16, profile_chars=16)
+    assert any(risk.startswith('quantificatore annidato') for risk in profile.risks)
+    assert profile.tested_chars == 16
+
+
+def test_profile_limits_window_to_budget(monkeypatch):
+    # Tempi simulati: raddoppiano ogni 2 caratteri
+    monkeypatch.setattr(regex_cost, '_worst_time', lambda operation, texts: 1e-6 * 2 ** (len(texts[0]) / 2))
+    profile = profile_pattern(re.compile(r'(a+)+$'), RULE, budget=0.005, max_chars=65536)
+    assert profile.worst_seconds > 0.005
+    assert profile.safe_chars is not None and profile.safe_chars < profile.tested_chars < 40
+    assert 1e-6 * 2 ** (profile.safe_chars / 2) <= 0.005
+
+
+def make_guard(pattern=r'(a+)+$', budget=0.01, strikes=3, quarantine=60):
+    guard = PatternGuard(re.compile(pattern), RULE)
+    guard.budget = budget
+    guard.strikes = strikes
+    guard.quarantine = quarantine
+    return guard
+
+
+def test_single_slow_sample_does_not_quarantine():
+    guard = make_guard()
+    guard.record(1.0)
+    assert not guard.quarantined
+    for _ in range(regex_cost.STRIKE_WINDOW):
+        guard.record(0.0)
+    guard.record(1.0)
+    guard.record(1.0)
+    assert not guard.quarantined
+
+
+def test_repeated_violations_quarantine(capsys):
+    guard = make_guard()
+    for _ in range(3):
+        guard.record(1.0)
+    assert guard.quarantined
+    assert guard.window("aaaa") is None
+    # Il messaggio va su stderr: stdout è lo stream JSON di --headless
+    captured = capsys.readouterr()
+    assert captured.out == "" and "sospesa" in captured.err
+
+
+def test_quarantine_expires(monkeypatch):
+    guard = make_guard(strikes=1, quarantine=10)
+    now = [1000.0]
+    monkeypatch.setattr(regex_cost.time, 'monotonic', lambda: now[0])
+    guard.record(1.0)
+    assert guard.window("aaaa") is None
+    now[0] += 11
+    assert guard.window("aaaa") == 4
+
+
+def test_zero_quarantine_lasts_until_reload():
+    guard = make_guard(strikes=1, quarantine=0)
+    guard.record(1.0)
+    assert guard.quarantined and guard.quarantined_until == float('inf')
+
+
+def test_window_truncates_or_skips_long_text():
+    guard = make_guard(pattern=r'x+y')
+    guard.max_chars = 5
+    assert guard.window("abc") == 3
+    assert guard.window("a" * 10) == 5
+    anchored = make_guard(pattern=r'x+$')
+    anchored.max_chars = 5
+    assert anchored.window("a" * 10) is None
+
+
+def test_sub_within_budget_and_suspended():
+    pattern = re.compile(r'(&list.*)')
+    guard = PatternGuard(pattern, FILTER)
+    assert guard.sub(pattern, "", "u?v=1&list=2") == "u?v=1"
+    # Oltre la finestra il filtro non viene applicato
+    guard.max_chars = 5
+    assert guard.sub(pattern, "", "u?v=1&list=2") == "u?v=1&list=2"
+    guard.max_chars = None
+    guard.strikes = 1
+    guard.budget = 0.0
+    guard.record(1.0)
+    assert guard.sub(pattern, "", "u?v=1&list=2") == "u?v=1&list=2"
+
+
+def test_apply_settings_reuses_profile():
+    pattern = re.compile(r'q+r')
+    settings = dict(regex_cost.DEFAULT_REGEX_SETTINGS, budget_ms=20, strikes=2, profile_chars=256)
+    guard = regex_cost.apply_settings(pattern, RULE, settings, 1024)
+    assert regex_cost.wait_for_profiles(10)
+    profile = guard.profile
+    assert profile.tested_chars == 256
+    assert guard.budget == 0.02 and guard.strikes == 2
+    assert regex_cost.apply_settings(pattern, RULE, settings, 1024).profile is profile
+    assert not guard.profiling
+    settings['profile'] = False
+    assert regex_cost.apply_settings(pattern, RULE, settings, 1024).profile is None
+
+
+def test_apply_settings_profiles_in_background(monkeypatch):
+    gate = threading.Event()
+    calls = []
+
+    def slow_profile(compiled, kind, budget, max_chars, profile_chars):
+        calls.append(max_chars)
+        gate.wait(5)
+        return regex_cost.RegexProfile([], 0.0, profile_chars, None, max_chars // 2)
+
+    monkeypatch.setattr(regex_cost, 'profile_pattern', slow_profile)
+    pattern = re.compile(r'sfondo\d+')
+    settings = dict(regex_cost.DEFAULT_REGEX_SETTINGS, profile_chars=64)
+    try:
+        # Ritorna subito: la regex resta senza limite finché la misura non finisce
+        guard = regex_cost.apply_settings(pattern, RULE, settings, 1000)
+        assert guard.profiling and guard.profile is None and guard.max_chars is None
+        # Richieste successive: vale l'ultima
+        regex_cost.apply_settings(pattern, RULE, settings, 2000)
+        regex_cost.apply_settings(pattern, RULE, settings, 4000)
+    finally:
+        gate.set()
+    assert regex_cost.wait_for_profiles(10)
+    assert not guard.profiling
+    assert guard.max_chars == 2000
+    assert calls[-1] == 4000 and 2000 not in calls
@@ -0,0 +1,65 @@
+import asyncio
+import os
+import sys
+import pytest
+import engine
+from config import LinkAction
+from jobs import run_command_async
+from resources import ResourceLimits, parse_size
+
+posix_only = pytest.mark.skipif(not hasattr(os, 'setpriority'), reason="solo sistemi POSIX")
+# Il figlio stampa nice, limite di file aperti e limite CPU visti appena partito
+SHOW_LIMITS = ("import os, resource; print(os.getpriority(os.PRIO_PROCESS, 0), "
+               "resource.getrlimit(resource.RLIMIT_NOFILE)[0], resource.getrlimit(resource.RLIMIT_CPU)[0])")
+
+
+def run_action(code, limits):
+    action = LinkAction(r".*", f'"{sys.executable}" -c "{code}"', "prova", limits=limits)
+    exit_code, _, _, output, usage = asyncio.run(run_command_async(action, "u"))
+    return exit_code, output, usage
+
+
+def test_parse_limits():
+    limits = ResourceLimits("5", "best-effort:2", "as=2G, nofile=64", "30")
+    assert limits.nice == 5
+    assert limits.ionice == (2, 2)
+    assert limits.rlimits == {'as': 2 * 1024 ** 3, 'nofile': 64}
+    assert limits.timeout == 30
+    assert parse_size("512k") == 512 * 1024
+    assert not ResourceLimits()
+    assert ResourceLimits().preexec() is None
+
+
+@posix_only
+def test_limits_are_applied_before_exec():
+    nice = min(os.getpriority(os.PRIO_PROCESS, 0) + 3, 19)
+    exit_code, output, _ = run_action(SHOW_LIMITS, ResourceLimits(str(nice), None, "nofile=64, cpu=100"))
+    assert exit_code == 0
+    assert output.split() == [str(nice), "64", "100"]
+
+
+@posix_only
+def test_refused_limit_does_not_block_start(monkeypatch):
+    def refuse(which, who, value):
+        raise PermissionError(1, "Operation not permitted")
+
+    # preexec_fn gira nel figlio creato con fork, che vede la sostituzione
+    monkeypatch.setattr(os, 'setpriority', refuse)
+    exit_code, output, _ = run_action(SHOW_LIMITS, ResourceLimits("-20", None, "nofile=64"))
+    assert exit_code == 0
+    assert "[link_monitor] Limite non applicato: nice -20" in output
+    assert output.splitlines()[-1].split()[1] == "64"
+
+
+@pytest.mark.skipif(not engine.PIDFD_SUPPORTED or not os.path.exists("/proc/self/status"),
+                    reason="serve Linux con pidfd")
+def test_max_rss_excludes_inherited_peak():
+    # Picco sotto quello di questo processo: ereditato, non misurabile
+    _, _, usage = run_action("pass", ResourceLimits())
+    assert usage['max_rss'] is None
+    with open("/proc/self/status") as fh:
+        peak = next(int(line.split()[1]) * 1024 for line in fh if line.startswith('VmHWM:'))
+    size = peak + 64 * 1024 ** 2
+    _, _, usage = run_action(f"data = bytearray({size}); data[::4096] = bytes(len(data[::4096]))",
+                             ResourceLimits())
+    assert usage['max_rss'] >= size
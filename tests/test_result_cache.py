@@ -0,0 +1,107 @@
+import configparser
+import datetime
+import time
+import pytest
+from config import LinkAction, load_cache_settings, load_config
+from history_store import HistoryStore
+from result_cache import ASK, FORCE, SKIP, ResultCache
+
+
+def action(label="yt", cache_policy=SKIP):
+    return LinkAction(r".*", "prog {url}", label, cache_policy=cache_policy)
+
+
+def test_put_and_get():
+    cache = ResultCache()
+    a = action()
+    assert cache.get(a, "u") is None
+    start = datetime.datetime(2030, 1, 1, 12, 0)
+    cache.put(a, "u", start, record_id=7)
+    hit = cache.get(a, "u")
+    assert hit['start_time'] == start
+    assert hit['record_id'] == 7
+    # La chiave è (etichetta dell'azione, url)
+    assert cache.get(action("altra"), "u") is None
+    cache.invalidate(a, "u")
+    assert cache.get(a, "u") is None
+
+
+def test_ttl():
+    cache = ResultCache(ttl=60)
+    a = action()
+    cache.put(a, "old", time.time() - 120)
+    cache.put(a, "new", time.time() - 30)
+    assert cache.get(a, "old") is None
+    assert cache.get(a, "new") is not None
+    # ttl = 0: le esecuzioni riuscite non scadono mai
+    cache = ResultCache(ttl=0)
+    cache.put(a, "old", time.time() - 10 ** 8)
+    assert cache.get(a, "old") is not None
+
+
+def test_lru_eviction():
+    cache = ResultCache(max_entries=2)
+    a = action()
+    cache.put(a, "u1")
+    cache.put(a, "u2")
+    # u1 usato di recente: viene scartato u2
+    assert cache.get(a, "u1") is not None
+    cache.put(a, "u3")
+    assert cache.get(a, "u2") is None
+    assert cache.get(a, "u1") is not None
+    assert cache.get(a, "u3") is not None
+
+
+def test_falls_back_to_history(tmp_path):
+    store = HistoryStore(str(tmp_path / "history.db"))
+    try:
+        now = datetime.datetime.now().replace(microsecond=0)
+        store.add(dict(start_time=now, link="u", action_label="yt", exit_code=0))
+        store.add(dict(start_time=now, link="failed", action_label="yt", exit_code=1))
+        store.add(dict(start_time=now - datetime.timedelta(hours=2), link="old", action_label="yt", exit_code=0))
+        store.flush()
+        cache = ResultCache(ttl=3600, history_store=store)
+        a = action()
+        hit = cache.get(a, "u")
+        assert hit['start_time'] == now
+        assert hit['record_id'] == 1
+        assert cache.get(a, "failed") is None
+        assert cache.get(a, "old") is None
+        assert cache.get(action("altra"), "u") is None
+        # La voce trovata nella cronologia resta in memoria
+        store.close()
+        store = None
+        assert cache.get(a, "u")['record_id'] == 1
+    finally:
+        if store is not None:
+            store.close()
+
+
+@pytest.mark.parametrize('policy, skipped', [(SKIP, True), (ASK, True), (FORCE, False)])
+def test_previous_follows_policy(policy, skipped):
+    cache = ResultCache()
+    a = action(cache_policy=policy)
+    cache.put(a, "u")
+    assert (cache.previous(a, "u") is not None) == skipped
+    assert cache.previous(a, "altro") is None
+
+
+def config_with(cache=None, **links):
+    config = configparser.ConfigParser()
+    config['LINKS'] = dict({'regex1': r'a\d', 'program1': 'prog {url}', 'label1': 'uno',
+                            'regex2': r'b\d', 'program2': 'prog {url}', 'label2': 'due'}, **links)
+    if cache is not None:
+        config['CACHE'] = cache
+    return config
+
+
+def test_policy_settings():
+    assert load_cache_settings(config_with())['default_policy'] == FORCE
+    assert load_cache_settings(config_with({'default_policy': 'ASK'}))['default_policy'] == ASK
+    assert load_cache_settings(config_with({'default_policy': 'sempre'}))['default_policy'] == FORCE
+
+    actions = load_config(config_with({'default_policy': 'skip'}, cache2='ask'))
+    assert [a.cache_policy for a in actions] == [SKIP, ASK]
+    # Un valore non valido di cacheN ripiega sulla politica di default
+    actions = load_config(config_with(cache1='forse'))
+    assert [a.cache_policy for a in actions] == [FORCE, FORCE]
@@ -0,0 +1,149 @@
+import datetime
+import json
+import os
+import threading
+import time
+from collections import deque
+
+
+def default_trace_dir():
+    return os.path.join(os.path.expanduser("~"), ".link_monitor", "traces")
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    def __init__(self, tracer, name, cat, args):
+        self.tracer = tracer
+        self.name = name
+        self.cat = cat
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer.complete(self.name, self.start, cat=self.cat, **self.args)
+        return False
+
+
+class Tracer:
+    """
+    Tracciamento opzionale della pipeline (clipboard → match → tab → processo)
+    nel formato "trace event" di Chrome, apribile con chrome://tracing o
+    https://ui.perfetto.dev.
+
+    Da spento ogni chiamata si ferma al controllo di `enabled`. Da acceso gli
+    eventi vengono solo accodati: un thread li scrive sul file della
+    sessione ogni `flush_interval` secondi. Il file è un array JSON scritto
+    in streaming, leggibile anche se il programma termina senza chiuderlo.
+    """
+    def __init__(self):
+        self.enabled = False
+        self.path = None
+        self._events = deque()
+        self._threads = set()
+        self._pid = os.getpid()
+        self._t0 = time.perf_counter()
+        self._fh = None
+        self._first = True
+        self._stop_event = threading.Event()
+        self._writer = None
+
+    def start(self, trace_dir=None, path=None, flush_interval=1.0):
+        """Apre il file della sessione e attiva il tracciamento; ritorna il percorso."""
+        if path is None:
+            trace_dir = trace_dir or default_trace_dir()
+            os.makedirs(trace_dir, exist_ok=True)
+            stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+            path = os.path.join(trace_dir, f"trace-{stamp}-{os.getpid()}.json")
+        self.path = path
+        self._fh = open(path, 'w', encoding='utf-8')
+        self._fh.write("[")
+        self._first = True
+        self._stop_event.clear()
+        self._events.append({'name': 'process_name', 'ph': 'M', 'pid': self._pid, 'tid': 0,
+                             'args': {'name': 'link_monitor'}})
+        self.enabled = True
+        self._writer = threading.Thread(target=self._write_loop, args=(flush_interval,), daemon=True)
+        self._writer.start()
+        return path
+
+    def stop(self):
+        if not self.enabled:
+            return
+        self.enabled = False
+        self._stop_event.set()
+        self._writer.join()
+        self._flush()
+        self._fh.write("\n]\n")
+        self._fh.close()
+        self._fh = None
+
+    # --- registrazione -----------------------------------------------------
+
+    def _ts(self, t):
+        return round((t - self._t0) * 1e6, 3)
+
+    def _append(self, event):
+        tid = threading.get_ident()
+        if tid not in self._threads:
+            self._threads.add(tid)
+            self._events.append({'name': 'thread_name', 'ph': 'M', 'pid': self._pid, 'tid': tid,
+                                 'args': {'name': threading.current_thread().name}})
+        event['pid'] = self._pid
+        event['tid'] = tid
+        self._events.append(event)
+
+    def complete(self, name, start, end=None, cat='pipeline', **args):
+        """Span già misurato: `start` ed `end` sono valori di time.perf_counter()."""
+        if not self.enabled:
+            return
+        if end is None:
+            end = time.perf_counter()
+        self._append({'name': name, 'cat': cat, 'ph': 'X', 'ts': self._ts(start),
+                      'dur': round((end - start) * 1e6, 3), 'args': args})
+
+    def instant(self, name, cat='pipeline', **args):
+        if not self.enabled:
+            return
+        self._append({'name': name, 'cat': cat, 'ph': 'i', 's': 't', 'ts': self._ts(time.perf_counter()),
+                      'args': args})
+
+    def span(self, name, cat='pipeline', **args):
+        """Context manager che registra la durata del blocco."""
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, cat, args)
+
+    # --- scrittura ---------------------------------------------------------
+
+    def _flush(self):
+        parts = []
+        while self._events:
+            event = self._events.popleft()
+            parts.append(("\n" if self._first else ",\n") + json.dumps(event, ensure_ascii=False, default=str))
+            self._first = False
+        if parts:
+            self._fh.write("".join(parts))
+            self._fh.flush()
+
+    def _write_loop(self, flush_interval):
+        while not self._stop_event.wait(flush_interval):
+            try:
+                self._flush()
+            except (OSError, ValueError):
+                return
+
+
+TRACER = Tracer()
@@ -0,0 +1,60 @@
+import queue
+import sys
+import threading
+import tkinter as tk
+
+
+class UiChannel:
+    """
+    Unico canale thread-safe verso Tk per gli eventi dei job e del monitor:
+    post(func, *args) si può chiamare da qualunque thread, le chiamate
+    vengono eseguite in ordine dal thread di Tk. Le chiamate che arrivano
+    mentre ce ne sono già in attesa vengono raggruppate: un solo after(0)
+    per ogni blocco, invece di uno per evento.
+
+    Se after() fallisce (es. "main thread is not in main loop" prima che
+    parta mainloop) le chiamate restano in coda: le consegna la post()
+    successiva o il drain programmato all'avvio di mainloop. Il canale si
+    chiude solo con close(), alla fine di mainloop.
+    """
+    def __init__(self, root):
+        self.root = root
+        self._queue = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._armed = False
+        self._closed = False
+        # Dal thread di Tk: consegna quanto arrivato prima di mainloop
+        root.after_idle(self._drain)
+
+    def post(self, func, *args):
+        self._queue.put((func, args))
+        with self._lock:
+            if self._armed or self._closed:
+                return
+            self._armed = True
+        try:
+            self.root.after(0, self._drain)
+        except (RuntimeError, tk.TclError):
+            # Tk non ancora pronto o in chiusura: la prossima post riprova
+            with self._lock:
+                self._armed = False
+
+    def close(self):
+        """Fine di mainloop: le chiamate successive non vengono più consegnate."""
+        with self._lock:
+            self._closed = True
+
+    def _drain(self):
+        with self._lock:
+            self._armed = False
+        # Solo le chiamate già in coda: quelle nuove riarmano il canale e
+        # lasciano spazio agli eventi di Tk
+        for _ in range(self._queue.qsize()):
+            try:
+                func, args = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                func(*args)
+            except Exception:
+                self.root.report_callback_exception(*sys.exc_info())